@@ -1,9 +1,10 @@
 from __future__ import print_function
+import array
 import math
+import os
+import struct
 import sys
 
-import statistics   # Python 3.4+, or backport on Python 2.7
-
 
 __version__ = '0.4'
 _PY3 = (sys.version_info >= (3,))
@@ -27,6 +28,52 @@ def _import_subprocess():
 subprocess = None
 
 
+def _import_statistics():
+    """Import statistics module on demand.
+
+    statistics (Python 3.4+, or backport on Python 2.7) is slow to import:
+    it is not needed to run samples in a worker process.
+    """
+    global statistics
+    if statistics is None:
+        import statistics
+    return statistics
+statistics = None
+
+
+def _import_psutil():
+    """Import the optional psutil module on demand.
+
+    Return None if psutil is not installed. The import is only tried once:
+    a failed import is remembered.
+    """
+    global psutil
+    if psutil is _NOT_IMPORTED:
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+    return psutil
+_NOT_IMPORTED = object()
+psutil = _NOT_IMPORTED
+
+
+def _replace_file(src, dst):
+    """Rename src to dst, replace dst if it exists.
+
+    Used to write a file atomically: write a temporary file and then rename
+    it, to never leave a truncated file.
+    """
+    if hasattr(os, 'replace'):
+        # Python 3.3
+        os.replace(src, dst)
+    else:
+        if sys.platform == 'win32' and os.path.exists(dst):
+            # rename() fails on Windows if the destination exists
+            os.unlink(dst)
+        os.rename(src, dst)
+
+
 # Clocks
 try:
     # Python 3.3+ (PEP 418)
@@ -43,6 +90,12 @@ except ImportError:
 
 _TIMEDELTA_UNITS = ('sec', 'ms', 'us', 'ns')
 
+# Magic header of the binary format of run results
+_BINARY_MAGIC = b'PRF1'
+
+# Number of characters of stderr stored for failed runs
+_FAILED_RUN_STDERR = 2000
+
 
 def _format_timedeltas(values):
     if any(dt < 0 for dt in values):
@@ -68,18 +121,88 @@ def _format_timedelta(value):
     return _format_timedeltas((value,))[0]
 
 
+def _format_rates(values, unit):
+    # values per second: the prefix and the precision are chosen for the
+    # first value, like _format_timedeltas()
+    ref_value = values[0]
+    factor = 1.0
+    prefix = ''
+    for prefix_factor, unit_prefix in ((1e9, 'G'), (1e6, 'M'), (1e3, 'k')):
+        if ref_value >= prefix_factor:
+            factor = prefix_factor
+            prefix = unit_prefix
+            break
+    ref_value /= factor
+    if ref_value >= 100:
+        precision = 0
+    elif ref_value >= 10:
+        precision = 1
+    else:
+        precision = 2
+
+    if unit == 'bytes':
+        unit = '%sB/s' % prefix
+    elif prefix:
+        unit = '%s %s/s' % (prefix, unit)
+    else:
+        unit = '%s/s' % unit
+    fmt = "%%.%sf %s" % (precision, unit)
+    return tuple(fmt % (value / factor,) for value in values)
+
+
+def _format_rate(value, unit):
+    return _format_rates((value,), unit)[0]
+
+
+def _get_throughput(metadata):
+    """Get the (work, unit) tuple of the work per call from metadata, or None
+    if the benchmark has no work per call."""
+    work = metadata.get('work')
+    if not work:
+        return None
+    return (float(work), metadata.get('work_unit', 'items'))
+
+
+def _check_work(work, work_unit):
+    if not(work > 0):
+        raise ValueError("work must be > 0")
+    if work_unit not in ('bytes', 'items'):
+        raise ValueError("work_unit must be 'bytes' or 'items'")
+
+
+def _rate(work, value):
+    # avoid division by zero
+    if not value:
+        return float('inf')
+    return work / value
+
+
 # FIXME: put this code into RunResult, and pass _format_timedeltas as formatter
 # to RunResult
-def _format_run_result(values, verbose=0):
-    numbers = [statistics.mean(values)]
-    with_stdev = (len(values) >= 2)
+def _format_stats(mean, stdev, min_value, max_value, verbose=0,
+                  throughput=None):
+    # stdev is None if there is a single value
+    if throughput is not None:
+        # (work, unit) tuple: format the throughput instead of the time,
+        # the minimum time is the maximum throughput
+        work, unit = throughput
+        if stdev is not None:
+            stdev = _rate(work, mean) * stdev / mean if mean else 0.0
+        mean, min_value, max_value = (_rate(work, mean),
+                                      _rate(work, max_value),
+                                      _rate(work, min_value))
+    numbers = [mean]
+    with_stdev = (stdev is not None)
     if with_stdev:
-        numbers.append(statistics.stdev(values))
+        numbers.append(stdev)
     if verbose > 1:
-        numbers.append(min(values))
-        numbers.append(max(values))
+        numbers.append(min_value)
+        numbers.append(max_value)
 
-    numbers = _format_timedeltas(numbers)
+    if throughput is not None:
+        numbers = _format_rates(numbers, throughput[1])
+    else:
+        numbers = _format_timedeltas(numbers)
     if verbose > 1:
         if with_stdev:
             text = '%s +- %s (min: %s, max: %s)' % numbers
@@ -93,6 +216,30 @@ def _format_run_result(values, verbose=0):
     return text
 
 
+def _format_run_result(values, verbose=0, throughput=None):
+    statistics = _import_statistics()
+    if len(values) >= 2:
+        stdev = statistics.stdev(values)
+    else:
+        stdev = None
+    return _format_stats(statistics.mean(values), stdev,
+                         min(values), max(values), verbose, throughput)
+
+
+def _format_iterations(nrun, nsample, nwarmup):
+    # nsample and nwarmup are None if runs have a different number of
+    # samples or warmups
+    iterations = []
+    if nrun > 1:
+        iterations.append(_format_number(nrun, 'run'))
+    if nsample:
+        iterations.append(_format_number(nsample, 'sample'))
+    iterations = ' x '.join(iterations)
+    if nwarmup:
+        iterations += '; %s' % _format_number(nwarmup, 'warmup')
+    return iterations
+
+
 def _format_number(number, unit=None, units=None):
     plural = (abs(number) > 1)
     if number >= 10000:
@@ -134,6 +281,31 @@ def _common_metadata(metadatas):
     return metadata
 
 
+def _format_params(params):
+    """Format the parameters of a point of a parameter grid.
+
+    [('n', 10), ('k', 2)] gives 'n=10, k=2'.
+    """
+    return ', '.join('%s=%s' % (name, value) for name, value in params)
+
+
+def _parse_params(name):
+    """Parse the parameters of the name of a benchmark of a parameter grid.
+
+    'sort(n=10, k=2)' and 'n=10, k=2' give [('n', '10'), ('k', '2')].
+    Return None if the name doesn't contain parameters.
+    """
+    if name.endswith(')') and '(' in name:
+        name = name[name.index('(') + 1:-1]
+    params = []
+    for part in name.split(', '):
+        param, sep, value = part.partition('=')
+        if not sep or not param or not value:
+            return None
+        params.append((param, value))
+    return params
+
+
 class Benchmark:
     def __init__(self, runs=None, name=None):
         if runs is not None:
@@ -141,6 +313,9 @@ class Benchmark:
         else:
             self.runs = []
         self.name = name
+        # List of failed runs: dictionaries with the keys 'error',
+        # 'stderr' (end of stderr), 'exitcode' and 'timeout' (optional)
+        self.failed_runs = []
 
     def _format_sample(self, sample, verbose=False):
         if not self.runs:
@@ -148,6 +323,10 @@ class Benchmark:
         run = self.runs[0]
         return run._format_sample(sample, verbose)
 
+    def _get_throughput(self):
+        # runs with a different work per call are formatted as time
+        return _get_throughput(self.get_metadata())
+
     def get_samples(self):
         samples = []
         for run in self.runs:
@@ -156,35 +335,70 @@ class Benchmark:
 
     def get_metadata(self):
         metadatas = [run.metadata for run in self.runs]
-        return _common_metadata(metadatas)
+        metadata = _common_metadata(metadatas)
+        if self.failed_runs:
+            metadata['failed_runs'] = str(len(self.failed_runs))
+        return metadata
+
+    def _get_iterations(self):
+        # (number of samples, number of warmups) per run, None if runs
+        # are different
+        first_run = self.runs[0]
+        warmup = len(first_run.warmups)
+        nsample = len(first_run.samples)
+        for run in self.runs:
+            run_nsample = len(run.samples)
+            if nsample is not None and nsample != run_nsample:
+                nsample = None
+            run_warmup = len(run.warmups)
+            if warmup is not None and warmup != run_warmup:
+                warmup = None
+        return (nsample, warmup)
+
+    def _get_stats(self):
+        """Summary statistics of samples.
+
+        Return a dictionary with the keys: nsample, mean, stdev (None if
+        there is a single sample), sse (sum of squared deviations from the
+        mean), min, max, shortest_raw (shortest raw sample of runs).
+        """
+        samples = self.get_samples()
+        statistics = _import_statistics()
+        mean = statistics.mean(samples)
+        if len(samples) > 1:
+            stdev = statistics.stdev(samples)
+        else:
+            stdev = None
+        sse = math.fsum((sample - mean) ** 2 for sample in samples)
+        shortest = min(min(run._get_raw_samples())
+                       for run in self.runs if run.samples)
+        return {'nsample': len(samples), 'mean': mean, 'stdev': stdev,
+                'sse': sse, 'min': min(samples), 'max': max(samples),
+                'shortest_raw': shortest}
+
+    def _get_percentiles(self):
+        """Estimate percentiles of samples using quantile sketches of runs.
+
+        Return a list of (percentile, value) tuples.
+        """
+        from perf import _sketch
+        sketch = _sketch.QuantileSketch()
+        for run in self.runs:
+            sketch.merge(run._get_sketch())
+        return sketch.percentiles()
 
     def format(self, verbose=0):
         if self.runs:
             first_run = self.runs[0]
-            warmup = len(first_run.warmups)
-            nsample = len(first_run.samples)
-            for run in self.runs:
-                run_nsample = len(run.samples)
-                if nsample is not None and nsample != run_nsample:
-                    nsample = None
-                run_warmup = len(run.warmups)
-                if warmup is not None and warmup != run_warmup:
-                    warmup = None
-
             # FIXME: handle the case where all samples are empty
             samples = self.get_samples()
-            text = first_run._formatter(samples, verbose)
+            text = first_run._formatter(samples, verbose,
+                                        self._get_throughput())
 
             if verbose:
-                iterations = []
-                nrun = len(self.runs)
-                if nrun > 1:
-                    iterations.append(_format_number(nrun, 'run'))
-                if nsample:
-                    iterations.append(_format_number(nsample, 'sample'))
-                iterations = ' x '.join(iterations)
-                if warmup:
-                    iterations += '; %s' % _format_number(warmup, 'warmup')
+                nsample, warmup = self._get_iterations()
+                iterations = _format_iterations(len(self.runs), nsample,
+                                                warmup)
                 if iterations:
                     text = '%s (%s)' % (text, iterations)
         else:
@@ -205,12 +419,24 @@ class Benchmark:
 
         if 'results' not in data:
             raise ValueError("JSON doesn't contain results")
-        data = data['results']
+        return cls._json_load_results(data['results'])
 
+    @classmethod
+    def _json_load_results(cls, data):
         runs = [RunResult._json_load(run) for run in data['runs']]
         name = data.get('name')
-
-        return cls(runs=runs, name=name)
+        # metadata common to all runs are only stored once
+        common = data.get('metadata')
+        if common:
+            for run in runs:
+                if run.metadata is None:
+                    run.metadata = {}
+                for key, value in common.items():
+                    run.metadata.setdefault(key, value)
+
+        bench = cls(runs=runs, name=name)
+        bench.failed_runs.extend(data.get('failed_runs', ()))
+        return bench
 
     @classmethod
     def json_load_from(cls, file):
@@ -224,12 +450,105 @@ class Benchmark:
         data = json.loads(text)
         return cls._json_load(data)
 
-    def _as_json(self):
-        runs = [run._as_json() for run in self.runs]
+    def dump_indexed(self, file):
+        from perf import _indexed
+        _indexed.dump(self, file)
+
+    @classmethod
+    def load_indexed(cls, file):
+        from perf import _indexed
+        return _indexed.load(file)
+
+    def _as_json_results(self):
+        if len(self.runs) > 1:
+            # store metadata common to all runs (hostname, platform, etc.)
+            # once, instead of once per run. Keys missing in a run are not
+            # common: the loader adds common metadata to all runs.
+            common = dict(self.runs[0].metadata)
+            for run in self.runs[1:]:
+                for key in list(common):
+                    if (key not in run.metadata
+                    or run.metadata[key] != common[key]):
+                        del common[key]
+        else:
+            common = None
+        runs = [run._as_json(common) for run in self.runs]
         data = {'runs': runs}
+        if common:
+            data['metadata'] = common
         if self.name:
             data['name'] = self.name
-        return {'results': data, 'version': 1}
+        if self.failed_runs:
+            data['failed_runs'] = self.failed_runs
+        return data
+
+    def _as_json(self):
+        return {'results': self._as_json_results(), 'version': 1}
+
+    def json(self):
+        json = _import_json()
+        return json.dumps(self._as_json()) + '\n'
+
+    def json_dump_into(self, file):
+        json = _import_json()
+        json.dump(self._as_json(), file)
+        file.write('\n')
+
+
+class BenchmarkSuite:
+    def __init__(self, benchmarks=None):
+        if benchmarks is not None:
+            self.benchmarks = benchmarks
+        else:
+            self.benchmarks = []
+
+    def get_benchmark_names(self):
+        return [bench.name for bench in self.benchmarks]
+
+    def get_benchmark(self, name):
+        for bench in self.benchmarks:
+            if bench.name == name:
+                return bench
+        raise KeyError(name)
+
+    def add_benchmark(self, bench):
+        if bench.name is not None and bench.name in self.get_benchmark_names():
+            raise ValueError("a benchmark called %r already exists"
+                             % bench.name)
+        self.benchmarks.append(bench)
+
+    @classmethod
+    def _json_load(cls, data):
+        version = data.get('version')
+        if version != 1:
+            raise ValueError("version %r not supported" % version)
+
+        if 'results' in data:
+            # file of a single benchmark
+            benchmarks = [Benchmark._json_load(data)]
+        elif 'benchmarks' in data:
+            benchmarks = [Benchmark._json_load_results(bench_data)
+                          for bench_data in data['benchmarks']]
+        else:
+            raise ValueError("JSON doesn't contain benchmarks")
+
+        return cls(benchmarks)
+
+    @classmethod
+    def json_load_from(cls, file):
+        json = _import_json()
+        data = json.load(file)
+        return cls._json_load(data)
+
+    @classmethod
+    def json_load(cls, text):
+        json = _import_json()
+        data = json.loads(text)
+        return cls._json_load(data)
+
+    def _as_json(self):
+        benchmarks = [bench._as_json_results() for bench in self.benchmarks]
+        return {'benchmarks': benchmarks, 'version': 1}
 
     def json(self):
         json = _import_json()
@@ -243,7 +562,8 @@ class Benchmark:
 
 class RunResult:
     def __init__(self, samples=None, warmups=None, loops=None,
-                 inner_loops=None, metadata=None):
+                 inner_loops=None, metadata=None, work=None,
+                 work_unit='bytes'):
         if (samples is not None
         and any(not(isinstance(value, float) and value >= 0)
                 for value in samples)):
@@ -263,6 +583,9 @@ class RunResult:
         self.inner_loops = inner_loops
         # FIXME: make the formatter configurable
         self._formatter = _format_run_result
+        # Quantile sketch of samples loaded from a file, or None: see
+        # _get_sketch()
+        self._sketch = None
 
         # Metadata dictionary: key=>value, keys and values are non-empty
         # strings
@@ -277,6 +600,28 @@ class RunResult:
             self.metadata['loops'] = _format_number(self.loops)
         if self.inner_loops is not None:
             self.metadata['inner_loops'] = _format_number(self.inner_loops)
+        # work per call (number of bytes or items), used to display the
+        # throughput instead of the time
+        if work is not None:
+            _check_work(work, work_unit)
+            self.metadata['work'] = str(work)
+            self.metadata['work_unit'] = work_unit
+
+    def _load_sketch(self, data):
+        from perf import _sketch
+        self._sketch = _sketch.QuantileSketch._json_load(data)
+
+    def _get_sketch(self):
+        """Get the quantile sketch of samples (perf._sketch.QuantileSketch).
+
+        The sketch is built from samples, unless it was loaded from a file.
+        """
+        if self._sketch is not None:
+            return self._sketch
+        from perf import _sketch
+        sketch = _sketch.QuantileSketch()
+        sketch.update(self.samples)
+        return sketch
 
     def _get_raw_samples(self):
         factor = 1
@@ -292,20 +637,29 @@ class RunResult:
     def _format_sample(self, sample, verbose=False):
         return self._formatter([sample], verbose)
 
+    def _get_throughput(self):
+        return _get_throughput(self.metadata)
+
     def format(self, verbose=False):
-        return self._formatter(self.samples, verbose)
+        return self._formatter(self.samples, verbose, self._get_throughput())
 
     def __str__(self):
         return self.format()
 
-    def _as_json(self):
+    def _as_json(self, common_metadata=None):
+        # common_metadata: metadata stored by the benchmark, not by the run
+        metadata = self.metadata
+        if common_metadata:
+            metadata = dict((key, value) for key, value in metadata.items()
+                            if key not in common_metadata)
         data = {'samples': self.samples,
                 'warmups': self.warmups,
-                'metadata': self.metadata}
+                'metadata': metadata}
         if self.loops:
             data['loops'] = self.loops
         if self.inner_loops:
             data['inner_loops'] = self.inner_loops
+        data['sketch'] = self._get_sketch()._as_json()
         return {'run_result': data, 'version': 1}
 
     def json(self):
@@ -338,6 +692,8 @@ class RunResult:
                   loops=loops,
                   inner_loops=inner_loops)
         run.metadata = metadata
+        if 'sketch' in data:
+            run._load_sketch(data['sketch'])
         return run
 
     @classmethod
@@ -352,30 +708,212 @@ class RunResult:
         data = json.loads(text)
         return cls._json_load(data)
 
-    @classmethod
-    def from_subprocess(cls, args, **kwargs):
-        subprocess = _import_subprocess()
+    def _binary(self, sketch=False):
+        """Encode the run result to the compact binary format.
 
-        proc = subprocess.Popen(args,
-                                stdout=subprocess.PIPE,
-                                universal_newlines=True,
-                                **kwargs)
+        Format: magic, size of the body, then the body: sizes of the JSON
+        header and of warmups and samples arrays, the JSON header (metadata,
+        loops, inner_loops and the quantile sketch if sketch is true or if
+        it was loaded), warmups and samples as little endian float64 arrays.
+        """
+        json = _import_json()
 
+        header = {'metadata': self.metadata}
+        if self.loops:
+            header['loops'] = self.loops
+        if self.inner_loops:
+            header['inner_loops'] = self.inner_loops
+        if sketch or self._sketch is not None:
+            header['sketch'] = self._get_sketch()._as_json()
+        header = json.dumps(header).encode('utf-8')
+
+        warmups = array.array('d', self.warmups)
+        samples = array.array('d', self.samples)
+        if sys.byteorder != 'little':
+            warmups.byteswap()
+            samples.byteswap()
         if _PY3:
-            with proc:
-                stdout, stderr = proc.communicate()
+            warmups = warmups.tobytes()
+            samples = samples.tobytes()
+        else:
+            warmups = warmups.tostring()
+            samples = samples.tostring()
+
+        sizes = struct.pack('<III',
+                            len(header), len(self.warmups), len(self.samples))
+        body = b''.join((sizes, header, warmups, samples))
+        return _BINARY_MAGIC + struct.pack('<I', len(body)) + body
+
+    @classmethod
+    def _binary_load(cls, data):
+        """Decode a run result encoded by _binary()."""
+        json = _import_json()
+
+        magic_size = len(_BINARY_MAGIC)
+        if data[:magic_size] != _BINARY_MAGIC:
+            raise ValueError("invalid binary run result")
+        pos = magic_size
+        size, = struct.unpack_from('<I', data, pos)
+        pos += 4
+        if len(data) - pos != size:
+            raise ValueError("truncated binary run result")
+
+        header_size, nwarmup, nsample = struct.unpack_from('<III', data, pos)
+        pos += 12
+        header = json.loads(data[pos:pos + header_size].decode('utf-8'))
+        pos += header_size
+
+        arrays = []
+        for nvalue in (nwarmup, nsample):
+            values = array.array('d')
+            chunk = data[pos:pos + nvalue * 8]
+            if _PY3:
+                values.frombytes(chunk)
+            else:
+                values.fromstring(chunk)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            arrays.append(values.tolist())
+            pos += nvalue * 8
+        warmups, samples = arrays
+
+        run = cls(samples=samples,
+                  warmups=warmups,
+                  loops=header.get('loops'),
+                  inner_loops=header.get('inner_loops'))
+        run.metadata = header['metadata']
+        if 'sketch' in header:
+            run._load_sketch(header['sketch'])
+        return run
+
+    @classmethod
+    def _binary_load_list(cls, data):
+        """Decode consecutive run results encoded by _binary()."""
+        runs = []
+        pos = 0
+        magic_size = len(_BINARY_MAGIC)
+        while pos < len(data):
+            if len(data) - pos < magic_size + 4:
+                raise ValueError("truncated binary run result")
+            size, = struct.unpack_from('<I', data, pos + magic_size)
+            end = pos + magic_size + 4 + size
+            runs.append(cls._binary_load(data[pos:end]))
+            pos = end
+        return runs
+
+    def _binary_dump_into_fd(self, fd):
+        data = self._binary()
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+    @staticmethod
+    def _run_subprocess(args, timeout=None, stderr_file=None,
+                        result_pipe=None, **kwargs):
+        from perf import _worker
+
+        subprocess = _import_subprocess()
+        stderr = kwargs.pop('stderr', None)
+        if stderr_file is None and stderr != subprocess.PIPE:
+            # stderr is not captured: write it into sys.stderr
+            stderr_file = sys.stderr
+
+        if result_pipe is not None:
+            # The child process writes its result in the binary format into
+            # the write end of the pipe
+            result_fd, write_fd = result_pipe
+            if _PY3:
+                kwargs['pass_fds'] = (write_fd,)
+            try:
+                worker = _worker.WorkerProcess(args, timeout=timeout,
+                                               stderr_file=stderr_file,
+                                               result_fd=result_fd,
+                                               **kwargs)
+            except:
+                os.close(result_fd)
+                raise
+            finally:
+                # only the child process must have the write end
+                os.close(write_fd)
         else:
-            stdout, stderr = proc.communicate()
+            worker = _worker.WorkerProcess(args, timeout=timeout,
+                                           stderr_file=stderr_file, **kwargs)
+        _worker.supervise([worker])
 
-        if proc.returncode:
-            sys.stdout.write(stdout)
+        if worker.timed_out:
+            raise _WorkerError("%s killed after a timeout of %s"
+                               % (args[0], _format_timedelta(timeout)),
+                               worker)
+
+        if worker.returncode:
+            sys.stdout.write(worker.stdout)
             sys.stdout.flush()
-            sys.stderr.write(stderr)
-            sys.stderr.flush()
-            raise RuntimeError("%s with with exit code %s"
-                               % (args[0], proc.returncode))
+            if stderr_file is None:
+                sys.stderr.write(worker.stderr_tail)
+                sys.stderr.flush()
+            raise _WorkerError("%s failed with exit code %s"
+                               % (args[0], worker.returncode),
+                               worker)
+        return worker
+
+    @classmethod
+    def from_subprocess(cls, args, timeout=None, stderr_file=None,
+                        result_pipe=None, **kwargs):
+        worker = cls._run_subprocess(args, timeout, stderr_file, result_pipe,
+                                     **kwargs)
+        try:
+            if result_pipe is not None:
+                return cls._binary_load(worker.result)
+            return cls.json_load(worker.stdout)
+        except ValueError as exc:
+            raise _WorkerError("%s returned an invalid result: %s"
+                               % (args[0], exc),
+                               worker)
 
-        return cls.json_load(stdout)
+    @classmethod
+    def _list_from_subprocess(cls, args, nrun, timeout=None,
+                              stderr_file=None, result_pipe=None, **kwargs):
+        """Get the run results of a worker process running nrun benchmarks.
+
+        The worker writes its run results into the result pipe, or a
+        benchmark suite as JSON into stdout.
+        """
+        worker = cls._run_subprocess(args, timeout, stderr_file, result_pipe,
+                                     **kwargs)
+        try:
+            if result_pipe is not None:
+                runs = cls._binary_load_list(worker.result)
+            else:
+                suite = BenchmarkSuite.json_load(worker.stdout)
+                runs = [bench.runs[0] for bench in suite.benchmarks]
+            if len(runs) != nrun:
+                raise ValueError("got %s run results, expected %s"
+                                 % (len(runs), nrun))
+        except (ValueError, IndexError) as exc:
+            raise _WorkerError("%s returned an invalid result: %s"
+                               % (args[0], exc),
+                               worker)
+        return runs
+
+
+class _WorkerError(RuntimeError):
+    """A worker process failed: exit code, timeout or invalid result."""
+
+    def __init__(self, msg, worker):
+        RuntimeError.__init__(self, msg)
+        self.exitcode = worker.returncode
+        self.timed_out = worker.timed_out
+        self.stderr_tail = worker.stderr_tail
+
+    def _failed_run(self):
+        # Only keep the last lines of stderr
+        stderr = self.stderr_tail[-_FAILED_RUN_STDERR:].rstrip()
+        failed_run = {'error': str(self), 'stderr': stderr}
+        if self.exitcode is not None:
+            failed_run['exitcode'] = self.exitcode
+        if self.timed_out:
+            failed_run['timeout'] = True
+        return failed_run
 
 
 def _very_verbose_run(run):
@@ -391,14 +929,15 @@ def _very_verbose_run(run):
 
 
 def _display_benchmark_avg(bench, verbose=0, file=None):
-    samples = bench.get_samples()
+    # bench is a Benchmark or a perf._cache.BenchmarkSummary
     # FIXME: handle empty samples
+    stats = bench._get_stats()
 
     # Display a warning if the standard deviation is larger than 10%
-    avg = statistics.mean(samples)
+    avg = stats['mean']
     # Avoid division by zero
-    if avg and len(samples) > 1:
-        k = statistics.stdev(samples) / avg
+    if avg and stats['nsample'] > 1:
+        k = stats['stdev'] / avg
         if k > 0.10:
             if k > 0.20:
                 print("ERROR: the benchmark is very unstable, the standard "
@@ -416,7 +955,7 @@ def _display_benchmark_avg(bench, verbose=0, file=None):
             print("Standard deviation: %.0f%%" % (k * 100), file=file)
 
     # Check that the shortest sample took at least 1 ms
-    shortest = min(min(run._get_raw_samples()) for run in bench.runs)
+    shortest = stats['shortest_raw']
     text = bench._format_sample(shortest)
     if shortest < 1e-3:
         if shortest < 1e-6:
@@ -523,6 +1062,7 @@ def _pooled_sample_variance(sample1, sample2):
     Returns:
         Pooled sample variance, as a float.
     """
+    statistics = _import_statistics()
     deg_freedom = len(sample1) + len(sample2) - 2
     mean1 = statistics.mean(sample1)
     squares1 = ((x - mean1) ** 2 for x in sample1)
@@ -542,6 +1082,7 @@ def _tscore(sample1, sample2):
     Returns:
         The t-test score, as a float.
     """
+    statistics = _import_statistics()
     assert len(sample1) == len(sample2)
     error = _pooled_sample_variance(sample1, sample2) / len(sample1)
     return (statistics.mean(sample1) - statistics.mean(sample2)) / math.sqrt(error * 2)
@@ -565,3 +1106,102 @@ def is_significant(sample1, sample2):
     critical_value = _tdist95conf_level(deg_freedom)
     t_score = _tscore(sample1, sample2)
     return (abs(t_score) >= critical_value, t_score)
+
+
+def _is_significant_stats(stats1, stats2):
+    """Similar to is_significant(), but use summary statistics of samples:
+    dictionaries with the nsample, mean and sse keys (see
+    Benchmark._get_stats()). Samples can have a different size."""
+    nsample1 = stats1['nsample']
+    nsample2 = stats2['nsample']
+    deg_freedom = nsample1 + nsample2 - 2
+    critical_value = _tdist95conf_level(deg_freedom)
+    variance = (stats1['sse'] + stats2['sse']) / float(deg_freedom)
+    error = variance * (1.0 / nsample1 + 1.0 / nsample2)
+    t_score = (stats1['mean'] - stats2['mean']) / math.sqrt(error)
+    return (abs(t_score) >= critical_value, t_score)
+
+
+# Critical values of Pocock group sequential boundaries for a two-sided test
+# with alpha=0.05, as a function of the maximum number of looks (interim
+# analyses): the same critical value is used at each look, the overall type I
+# error rate is 5%. See Jennison & Turnbull, "Group Sequential Methods with
+# Applications to Clinical Trials", table 2.1. Values of 25 looks and more
+# were computed by a Monte Carlo simulation.
+_POCOCK_95_CONF_LEVELS = [0, 1.960, 2.178, 2.289, 2.361,
+                          2.413, 2.453, 2.485, 2.512, 2.535,
+                          2.555, 2.572, 2.588, 2.602, 2.614,
+                          2.626, 2.636, 2.646, 2.655, 2.664,
+                          2.672]
+_POCOCK_95_CONF_LEVELS_LARGE = ((25, 2.708), (30, 2.733), (40, 2.773),
+                                (50, 2.803))
+
+
+def _pocock95_conf_level(max_looks):
+    """Critical value of a Pocock boundary, alpha=0.05, two-sided.
+
+    Args:
+        max_looks: An integer, the maximum number of looks.
+
+    Returns:
+        A float.
+    """
+    if max_looks < len(_POCOCK_95_CONF_LEVELS):
+        return _POCOCK_95_CONF_LEVELS[max(max_looks, 1)]
+    for looks, level in _POCOCK_95_CONF_LEVELS_LARGE:
+        # use the boundary of the next larger number of looks: it is more
+        # conservative
+        if max_looks <= looks:
+            return level
+    # conservative approximation
+    return 3.0
+
+
+def _sequential_test(sample1, sample2, max_looks, min_effect):
+    """Interim analysis of a group sequential comparison of two samples.
+
+    The test is run after each pair of new values: it uses Pocock
+    boundaries to keep the overall type I error rate at 5% even if the test
+    is repeated up to max_looks times. The critical value is scaled by the
+    95% Student's t critical value divided by the normal critical value
+    (1.96), to account for the estimated variance of small samples.
+
+    Args:
+        sample1: the reference sample.
+        sample2: the changed sample, same length than sample1.
+        max_looks: maximum number of looks (number of pairs of values).
+        min_effect: relative difference of the means (ex: 0.01 for 1%)
+            below which the two samples are considered equivalent.
+
+    Returns:
+        (verdict, t_score) where verdict is None if more values are needed,
+        'significant' if the means differ significantly, or 'equivalent' if
+        the confidence interval of the difference is smaller than
+        min_effect.
+    """
+    assert len(sample1) == len(sample2)
+    nvalue = len(sample1)
+    deg_freedom = nvalue * 2 - 2
+    if deg_freedom < 1:
+        return (None, None)
+
+    critical_value = (_pocock95_conf_level(max_looks)
+                      * _tdist95conf_level(deg_freedom) / 1.960)
+    statistics = _import_statistics()
+    mean1 = statistics.mean(sample1)
+    diff = statistics.mean(sample2) - mean1
+    error = math.sqrt(_pooled_sample_variance(sample1, sample2)
+                      * 2.0 / nvalue)
+    if not error:
+        # all values are equal: avoid division by zero
+        if diff:
+            return ('significant', None)
+        else:
+            return ('equivalent', None)
+
+    t_score = -diff / error
+    if abs(t_score) >= critical_value:
+        return ('significant', t_score)
+    if abs(diff) + critical_value * error < min_effect * abs(mean1):
+        return ('equivalent', t_score)
+    return (None, t_score)
@@ -1,6 +1,8 @@
 from __future__ import print_function
 import argparse
 import json
+import math
+import os
 import sys
 
 import statistics
@@ -16,6 +18,9 @@ def create_parser():
     parser.add_argument('-M', '--no-metadata', dest='metadata', action="store_false",
                         default=True,
                         help="Don't show metadata.")
+    parser.add_argument('--cache', action="store_true",
+                        help="Use and update a cache of summaries of result "
+                             "files in show and compare commands.")
     subparsers = parser.add_subparsers(dest='action')
 
     show = subparsers.add_parser('show')
@@ -35,44 +40,220 @@ def create_parser():
                             help='Result JSON file')
 
     compare = subparsers.add_parser('compare')
+    compare.add_argument('-j', '--jobs', type=int, default=1,
+                        help='load result files in JOBS worker processes')
     compare.add_argument('ref_filename', type=str,
                          help='Reference JSON file')
     compare.add_argument('changed_filenames', metavar="changed_filename",
-                         type=str, nargs='+',
+                         type=str, nargs='*',
                          help='Changed JSON file')
 
     compare_to = subparsers.add_parser('compare_to')
+    compare_to.add_argument('-j', '--jobs', type=int, default=1,
+                           help='load result files in JOBS worker processes')
     compare_to.add_argument('ref_filename', type=str,
                             help='Reference JSON file')
     compare_to.add_argument('changed_filenames', metavar="changed_filename",
-                            type=str, nargs='+',
+                            type=str, nargs='*',
                             help='Changed JSON file')
 
     stats = subparsers.add_parser('stats')
     stats.add_argument('filename', type=str,
                        help='Result JSON file')
 
+    scaling = subparsers.add_parser('scaling',
+                                    help='Fit scaling models on the '
+                                         'benchmarks of a parameter grid')
+    scaling.add_argument('--param', metavar='NAME',
+                         help='parameter of the input size, required if '
+                              'benchmarks have multiple parameters')
+    scaling.add_argument('filename', type=str,
+                         help='Result JSON file')
+
+    convert = subparsers.add_parser('convert',
+                                    help='Convert a result file to JSON or '
+                                         'to the run-indexed binary format')
+    convert.add_argument('--indexed', action='store_true',
+                         help='write the run-indexed binary format')
+    convert.add_argument('--name',
+                         help='benchmark name, required with --indexed '
+                              'if the file contains multiple benchmarks')
+    convert.add_argument('input_filename', help='Input result file')
+    convert.add_argument('output_filename', help='Output result file')
+
+    merge = subparsers.add_parser('merge',
+                                  help='Merge runs of result files into '
+                                       'a single benchmark')
+    merge.add_argument('--name',
+                       help='benchmark name, required if files contain '
+                            'multiple benchmarks')
+    merge.add_argument('--force', action='store_true',
+                       help='only emit a warning if metadata of runs '
+                            'are incompatible')
+    merge.add_argument('output', help='Output JSON file')
+    merge.add_argument('filenames', metavar='filename', nargs='+',
+                       help='Result JSON file')
+
+    trend = subparsers.add_parser('trend',
+                                  help='Detect step changes in a series '
+                                       'of result files')
+    trend.add_argument('--name',
+                       help='benchmark name, required if files contain '
+                            'multiple benchmarks')
+    trend.add_argument('--label', metavar='KEY',
+                       help='metadata used to identify a result file, '
+                            'like a commit identifier (default: date)')
+    trend.add_argument('filenames', metavar='filename', nargs='+',
+                       help='Result JSON file, ordered from the oldest '
+                            'to the newest')
+
+    db = subparsers.add_parser('db',
+                               help='History of results in a SQLite database')
+    db_actions = db.add_subparsers(dest='db_action')
+    db_add = db_actions.add_parser('add',
+                                   help='Add result files to the database')
+    db_add.add_argument('--samples', action='store_true',
+                        help='Also store raw samples of runs')
+    db_add.add_argument('--name', default='default',
+                        help='Name of unnamed benchmarks, the filename is '
+                             'not used to follow a benchmark across files '
+                             '(default: %(default)s)')
+    db_add.add_argument('database', help='SQLite database file')
+    db_add.add_argument('filenames', metavar='filename', nargs='+',
+                        help='Result JSON file')
+    db_history = db_actions.add_parser('history',
+                                       help='Display the results of a '
+                                            'benchmark ordered by date')
+    db_history.add_argument('database', help='SQLite database file')
+    db_history.add_argument('name', help='Benchmark name')
+    db_summary = db_actions.add_parser('summary',
+                                       help='Display a summary of each '
+                                            'benchmark')
+    db_summary.add_argument('database', help='SQLite database file')
+    for cmd in (db_history, db_summary):
+        cmd.add_argument('--days', type=float,
+                         help='Only use results of the last DAYS days')
+        cmd.add_argument('--metadata', metavar='KEY=VALUE',
+                         dest='metadata_filter', action='append', default=[],
+                         help='Only use results with the metadata KEY=VALUE')
+
+    # the command is parsed by cmd_bench_command() using TextRunner options
+    subparsers.add_parser('command',
+                          help='Benchmark a command: '
+                               'command [options] -- program [arg ...]')
+
     return parser
 
 
-def parse_results(filename, default_name=None):
+def parse_results(filename, default_name=None, name_from_filename=True):
+    """Load a file of a benchmark or of a benchmark suite.
+
+    Unnamed benchmarks are named after the filename, or default_name if
+    name_from_filename is false. Return a perf.BenchmarkSuite.
+    """
+    suite = None
     if filename != '-':
-        fp = open(filename)
+        from perf import _indexed
+
+        with open(filename, 'rb') as fp:
+            if _indexed.is_indexed(fp):
+                bench = perf.Benchmark.load_indexed(fp)
+                suite = perf.BenchmarkSuite([bench])
+        if suite is None:
+            fp = open(filename)
     else:
         fp = sys.stdin
-    with fp:
-        result = perf.Benchmark.json_load_from(fp)
+    if suite is None:
+        with fp:
+            suite = perf.BenchmarkSuite.json_load_from(fp)
+
+    if len(suite.benchmarks) == 1:
+        result = suite.benchmarks[0]
+        if not result.name and filename != "-" and name_from_filename:
+            name = filename
+            if name.lower().endswith('.json'):
+                name = name[:-5]
+            if name:
+                result.name = name
+        if not result.name and default_name:
+            result.name = default_name
+    else:
+        for index, result in enumerate(suite.benchmarks, 1):
+            if not result.name:
+                if name_from_filename:
+                    prefix = default_name or filename
+                else:
+                    prefix = default_name
+                if prefix:
+                    result.name = '%s#%s' % (prefix, index)
+
+    return suite
+
+
+def load_benchmarks(args, filename, default_name=None):
+    """Load the benchmarks of a result file.
+
+    With --cache, return summaries of benchmarks (see perf._cache), else
+    perf.Benchmark objects.
+    """
+    if args.cache and filename != '-':
+        from perf import _cache
+        return _cache.load_summaries(filename, parse_results)
+    return parse_results(filename, default_name).benchmarks
 
-    if not result.name and filename != "-":
-        name = filename
-        if name.lower().endswith('.json'):
-            name = name[:-5]
-        if name:
-            result.name = name
-    if not result.name and default_name:
-        result.name = default_name
 
-    return result
+def _load_summaries(item):
+    # Function called in worker processes of load_all_benchmarks()
+    from perf import _cache
+    filename, default_name, cache = item
+    if cache:
+        return _cache.load_summaries(filename, parse_results)
+    suite = parse_results(filename, default_name)
+    return [_cache.BenchmarkSummary.from_benchmark(bench)
+            for bench in suite.benchmarks]
+
+
+def load_all_benchmarks(args, filenames):
+    """Load the benchmarks of result files, in order.
+
+    With --jobs, files are loaded in parallel in worker processes which
+    return summaries of benchmarks: only summaries are kept in memory.
+    """
+    items = [(filename, '<file#%s>' % index, args.cache)
+             for index, filename in enumerate(filenames, 1)]
+    if args.jobs <= 1 or len(filenames) < 2 or '-' in filenames:
+        results = []
+        for filename, default_name, cache in items:
+            results.extend(load_benchmarks(args, filename, default_name))
+        return results
+
+    import multiprocessing
+
+    pool = multiprocessing.Pool(min(args.jobs, len(filenames)))
+    try:
+        results = []
+        # imap() preserves the order of files
+        for summaries in pool.imap(_load_summaries, items):
+            results.extend(summaries)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def _display_benchmarks(benchmarks, display_func, *args):
+    multiple = (len(benchmarks) > 1)
+    for index, result in enumerate(benchmarks):
+        if multiple:
+            if index:
+                print()
+            print("%s" % result.name)
+            print("=" * len(result.name))
+            print()
+        display_func(*(args + (result,)))
 
 
 def display_result(args, result):
@@ -87,11 +268,64 @@ def display_result(args, result):
         print()
 
     perf._display_benchmark_avg(result, verbose=args.verbose)
+    if args.verbose:
+        _display_percentiles(result)
+
+
+def _display_percentiles(result):
+    from perf import _sketch
+    percentiles = result._get_percentiles()
+    print("Percentiles: %s" % _sketch.format_percentiles(percentiles))
 
 
 def _result_sort_key(result):
-    samples = result.get_samples()
-    return statistics.mean(samples)
+    mean = result._get_stats()['mean']
+    throughput = result._get_throughput()
+    if throughput is not None:
+        # time per unit of work
+        mean /= throughput[0]
+    return mean
+
+
+def _work_stats(ref_result, ref_stats, changed_result, changed_stats):
+    """Divide statistics by the work per call if both results have the same
+    unit of work, so results with different input sizes are compared using
+    their throughput."""
+    ref_throughput = ref_result._get_throughput()
+    changed_throughput = changed_result._get_throughput()
+    if (ref_throughput is None or changed_throughput is None
+       or ref_throughput[1] != changed_throughput[1]):
+        return (ref_stats, changed_stats)
+
+    def scale(stats, work):
+        stats = dict(stats)
+        for key in ('mean', 'stdev', 'min', 'max'):
+            if stats[key] is not None:
+                stats[key] /= work
+        stats['sse'] /= work ** 2
+        return stats
+
+    return (scale(ref_stats, ref_throughput[0]),
+            scale(changed_stats, changed_throughput[0]))
+
+
+def _compare_percentiles(ref_result, changed_result):
+    from perf import _sketch
+
+    ref_percentiles = ref_result._get_percentiles()
+    changed_percentiles = changed_result._get_percentiles()
+    for (percentile, ref_value), (_, changed_value) in zip(ref_percentiles,
+                                                          changed_percentiles):
+        text = ("p%s: %s -> %s"
+                % ((_sketch._format_percentile(percentile),)
+                   + perf._format_timedeltas((ref_value, changed_value))))
+        # avoid division by zero
+        if ref_value and changed_value:
+            if changed_value < ref_value:
+                text = "%s: %.1fx faster" % (text, ref_value / changed_value)
+            else:
+                text = "%s: %.1fx slower" % (text, changed_value / ref_value)
+        print(text)
 
 
 def compare_results(args, results, sort_results):
@@ -128,12 +362,16 @@ def compare_results(args, results, sort_results):
                                    header='%s metadata:' % result.name)
 
     # Compute means
-    ref_samples = ref_result.get_samples()
-    ref_avg = statistics.mean(ref_samples)
+    ref_stats = ref_result._get_stats()
     last_index = len(results) - 1
     for index, changed_result in enumerate(results[1:], 1):
-        changed_samples = changed_result.get_samples()
-        changed_avg = statistics.mean(changed_samples)
+        changed_stats = changed_result._get_stats()
+        # compare throughputs if results have a work per call
+        ref_work_stats, changed_stats = _work_stats(ref_result, ref_stats,
+                                                    changed_result,
+                                                    changed_stats)
+        ref_avg = ref_work_stats['mean']
+        changed_avg = changed_stats['mean']
         text = ("Average: [%s] %s -> [%s] %s"
                 % (ref_result.name,
                    ref_result.format(verbose=args.verbose),
@@ -148,8 +386,12 @@ def compare_results(args, results, sort_results):
                 text= "%s: %.1fx slower" % (text, changed_avg / ref_avg)
         print(text)
 
+        if args.verbose:
+            _compare_percentiles(ref_result, changed_result)
+
         # significant?
-        significant, t_score = perf.is_significant(ref_samples, changed_samples)
+        significant, t_score = perf._is_significant_stats(ref_work_stats,
+                                                          changed_stats)
         if significant:
             print("Significant (t=%.2f)" % t_score)
         else:
@@ -250,6 +492,13 @@ def display_stats(args, result):
     stats = boltons.statsutils.Stats(samples)
     print("Median +- MAD: %s +- %s"
           % perf._format_timedeltas([median, stats.median_abs_dev]))
+    throughput = result._get_throughput()
+    if throughput is not None:
+        work, unit = throughput
+        print("Throughput (mean): %s"
+              % perf._format_rate(perf._rate(work, statistics.mean(samples)),
+                                  unit))
+    _display_percentiles(result)
     print()
 
     print("Skewness: %.2f"
@@ -275,32 +524,521 @@ def display_stats(args, result):
     print("Median+mad range buckets: %s" % counters(median, stats.median_abs_dev))
 
 
+# Scaling models: (name, function of the input size), the model is
+# time = a + b * func(n), or time = a for the constant model
+_SCALING_MODELS = (
+    ('constant', None),
+    ('log n', lambda n: math.log(n)),
+    ('n', lambda n: n),
+    ('n log n', lambda n: n * math.log(n)),
+    ('n^2', lambda n: n ** 2),
+)
+
+
+def _fit_scaling_model(func, points):
+    # Weighted least squares minimizing the relative error:
+    # sum(((y - model(x)) / y) ** 2)
+    weights = [1.0 / y ** 2 for x, y in points]
+    if func is None:
+        a = (math.fsum(w * y for w, (x, y) in zip(weights, points))
+             / math.fsum(weights))
+        coefs = (a, 0.0)
+    else:
+        xs = [func(x) for x, y in points]
+        sw = math.fsum(weights)
+        sx = math.fsum(w * x for w, x in zip(weights, xs))
+        sy = math.fsum(w * y for w, (x, y) in zip(weights, points))
+        sxx = math.fsum(w * x * x for w, x in zip(weights, xs))
+        sxy = math.fsum(w * x * y for w, x, (x2, y) in zip(weights, xs, points))
+        det = sw * sxx - sx * sx
+        if not det:
+            return None
+        b = (sw * sxy - sx * sy) / det
+        if b < 0:
+            # the time decreases with the input size: not a scaling model
+            return None
+        a = (sy - b * sx) / sw
+        coefs = (a, b)
+
+    residuals = []
+    for x, y in points:
+        model = coefs[0]
+        if func is not None:
+            model += coefs[1] * func(x)
+        residuals.append((model - y) / y)
+    return coefs, residuals
+
+
+def _scaling_groups(args, suite):
+    # Group benchmarks by prefix and other parameters:
+    # {key: [(size, bench), ...]}
+    groups = {}
+    order = []
+    for bench in suite.benchmarks:
+        name = bench.name or ''
+        params = perf._parse_params(name)
+        if params is None:
+            print("ERROR: benchmark %r has no parameter" % name,
+                  file=sys.stderr)
+            sys.exit(1)
+        param_names = [param for param, value in params]
+        param = args.param
+        if param is None:
+            if len(params) != 1:
+                print("ERROR: benchmarks have multiple parameters, "
+                      "use --param", file=sys.stderr)
+                sys.exit(1)
+            param = param_names[0]
+        if param not in param_names:
+            print("ERROR: benchmark %r has no parameter %s" % (name, param),
+                  file=sys.stderr)
+            sys.exit(1)
+
+        size = dict(params)[param]
+        try:
+            size = float(size)
+        except ValueError:
+            size = None
+        if size is None or size <= 0:
+            print("ERROR: benchmark %r: %s must be a positive number"
+                  % (name, param), file=sys.stderr)
+            sys.exit(1)
+
+        prefix = ''
+        if name.endswith(')') and '(' in name:
+            prefix = name[:name.index('(')]
+        others = [item for item in params if item[0] != param]
+        key = (param, prefix, perf._format_params(others))
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((size, bench))
+    return [(key, groups[key]) for key in order]
+
+
+def display_scaling(args, suite):
+    groups = _scaling_groups(args, suite)
+    for index, ((param, prefix, others), benchmarks) in enumerate(groups):
+        if index:
+            print()
+        title = ', '.join(text for text in (prefix, others) if text)
+        if title:
+            print(title)
+            print("=" * len(title))
+            print()
+
+        benchmarks.sort(key=lambda item: item[0])
+        points = [(size, bench._get_stats()['mean'])
+                  for size, bench in benchmarks]
+        if len(points) < 3:
+            print("ERROR: need at least 3 sizes to fit a model",
+                  file=sys.stderr)
+            sys.exit(1)
+
+        print("Parameter: %s" % param)
+        for (size, bench), (size, mean) in zip(benchmarks, points):
+            print("- %s: %s" % (bench.name, perf._format_timedelta(mean)))
+        print()
+
+        best = None
+        nvalue = len(points)
+        print("Models (relative RMS residual):")
+        for name, func in _SCALING_MODELS:
+            fit = _fit_scaling_model(func, points)
+            label = name.replace('n', param) if func is not None else name
+            if fit is None:
+                print("- %s: no fit" % label)
+                continue
+            coefs, residuals = fit
+            rss = math.fsum(residual ** 2 for residual in residuals)
+            rms = math.sqrt(rss / nvalue)
+            print("- %s: %.1f%%" % (label, rms * 100))
+
+            # Akaike information criterion: penalize the number of
+            # coefficients
+            ncoef = 1 if func is None else 2
+            aic = nvalue * math.log(max(rss / nvalue, 1e-12)) + 2 * ncoef
+            if best is None or aic < best[0]:
+                best = (aic, label, func, coefs, residuals)
+        print()
+
+        aic, label, func, coefs, residuals = best
+        a, b = coefs
+        if a >= 0:
+            formula = perf._format_timedelta(a)
+        else:
+            formula = '-%s' % perf._format_timedelta(-a)
+        if func is not None:
+            formula = '%s + %s * %s' % (formula, perf._format_timedelta(b),
+                                        label)
+        print("Best fit: %s (time = %s)" % (label, formula))
+        print("Residuals:")
+        for (size, bench), residual in zip(benchmarks, residuals):
+            print("- %s: %+.1f%%" % (bench.name, residual * 100))
+
+
+def _select_benchmark(args, filename, name_from_filename=True):
+    # Load the benchmark args.name of a file, or its only benchmark
+    suite = parse_results(filename, name_from_filename=name_from_filename)
+    if args.name is not None:
+        benchmarks = [bench for bench in suite.benchmarks
+                      if bench.name == args.name]
+        if not benchmarks:
+            print("ERROR: %s has no benchmark %r" % (filename, args.name),
+                  file=sys.stderr)
+            sys.exit(1)
+        return benchmarks[0]
+    if len(suite.benchmarks) != 1:
+        print("ERROR: %s contains multiple benchmarks, use --name"
+              % filename, file=sys.stderr)
+        sys.exit(1)
+    return suite.benchmarks[0]
+
+
+# Metadata which must be the same in all runs of merged files
+_MERGE_CHECKED_METADATA = ('cpu_model_name', 'python_implementation',
+                           'python_version')
+
+
+def _merge_runs(args, fp):
+    # Write the runs of input files into fp as a JSON benchmark. Only one
+    # input file is loaded at the same time.
+    # key => (value, filename) of the first run
+    reference = {}
+    # keys of metadata which already emitted a warning
+    warned = set()
+    name = None
+    failed_runs = []
+    nrun = 0
+
+    fp.write('{"version": 1, "results": {"runs": [')
+    for filename in args.filenames:
+        # an unnamed benchmark is not named after the first input file
+        bench = _select_benchmark(args, filename, name_from_filename=False)
+        if name is None:
+            name = bench.name
+
+        for run in bench.runs:
+            for key in _MERGE_CHECKED_METADATA:
+                value = run.metadata.get(key)
+                if value is None:
+                    continue
+                expected = reference.setdefault(key, (value, filename))
+                if value == expected[0]:
+                    continue
+                if args.force:
+                    # warn once per key
+                    if key not in warned:
+                        print("WARNING: %s: %s=%s differs from %s of %s"
+                              % ((filename, key, value) + expected),
+                              file=sys.stderr)
+                        warned.add(key)
+                else:
+                    print("ERROR: %s: %s=%s differs from %s of %s, "
+                          "use --force to merge anyway"
+                          % ((filename, key, value) + expected),
+                          file=sys.stderr)
+                    sys.exit(1)
+
+            if nrun:
+                fp.write(', ')
+            json.dump(run._as_json(), fp)
+            nrun += 1
+        failed_runs.extend(bench.failed_runs)
+
+    fp.write(']')
+    if name:
+        fp.write(', "name": ')
+        json.dump(name, fp)
+    if failed_runs:
+        fp.write(', "failed_runs": ')
+        json.dump(failed_runs, fp)
+    fp.write('}}\n')
+    return nrun
+
+
+def cmd_convert(args):
+    import perf.text_runner
+
+    if args.indexed:
+        bench = _select_benchmark(args, args.input_filename)
+        with open(args.output_filename, 'wb') as fp:
+            bench.dump_indexed(fp)
+    else:
+        suite = parse_results(args.input_filename)
+        with perf.text_runner._open_json_file(args.output_filename) as fp:
+            suite.json_dump_into(fp)
+
+
+def cmd_merge(args):
+    import perf.text_runner
+
+    output = os.path.abspath(args.output)
+    if any(os.path.abspath(filename) == output
+           for filename in args.filenames):
+        print("ERROR: the output file %s is also an input file"
+              % args.output, file=sys.stderr)
+        sys.exit(1)
+
+    # write into a temporary file and then rename it: don't leave a
+    # truncated file, nor destroy an existing output file, on error
+    tmp_filename = args.output + '.tmp'
+    fp = perf.text_runner._open_json_file(tmp_filename)
+    try:
+        with fp:
+            nrun = _merge_runs(args, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+    perf._replace_file(tmp_filename, args.output)
+    print("Merged %s of %s into %s"
+          % (perf._format_number(nrun, 'run'),
+             perf._format_number(len(args.filenames), 'file'),
+             args.output))
+
+
+def _trend_point(args, filename):
+    # Summary of a result file: (label, run means), the benchmark is not
+    # kept in memory to process hundreds of files
+    bench = _select_benchmark(args, filename)
+
+    means = [math.fsum(run.samples) / len(run.samples)
+             for run in bench.runs if run.samples]
+    if not means:
+        print("ERROR: %s has no sample" % filename, file=sys.stderr)
+        sys.exit(1)
+
+    if args.label:
+        label = bench.get_metadata().get(args.label)
+    else:
+        dates = [run.metadata['date'] for run in bench.runs
+                 if 'date' in run.metadata]
+        label = min(dates) if dates else None
+    return (label, means)
+
+
+def _segment_stats(stats, start, end):
+    # (count, mean, variance) of values of points[start:end] using the
+    # cumulative sums stats = (counts, sums, squares)
+    counts, sums, squares = stats
+    count = counts[end] - counts[start]
+    total = sums[end] - sums[start]
+    mean = total / count
+    sse = max(squares[end] - squares[start] - total * mean, 0.0)
+    return (count, mean, sse)
+
+
+def _detect_changepoints(points):
+    """Detect step changes of the mean in a series of points.
+
+    points is a list of lists of values (run means of a result file). Use
+    the PELT algorithm (Pruned Exact Linear Time, Killick et al. 2012) to
+    find changes of the mean between points, with a BIC penalty: the cost
+    of a segment is the sum of squared errors normalized by the noise
+    variance, estimated from the variance inside points.
+
+    Return the sorted list of indexes of points starting a new segment.
+    """
+    counts = [0]
+    sums = [0.0]
+    squares = [0.0]
+    within = 0.0
+    for values in points:
+        total = math.fsum(values)
+        square = math.fsum(value * value for value in values)
+        counts.append(counts[-1] + len(values))
+        sums.append(sums[-1] + total)
+        squares.append(squares[-1] + square)
+        within += max(square - total * total / len(values), 0.0)
+    stats = (counts, sums, squares)
+    npoint = len(points)
+    nvalue = counts[-1]
+
+    if nvalue > npoint:
+        variance = within / (nvalue - npoint)
+    else:
+        # one value per point: use the successive differences of points,
+        # insensitive to step changes
+        means = [values[0] for values in points]
+        diffs = [(y - x) ** 2 for x, y in zip(means, means[1:])]
+        variance = math.fsum(diffs) / (2 * len(diffs)) if diffs else 0.0
+    if not variance:
+        # no noise: any change of the mean is a step change
+        variance = 1e-300
+
+    def cost(start, end):
+        return _segment_stats(stats, start, end)[2] / variance
+
+    # each segment adds a mean parameter
+    penalty = 2 * math.log(max(nvalue, 2))
+    best = [-penalty]
+    previous = [0]
+    candidates = [0]
+    for end in range(1, npoint + 1):
+        totals = [(best[start] + cost(start, end) + penalty, start)
+                  for start in candidates]
+        total, start = min(totals)
+        best.append(total)
+        previous.append(start)
+        # pruning: a start which cannot be optimal anymore is dropped
+        candidates = [start for start_total, start in totals
+                      if start_total - penalty <= total]
+        candidates.append(end)
+
+    changes = []
+    end = npoint
+    while end:
+        end = previous[end]
+        if end:
+            changes.append(end)
+    changes.reverse()
+    return changes, stats
+
+
+def _significant_change(before, after):
+    # Welch's t-test on two segments of (count, mean, sse)
+    count1, mean1, sse1 = before
+    count2, mean2, sse2 = after
+    var1 = sse1 / (count1 - 1) if count1 > 1 else 0.0
+    var2 = sse2 / (count2 - 1) if count2 > 1 else 0.0
+    error = var1 / count1 + var2 / count2
+    if not error:
+        return (mean1 != mean2, None)
+    tscore = (mean2 - mean1) / math.sqrt(error)
+    df_num = error ** 2
+    df_den = 0.0
+    if count1 > 1:
+        df_den += (var1 / count1) ** 2 / (count1 - 1)
+    if count2 > 1:
+        df_den += (var2 / count2) ** 2 / (count2 - 1)
+    df = df_num / df_den if df_den else 1
+    return (abs(tscore) > perf._tdist95conf_level(max(df, 1)), tscore)
+
+
+def display_trend(args):
+    labels = []
+    points = []
+    for filename in args.filenames:
+        label, means = _trend_point(args, filename)
+        labels.append(label)
+        points.append(means)
+
+    nvalue = sum(len(means) for means in points)
+    print("Files: %s (%s)"
+          % (len(points), perf._format_number(nvalue, 'run')))
+
+    changes, stats = _detect_changepoints(points)
+    bounds = [0] + changes + [len(points)]
+    segments = [_segment_stats(stats, start, end)
+                for start, end in zip(bounds, bounds[1:])]
+
+    lines = []
+    for index, change in enumerate(changes):
+        before = segments[index]
+        after = segments[index + 1]
+        significant, tscore = _significant_change(before, after)
+        if not significant:
+            continue
+        text = perf._format_timedeltas((before[1], after[1]))
+        percent = (after[1] - before[1]) * 100.0 / before[1]
+        line = ("- %s (%s): %s -> %s: %+.1f%%"
+                % (args.filenames[change], labels[change] or '<no label>',
+                   text[0], text[1], percent))
+        if tscore is not None:
+            line += " (t=%.2f)" % tscore
+        lines.append(line)
+
+    if lines:
+        print("Step changes:")
+        for line in lines:
+            print(line)
+    else:
+        print("No significant step change")
+
+
+def cmd_bench_command(cmd_args):
+    import perf.text_runner
+
+    runner = perf.text_runner.TextRunner()
+    runner.program_args = (sys.executable, '-m', 'perf', 'command')
+    parser = runner.argparser
+    parser.prog = '-m perf command'
+    parser.description = 'Benchmark a command'
+    parser.add_argument('--name', help='benchmark name')
+    parser.add_argument('program',
+                        help='program (use -- to separate perf options '
+                             'from the command)')
+    parser.add_argument('program_args', nargs=argparse.REMAINDER,
+                        help='program arguments')
+    runner.parse_args(cmd_args)
+    runner.name = runner.args.name
+
+    command = [runner.args.program] + runner.args.program_args
+
+    def prepare_args(runner, args):
+        if runner.args.name:
+            args.append('--name=%s' % runner.args.name)
+        args.append('--')
+        args.extend(command)
+    runner.prepare_subprocess_args = prepare_args
+
+    try:
+        runner.bench_command(command)
+    except RuntimeError as exc:
+        print("ERROR: %s" % exc, file=sys.stderr)
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == 'command':
+        # TextRunner options are not known by the perf CLI parser
+        cmd_bench_command(sys.argv[2:])
+        return
+
     parser = create_parser()
     args = parser.parse_args()
     action = args.action
     if action == 'show':
-        result = parse_results(args.filename)
-        display_result(args, result)
+        if args.verbose > 1:
+            # runs are displayed: the summary is not enough
+            args.cache = False
+        benchmarks = load_benchmarks(args, args.filename)
+        _display_benchmarks(benchmarks, display_result, args)
     elif action in ('compare', 'compare_to'):
-        ref_result = parse_results(args.ref_filename, '<file#1>')
-        results = [ref_result]
-        for index, filename in enumerate(args.changed_filenames, 2):
-            result = parse_results(filename, '<file#%s>' % index)
-            results.append(result)
+        filenames = [args.ref_filename] + args.changed_filenames
+        results = load_all_benchmarks(args, filenames)
+        if len(results) < 2:
+            print("ERROR: need at least two benchmarks to compare",
+                  file=sys.stderr)
+            sys.exit(1)
         compare_results(args, results, action == 'compare')
     elif action == 'hist':
-        result = parse_results(args.filename)
-        display_histogram_text(args, result)
+        suite = parse_results(args.filename)
+        _display_benchmarks(suite.benchmarks, display_histogram_text, args)
     elif action == 'hist_scipy':
-        result = parse_results(args.filename)
-        display_histogram_scipy(args, result)
+        suite = parse_results(args.filename)
+        _display_benchmarks(suite.benchmarks, display_histogram_scipy, args)
     elif action == 'stats':
-        result = parse_results(args.filename)
-        display_stats(args, result)
+        suite = parse_results(args.filename)
+        _display_benchmarks(suite.benchmarks, display_stats, args)
+    elif action == 'scaling':
+        suite = parse_results(args.filename)
+        display_scaling(args, suite)
+    elif action == 'convert':
+        cmd_convert(args)
+    elif action == 'merge':
+        cmd_merge(args)
+    elif action == 'trend':
+        display_trend(args)
+    elif action == 'db' and args.db_action:
+        from perf import _db
+        _db.cmd_db(args)
     else:
         parser.print_usage()
         sys.exit(1)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Cache of summaries of result files.
+
+The summary of the benchmarks of a result file is stored in a small sidecar
+file, next to the result file: ``.result.json.summary`` for ``result.json``.
+The summary is used as long as the path, the size and the modification time
+of the result file are unchanged, so commands like ``compare_to`` run many
+times on the same reference file don't parse the whole file again.
+"""
+import json
+import os
+
+import perf
+
+
+_CACHE_VERSION = 2
+
+
+class BenchmarkSummary:
+    """Summary of a benchmark: replace a perf.Benchmark to display or
+    compare benchmarks, but samples and runs are not available."""
+
+    def __init__(self, name, metadata, nrun, nsample, nwarmup, stats,
+                 percentiles):
+        self.name = name
+        self._metadata = metadata
+        self._nrun = nrun
+        # number of samples and warmups per run, None if runs are different
+        self._nsample = nsample
+        self._nwarmup = nwarmup
+        self._stats = stats
+        # list of (percentile, value) tuples
+        self._percentiles = percentiles
+
+    @classmethod
+    def from_benchmark(cls, bench):
+        nsample, nwarmup = bench._get_iterations()
+        return cls(bench.name, bench.get_metadata(), len(bench.runs),
+                   nsample, nwarmup, bench._get_stats(),
+                   bench._get_percentiles())
+
+    def _as_json(self):
+        return {'name': self.name,
+                'metadata': self._metadata,
+                'nrun': self._nrun,
+                'nsample': self._nsample,
+                'nwarmup': self._nwarmup,
+                'stats': self._stats,
+                'percentiles': self._percentiles}
+
+    @classmethod
+    def _json_load(cls, data):
+        percentiles = [tuple(item) for item in data['percentiles']]
+        return cls(data['name'], data['metadata'], data['nrun'],
+                   data['nsample'], data['nwarmup'], data['stats'],
+                   percentiles)
+
+    def get_metadata(self):
+        return dict(self._metadata)
+
+    def _get_stats(self):
+        return self._stats
+
+    def _get_percentiles(self):
+        return self._percentiles
+
+    def _get_throughput(self):
+        return perf._get_throughput(self._metadata)
+
+    def _format_sample(self, sample, verbose=False):
+        return perf._format_stats(sample, None, sample, sample, verbose)
+
+    def format(self, verbose=0):
+        stats = self._stats
+        text = perf._format_stats(stats['mean'], stats['stdev'],
+                                  stats['min'], stats['max'], verbose,
+                                  self._get_throughput())
+        if verbose:
+            iterations = perf._format_iterations(self._nrun, self._nsample,
+                                                 self._nwarmup)
+            if iterations:
+                text = '%s (%s)' % (text, iterations)
+        return text
+
+    def __str__(self):
+        text = self.format()
+        if self.name:
+            text = '%s: %s' % (self.name, text)
+        return text
+
+
+def cache_filename(filename):
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(dirname, '.%s.summary' % basename)
+
+
+def _cache_key(filename):
+    st = os.stat(filename)
+    return {'path': os.path.abspath(filename),
+            'size': st.st_size,
+            'mtime': st.st_mtime}
+
+
+def _read_cache(filename, key):
+    try:
+        with open(cache_filename(filename)) as fp:
+            data = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+    if (not isinstance(data, dict)
+       or data.get('version') != _CACHE_VERSION
+       or data.get('key') != key):
+        return None
+    try:
+        return [BenchmarkSummary._json_load(item)
+                for item in data['benchmarks']]
+    except (KeyError, TypeError):
+        return None
+
+
+def _write_cache(filename, key, summaries):
+    data = {'version': _CACHE_VERSION,
+            'key': key,
+            'benchmarks': [summary._as_json() for summary in summaries]}
+    path = cache_filename(filename)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp)
+        perf._replace_file(tmp_path, path)
+    except (IOError, OSError):
+        # the cache is optional: ignore read-only directories
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def load_summaries(filename, load_func):
+    """Get the summaries of the benchmarks of a result file.
+
+    load_func(filename) is called to load a BenchmarkSuite if the cache
+    is missing or outdated. Return a list of BenchmarkSummary objects.
+    """
+    try:
+        key = _cache_key(filename)
+    except OSError:
+        key = None
+    if key is not None:
+        summaries = _read_cache(filename, key)
+        if summaries is not None:
+            return summaries
+
+    suite = load_func(filename)
+    summaries = [BenchmarkSummary.from_benchmark(bench)
+                 for bench in suite.benchmarks]
+    if key is not None:
+        _write_cache(filename, key, summaries)
+    return summaries
@@ -0,0 +1,299 @@
+"""History of benchmark results stored in a SQLite database.
+
+Result files are ingested once: queries use the summaries (mean, standard
+deviation, etc.) of benchmarks and runs stored in indexed tables, without
+parsing JSON again. Raw samples are only stored on demand.
+"""
+from __future__ import print_function
+import array
+import datetime
+import os
+import sqlite3
+import sys
+
+import perf
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS benchmarks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    date TEXT,
+    nrun INTEGER NOT NULL,
+    nsample INTEGER NOT NULL,
+    mean REAL,
+    stdev REAL,
+    min REAL,
+    max REAL
+);
+CREATE INDEX IF NOT EXISTS benchmarks_name_date ON benchmarks (name, date);
+CREATE INDEX IF NOT EXISTS benchmarks_date ON benchmarks (date);
+CREATE UNIQUE INDEX IF NOT EXISTS benchmarks_filename_name
+    ON benchmarks (filename, name);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    benchmark_id INTEGER NOT NULL REFERENCES benchmarks (id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metadata_key_value ON metadata (key, value);
+CREATE INDEX IF NOT EXISTS metadata_benchmark ON metadata (benchmark_id);
+
+CREATE TABLE IF NOT EXISTS runs (
+    benchmark_id INTEGER NOT NULL REFERENCES benchmarks (id),
+    run_index INTEGER NOT NULL,
+    date TEXT,
+    loops INTEGER,
+    nsample INTEGER NOT NULL,
+    mean REAL,
+    stdev REAL,
+    min REAL,
+    max REAL,
+    -- raw samples: little endian float64 array, or NULL
+    samples BLOB
+);
+CREATE INDEX IF NOT EXISTS runs_benchmark ON runs (benchmark_id);
+"""
+
+
+def _summary(samples):
+    # (mean, stdev, min, max) of samples
+    if not samples:
+        return (None, None, None, None)
+    statistics = perf._import_statistics()
+    mean = statistics.mean(samples)
+    if len(samples) > 1:
+        stdev = statistics.stdev(samples)
+    else:
+        stdev = None
+    return (mean, stdev, min(samples), max(samples))
+
+
+def _samples_blob(samples):
+    samples = array.array('d', samples)
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    if perf._PY3:
+        return samples.tobytes()
+    else:
+        return buffer(samples.tostring())
+
+
+def _blob_samples(blob):
+    samples = array.array('d')
+    if perf._PY3:
+        samples.frombytes(blob)
+    else:
+        samples.fromstring(bytes(blob))
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    return samples.tolist()
+
+
+def connect(filename):
+    """Open the database, create tables if needed."""
+    db = sqlite3.connect(filename)
+    db.executescript(_SCHEMA)
+    return db
+
+
+def _bench_date(bench):
+    dates = [run.metadata.get('date') for run in bench.runs]
+    dates = [date for date in dates if date]
+    if not dates:
+        return None
+    return min(dates)
+
+
+def add_benchmark(db, bench, filename, store_samples=False):
+    """Add a benchmark loaded from filename.
+
+    A benchmark already added from the same file is replaced.
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT id FROM benchmarks WHERE filename=? AND name=?",
+                   (filename, bench.name))
+    row = cursor.fetchone()
+    if row is not None:
+        bench_id = row[0]
+        cursor.execute("DELETE FROM runs WHERE benchmark_id=?", (bench_id,))
+        cursor.execute("DELETE FROM metadata WHERE benchmark_id=?",
+                       (bench_id,))
+        cursor.execute("DELETE FROM benchmarks WHERE id=?", (bench_id,))
+
+    samples = bench.get_samples()
+    nsample = len(samples)
+    cursor.execute("INSERT INTO benchmarks (name, filename, date, nrun, "
+                   "nsample, mean, stdev, min, max) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   (bench.name, filename, _bench_date(bench),
+                    len(bench.runs), nsample) + _summary(samples))
+    bench_id = cursor.lastrowid
+
+    metadata = bench.get_metadata()
+    cursor.executemany("INSERT INTO metadata (benchmark_id, key, value) "
+                       "VALUES (?, ?, ?)",
+                       [(bench_id, key, value)
+                        for key, value in sorted(metadata.items())])
+
+    rows = []
+    for index, run in enumerate(bench.runs):
+        if store_samples:
+            blob = _samples_blob(run.samples)
+        else:
+            blob = None
+        rows.append((bench_id, index, run.metadata.get('date'), run.loops,
+                     len(run.samples)) + _summary(run.samples) + (blob,))
+    cursor.executemany("INSERT INTO runs (benchmark_id, run_index, date, "
+                       "loops, nsample, mean, stdev, min, max, samples) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       rows)
+    return bench_id
+
+
+def _clauses(name=None, days=None, metadata=()):
+    # Build the conditions of a query on the benchmarks table:
+    # (clauses, params)
+    clauses = []
+    params = []
+    if name is not None:
+        clauses.append("name=?")
+        params.append(name)
+    if days is not None:
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+        clauses.append("date>=?")
+        params.append(since.isoformat().split('.', 1)[0])
+    for key, value in metadata:
+        clauses.append("id IN (SELECT benchmark_id FROM metadata "
+                       "WHERE key=? AND value=?)")
+        params.extend((key, value))
+    return (clauses, params)
+
+
+def _where(name=None, days=None, metadata=()):
+    # Build the WHERE clause of a query on the benchmarks table
+    clauses, params = _clauses(name, days, metadata)
+    if clauses:
+        return (" WHERE " + " AND ".join(clauses), params)
+    else:
+        return ("", params)
+
+
+def history(db, name, days=None, metadata=()):
+    """Time series of a benchmark ordered by date.
+
+    Return a list of (date, mean, stdev, nrun, filename) tuples.
+    """
+    where, params = _where(name, days, metadata)
+    cursor = db.execute("SELECT date, mean, stdev, nrun, filename "
+                        "FROM benchmarks" + where + " ORDER BY date, id",
+                        params)
+    return cursor.fetchall()
+
+
+def summary(db, days=None, metadata=()):
+    """Summary of each benchmark.
+
+    Return a list of (name, nresult, first_date, last_date, min_mean,
+    max_mean, last_mean) tuples sorted by name.
+    """
+    where, params = _where(None, days, metadata)
+    # the last result of a benchmark is the last row of history(): the
+    # subquery uses the (name, date) index
+    clauses, last_params = _clauses(None, days, metadata)
+    last_where = " AND ".join(["name=benchmarks.name"] + clauses)
+    cursor = db.execute("SELECT name, COUNT(*), MIN(date), MAX(date), "
+                        "MIN(mean), MAX(mean), "
+                        "(SELECT mean FROM benchmarks AS last "
+                        "WHERE " + last_where +
+                        " ORDER BY date DESC, id DESC LIMIT 1) "
+                        "FROM benchmarks" + where +
+                        " GROUP BY name ORDER BY name",
+                        last_params + params)
+    return [tuple(row) for row in cursor]
+
+
+def run_samples(db, name, days=None, metadata=()):
+    """Raw samples of the runs of a benchmark stored with store_samples.
+
+    Return a list of (date, samples) tuples ordered by date.
+    """
+    where, params = _where(name, days, metadata)
+    cursor = db.execute("SELECT runs.date, runs.samples FROM runs "
+                        "WHERE samples IS NOT NULL AND benchmark_id IN "
+                        "(SELECT id FROM benchmarks" + where + ") "
+                        "ORDER BY runs.date, runs.benchmark_id, "
+                        "runs.run_index",
+                        params)
+    return [(date, _blob_samples(blob)) for date, blob in cursor]
+
+
+def _parse_metadata_filters(args):
+    filters = []
+    for arg in args.metadata_filter:
+        key, sep, value = arg.partition('=')
+        if not sep or not key:
+            print("ERROR: invalid --metadata %r: expected KEY=VALUE" % arg,
+                  file=sys.stderr)
+            sys.exit(1)
+        filters.append((key, value))
+    return filters
+
+
+def _format_mean(mean, stdev):
+    if mean is None:
+        return '<no sample>'
+    if stdev is None:
+        return perf._format_timedelta(mean)
+    return '%s +- %s' % perf._format_timedeltas((mean, stdev))
+
+
+def cmd_db(args):
+    if args.db_action == 'add':
+        from perf.__main__ import parse_results
+
+        db = connect(args.database)
+        with db:
+            for filename in args.filenames:
+                # the name must not depend on the filename to follow a
+                # benchmark across result files
+                suite = parse_results(filename, args.name,
+                                      name_from_filename=False)
+                # the absolute path identifies a result file
+                path = os.path.abspath(filename)
+                for bench in suite.benchmarks:
+                    add_benchmark(db, bench, path, args.samples)
+                print("Add %s: %s"
+                      % (filename,
+                         perf._format_number(len(suite.benchmarks),
+                                             'benchmark')))
+        return
+
+    if not os.path.exists(args.database):
+        print("ERROR: database %s doesn't exist" % args.database,
+              file=sys.stderr)
+        sys.exit(1)
+    db = connect(args.database)
+    metadata = _parse_metadata_filters(args)
+
+    if args.db_action == 'history':
+        rows = history(db, args.name, args.days, metadata)
+        if not rows:
+            print("ERROR: no result for the benchmark %s" % args.name,
+                  file=sys.stderr)
+            sys.exit(1)
+        for date, mean, stdev, nrun, filename in rows:
+            print("%s: %s (%s) [%s]"
+                  % (date or '<no date>', _format_mean(mean, stdev),
+                     perf._format_number(nrun, 'run'), filename))
+    elif args.db_action == 'summary':
+        for row in summary(db, args.days, metadata):
+            name, nresult, first, last, min_mean, max_mean, last_mean = row
+            print("%s: %s, %s .. %s"
+                  % (name, perf._format_number(nresult, 'result'),
+                     first or '<no date>', last or '<no date>'))
+            if last_mean is not None:
+                print("    last: %s; min: %s; max: %s"
+                      % perf._format_timedeltas((last_mean, min_mean,
+                                                 max_mean)))
@@ -0,0 +1,249 @@
+"""Run-indexed binary format of benchmarks.
+
+Layout of a file::
+
+    magic
+    run records: RunResult._binary() of each run
+    footer: JSON (name, common metadata, failed runs)
+    index: one entry per run (offset and summary of the run)
+    trailer: offset and size of the footer, number of runs, magic
+
+The file is opened with mmap: the number of runs, the summary of each run
+and the common metadata are read without decoding samples, and runs are
+only decoded when accessed.
+"""
+import json
+import math
+import mmap
+import struct
+
+import perf
+from perf import _sketch
+
+
+_MAGIC = b'PRFIDX01'
+# offset and size of the run record, number of warmups and samples, loops
+# and inner_loops (0 means None), mean, sum of squared deviations, minimum
+# and maximum of samples
+_INDEX_ENTRY = struct.Struct('<QIIIQQdddd')
+# offset and size of the footer, number of runs
+_TRAILER = struct.Struct('<QIQ')
+
+
+def _run_summary(run):
+    samples = run.samples
+    if samples:
+        mean = math.fsum(samples) / len(samples)
+        sse = math.fsum((sample - mean) ** 2 for sample in samples)
+        return (mean, sse, min(samples), max(samples))
+    else:
+        nan = float('nan')
+        return (nan, nan, nan, nan)
+
+
+def dump(bench, fp):
+    """Write bench into the binary file fp."""
+    fp.write(_MAGIC)
+    offset = len(_MAGIC)
+    entries = []
+    for run in bench.runs:
+        record = run._binary(sketch=True)
+        fp.write(record)
+        entries.append(_INDEX_ENTRY.pack(offset, len(record),
+                                         len(run.warmups), len(run.samples),
+                                         run.loops or 0,
+                                         run.inner_loops or 0,
+                                         *_run_summary(run)))
+        offset += len(record)
+
+    footer = {'metadata': perf._common_metadata([run.metadata
+                                                 for run in bench.runs])}
+    if bench.name:
+        footer['name'] = bench.name
+    if bench.failed_runs:
+        footer['failed_runs'] = bench.failed_runs
+    footer = json.dumps(footer).encode('utf-8')
+    fp.write(footer)
+    fp.write(b''.join(entries))
+    fp.write(_TRAILER.pack(offset, len(footer), len(entries)))
+    fp.write(_MAGIC)
+
+
+class IndexedRuns:
+    """Read-only sequence of the runs of a binary file.
+
+    Runs are decoded on demand: iterating on runs only keeps one run in
+    memory.
+    """
+
+    def __init__(self, data, index_offset, nrun):
+        self._data = data
+        self._index_offset = index_offset
+        self._nrun = nrun
+
+    def __len__(self):
+        return self._nrun
+
+    def _entry(self, index):
+        if index < 0:
+            index += self._nrun
+        if not(0 <= index < self._nrun):
+            raise IndexError("run index out of range")
+        pos = self._index_offset + index * _INDEX_ENTRY.size
+        return _INDEX_ENTRY.unpack_from(self._data, pos)
+
+    def get_summary(self, index):
+        """Summary of a run read from the index, samples are not decoded.
+
+        Return a dictionary with the keys: nwarmup, nsample, loops,
+        inner_loops, mean, sse, min, max.
+        """
+        entry = self._entry(index)
+        return {'nwarmup': entry[2],
+                'nsample': entry[3],
+                'loops': entry[4] or None,
+                'inner_loops': entry[5] or None,
+                'mean': entry[6],
+                'sse': entry[7],
+                'min': entry[8],
+                'max': entry[9]}
+
+    def get_sketch(self, index):
+        """Quantile sketch of a run, samples are not decoded."""
+        offset = self._entry(index)[0]
+        # skip the magic and the size of the record
+        pos = offset + len(perf._BINARY_MAGIC) + 4
+        header_size = struct.unpack_from('<I', self._data, pos)[0]
+        pos += 12
+        header = json.loads(self._data[pos:pos + header_size].decode('utf-8'))
+        return _sketch.QuantileSketch._json_load(header['sketch'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[item] for item in range(*index.indices(self._nrun))]
+        offset, size = self._entry(index)[:2]
+        return perf.RunResult._binary_load(self._data[offset:offset + size])
+
+    def __iter__(self):
+        for index in range(self._nrun):
+            yield self[index]
+
+
+class IndexedBenchmark(perf.Benchmark):
+    """Benchmark loaded from a binary file: runs is an IndexedRuns
+    sequence, statistics are computed from the index."""
+
+    def __init__(self, runs, name, metadata):
+        perf.Benchmark.__init__(self, runs=runs, name=name)
+        self._metadata = metadata
+
+    def get_metadata(self):
+        metadata = dict(self._metadata)
+        if self.failed_runs:
+            metadata['failed_runs'] = str(len(self.failed_runs))
+        return metadata
+
+    def _summaries(self):
+        runs = self.runs
+        return [runs.get_summary(index) for index in range(len(runs))]
+
+    def _get_iterations(self):
+        summaries = self._summaries()
+        nsample = summaries[0]['nsample']
+        warmup = summaries[0]['nwarmup']
+        for summary in summaries:
+            if nsample is not None and nsample != summary['nsample']:
+                nsample = None
+            if warmup is not None and warmup != summary['nwarmup']:
+                warmup = None
+        return (nsample, warmup)
+
+    def _get_stats(self):
+        summaries = [summary for summary in self._summaries()
+                     if summary['nsample']]
+        nsample = sum(summary['nsample'] for summary in summaries)
+        if not nsample:
+            raise ValueError("Benchmark has no sample")
+        mean = math.fsum(summary['nsample'] * summary['mean']
+                         for summary in summaries) / nsample
+        # combine the sum of squared deviations of runs
+        sse = math.fsum(summary['sse']
+                        + summary['nsample'] * (summary['mean'] - mean) ** 2
+                        for summary in summaries)
+        if nsample > 1:
+            stdev = math.sqrt(sse / (nsample - 1))
+        else:
+            stdev = None
+
+        shortest = None
+        for summary in summaries:
+            factor = (summary['loops'] or 1) * (summary['inner_loops'] or 1)
+            raw = summary['min'] * factor
+            if shortest is None or raw < shortest:
+                shortest = raw
+        return {'nsample': nsample, 'mean': mean, 'stdev': stdev,
+                'sse': sse,
+                'min': min(summary['min'] for summary in summaries),
+                'max': max(summary['max'] for summary in summaries),
+                'shortest_raw': shortest}
+
+    def _get_percentiles(self):
+        sketch = _sketch.QuantileSketch()
+        for index in range(len(self.runs)):
+            sketch.merge(self.runs.get_sketch(index))
+        return sketch.percentiles()
+
+    def _get_throughput(self):
+        return perf._get_throughput(self._metadata)
+
+    def _format_sample(self, sample, verbose=False):
+        return perf._format_stats(sample, None, sample, sample, verbose)
+
+    def format(self, verbose=0):
+        if not self.runs:
+            return '<no run>'
+        stats = self._get_stats()
+        text = perf._format_stats(stats['mean'], stats['stdev'],
+                                  stats['min'], stats['max'], verbose,
+                                  self._get_throughput())
+        if verbose:
+            nsample, warmup = self._get_iterations()
+            iterations = perf._format_iterations(len(self.runs), nsample,
+                                                 warmup)
+            if iterations:
+                text = '%s (%s)' % (text, iterations)
+        return text
+
+
+def is_indexed(fp):
+    """Check if the binary file fp starts with the magic header.
+
+    The file position is restored."""
+    pos = fp.tell()
+    magic = fp.read(len(_MAGIC))
+    fp.seek(pos)
+    return (magic == _MAGIC)
+
+
+def load(fp):
+    """Load a benchmark from the binary file fp: return an
+    IndexedBenchmark."""
+    data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    size = len(data)
+    magic_size = len(_MAGIC)
+    if (size < 2 * magic_size + _TRAILER.size
+       or data[:magic_size] != _MAGIC
+       or data[size - magic_size:] != _MAGIC):
+        raise ValueError("invalid run-indexed file")
+
+    pos = size - magic_size - _TRAILER.size
+    footer_offset, footer_size, nrun = _TRAILER.unpack_from(data, pos)
+    index_offset = footer_offset + footer_size
+    if index_offset + nrun * _INDEX_ENTRY.size != pos:
+        raise ValueError("truncated run-indexed file")
+    footer = json.loads(data[footer_offset:index_offset].decode('utf-8'))
+
+    runs = IndexedRuns(data, index_offset, nrun)
+    bench = IndexedBenchmark(runs, footer.get('name'), footer['metadata'])
+    bench.failed_runs.extend(footer.get('failed_runs', ()))
+    return bench
@@ -0,0 +1,152 @@
+"""System load sampling.
+
+The load average is read from /proc/loadavg and CPU times from /proc/stat,
+so sampling is only available on Linux. The CPU usage of other processes is
+the busy time of the CPUs (all CPUs, or the CPUs the benchmark is pinned to)
+minus the CPU time of the current process and of its terminated child
+processes, divided by the elapsed CPU time.
+
+The CPU time of a child process is only known once the child has been
+waited: child processes still running when a run completes, like the
+workers of a process pool, are not excluded and are counted as other
+processes.
+"""
+import os
+import time
+
+import perf
+
+
+# Interval in seconds between two samples of CPU times to measure the
+# CPU usage of an idle process
+_WAIT_INTERVAL = 0.5
+
+
+def read_load_avg():
+    """Read the load average of the last minute: float, or None if
+    /proc/loadavg is not available."""
+    try:
+        with open('/proc/loadavg') as fp:
+            return float(fp.readline().split()[0])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def _clock_ticks():
+    try:
+        return os.sysconf('SC_CLK_TCK')
+    except (AttributeError, ValueError, OSError):
+        return 100
+
+
+def read_cpu_times(cpus=None):
+    """Read (busy, total) CPU times in seconds of /proc/stat.
+
+    cpus is a list of CPU numbers, or None for all CPUs. Return None if
+    /proc/stat is not available.
+    """
+    if cpus is not None:
+        names = set('cpu%s' % cpu for cpu in cpus)
+    else:
+        names = set(('cpu',))
+    busy = 0
+    total = 0
+    found = False
+    try:
+        with open('/proc/stat') as fp:
+            for line in fp:
+                fields = line.split()
+                if not fields or fields[0] not in names:
+                    continue
+                # user, nice, system, idle, iowait, irq, softirq, steal:
+                # guest times are already included in user times
+                times = [int(field) for field in fields[1:9]]
+                idle = times[3] + times[4]
+                busy += sum(times) - idle
+                total += sum(times)
+                found = True
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    if not found:
+        return None
+    ticks = float(_clock_ticks())
+    return (busy / ticks, total / ticks)
+
+
+def _process_time():
+    # user and system times of the process and of its waited children
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def cpu_usage(before, after, own_time=0.0):
+    """CPU usage in percent between two read_cpu_times() results, excluding
+    own_time seconds of CPU time of the current process. Return None if
+    CPU times are not available."""
+    if before is None or after is None:
+        return None
+    total = after[1] - before[1]
+    if total <= 0:
+        return None
+    busy = after[0] - before[0] - own_time
+    return max(busy, 0.0) * 100.0 / total
+
+
+class LoadSampler:
+    """Sample the system load around a run.
+
+    start() must be called before the run, and stop() after the run to
+    store the load average and the CPU usage of other processes into
+    metadata.
+    """
+
+    def __init__(self, cpus=None):
+        self.cpus = cpus
+        self._load_avg = None
+        self._cpu_times = None
+        self._process_time = None
+
+    def start(self):
+        self._load_avg = read_load_avg()
+        self._process_time = _process_time()
+        self._cpu_times = read_cpu_times(self.cpus)
+
+    def stop(self, metadata):
+        cpu_times = read_cpu_times(self.cpus)
+        own_time = _process_time() - self._process_time
+        if self._load_avg is not None:
+            metadata['load_avg_1min'] = '%.2f' % self._load_avg
+        usage = cpu_usage(self._cpu_times, cpu_times, own_time)
+        if usage is not None:
+            metadata['cpu_usage_others'] = '%.1f%%' % usage
+
+
+def get_cpu_usage_others(metadata):
+    """Get the CPU usage of other processes in percent of run metadata,
+    or None."""
+    value = metadata.get('cpu_usage_others')
+    if not value:
+        return None
+    try:
+        return float(value.rstrip('%'))
+    except ValueError:
+        return None
+
+
+def wait_quiet(threshold, cpus=None, timeout=None, interval=_WAIT_INTERVAL):
+    """Wait until the CPU usage of cpus is lower than threshold percent.
+
+    Give up after timeout seconds if timeout is set. Return a (usage,
+    elapsed) tuple: last measured CPU usage (None if CPU times are not
+    available) and time spent to wait in seconds.
+    """
+    start = perf.monotonic_clock()
+    while True:
+        before = read_cpu_times(cpus)
+        time.sleep(interval)
+        usage = cpu_usage(before, read_cpu_times(cpus))
+        elapsed = perf.monotonic_clock() - start
+        if usage is None or usage < threshold:
+            return (usage, elapsed)
+        if timeout is not None and elapsed >= timeout:
+            return (usage, elapsed)
@@ -0,0 +1,142 @@
+"""Mergeable quantile sketch.
+
+Values are counted in buckets of exponentially growing width (DDSketch,
+Masson et al. 2019): the bucket of a value x is ceil(log(x, gamma)) with
+gamma = (1 + accuracy) / (1 - accuracy), so a quantile is estimated with a
+relative error smaller than accuracy. The memory is bounded by the range of
+values: with the default accuracy of 1%, values from 1 ns to 1000 sec fit
+in less than 1,400 buckets. Sketches with the same accuracy are merged by
+adding the counts of their buckets.
+"""
+import math
+
+import perf
+
+
+# Default relative accuracy of quantiles
+DEFAULT_ACCURACY = 0.01
+
+# Percentiles reported by perf
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class QuantileSketch:
+    def __init__(self, accuracy=DEFAULT_ACCURACY):
+        if not(0.0 < accuracy < 1.0):
+            raise ValueError("accuracy must be in the range ]0; 1[")
+        self.accuracy = accuracy
+        self._gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # number of values
+        self.count = 0
+        # number of values equal to zero
+        self._zero = 0
+        # bucket index => number of values
+        self._buckets = {}
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value):
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def add(self, value, count=1):
+        if value < 0:
+            raise ValueError("value must be >= 0")
+        if value:
+            index = self._bucket(value)
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        else:
+            self._zero += count
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Add the values of the other sketch."""
+        if other.accuracy != self.accuracy:
+            raise ValueError("cannot merge sketches with "
+                             "a different accuracy")
+        if not other.count:
+            return
+        buckets = self._buckets
+        for index, count in other._buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+        self._zero += other._zero
+        self.count += other.count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+
+    def quantile(self, quantile):
+        """Estimate the quantile (in the range [0; 1]) of values."""
+        if not self.count:
+            raise ValueError("empty sketch")
+        if not(0.0 <= quantile <= 1.0):
+            raise ValueError("quantile must be in the range [0; 1]")
+        # nearest-rank method, tolerate rounding errors of the product
+        rank = max(int(math.ceil(quantile * self.count - 1e-9)), 1)
+        # the minimum and the maximum are exact
+        if rank == 1:
+            return self.min
+        if rank == self.count:
+            return self.max
+
+        total = self._zero
+        if total >= rank:
+            return 0.0
+        for index in sorted(self._buckets):
+            total += self._buckets[index]
+            if total >= rank:
+                # middle of the bucket ]gamma^(index-1); gamma^index]
+                value = 2.0 * self._gamma ** index / (self._gamma + 1.0)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentiles(self, percentiles=PERCENTILES):
+        """Return a list of (percentile, value) tuples."""
+        return [(percentile, self.quantile(percentile / 100.0))
+                for percentile in percentiles]
+
+    def _as_json(self):
+        data = {'accuracy': self.accuracy,
+                'buckets': sorted(self._buckets.items())}
+        if self.count:
+            data['min'] = self.min
+            data['max'] = self.max
+        if self._zero:
+            data['zero'] = self._zero
+        return data
+
+    @classmethod
+    def _json_load(cls, data):
+        sketch = cls(data['accuracy'])
+        sketch._buckets = dict((index, count)
+                               for index, count in data['buckets'])
+        sketch._zero = data.get('zero', 0)
+        sketch.count = sketch._zero + sum(sketch._buckets.values())
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+
+def format_percentiles(percentiles):
+    """Format a list of (percentile, value) tuples of timedeltas."""
+    values = [value for percentile, value in percentiles]
+    values = perf._format_timedeltas(values)
+    return ', '.join('p%s: %s' % (_format_percentile(percentile), value)
+                     for (percentile, _), value in zip(percentiles, values))
+
+
+def _format_percentile(percentile):
+    if percentile == int(percentile):
+        return '%s' % int(percentile)
+    return '%s' % percentile
+
@@ -0,0 +1,202 @@
+"""Supervise worker child processes.
+
+A single loop reads stdout and stderr of one or more worker processes
+without blocking: stdout is buffered, stderr is forwarded while the worker is
+running and only its tail is kept in memory. Workers which exceed their
+timeout are killed.
+
+If a result pipe is used, stdout is merged into stderr and the result is read
+from the pipe.
+"""
+from __future__ import print_function
+import codecs
+import errno
+import os
+import select
+import subprocess
+import sys
+import time
+
+import perf
+
+
+# Number of bytes of stderr kept in memory to report errors
+_STDERR_TAIL = 64 * 1024
+_READ_SIZE = 64 * 1024
+
+
+class WorkerProcess:
+    def __init__(self, args, timeout=None, stderr_file=None, result_fd=None,
+                 **kwargs):
+        self.args = args
+        self.timeout = timeout
+        # file where stderr is written while the worker is running,
+        # None to only keep the tail of stderr
+        self.stderr_file = stderr_file
+        self.timed_out = False
+
+        self._stdout = []
+        self._stderr_tail = b''
+        # read end of the pipe used by the worker to send its result
+        self._result_fd = result_fd
+        self._result = []
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        if timeout is not None:
+            self._deadline = perf.monotonic_clock() + timeout
+        else:
+            self._deadline = None
+
+        if result_fd is not None:
+            # stdout is free for the benchmark: merge it into stderr
+            stderr = subprocess.STDOUT
+        else:
+            stderr = subprocess.PIPE
+        self.proc = subprocess.Popen(args,
+                                     stdout=subprocess.PIPE,
+                                     stderr=stderr,
+                                     **kwargs)
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+    @property
+    def stdout(self):
+        return b''.join(self._stdout).decode('utf-8', 'replace')
+
+    @property
+    def stderr_tail(self):
+        return self._stderr_tail.decode('utf-8', 'replace')
+
+    @property
+    def result(self):
+        return b''.join(self._result)
+
+    def _pipes(self):
+        if self._result_fd is not None:
+            return ((self.proc.stdout.fileno(), self._read_stderr),
+                    (self._result_fd, self._read_result))
+        else:
+            return ((self.proc.stdout.fileno(), self._read_stdout),
+                    (self.proc.stderr.fileno(), self._read_stderr))
+
+    def _read_stdout(self, data):
+        self._stdout.append(data)
+
+    def _read_result(self, data):
+        self._result.append(data)
+
+    def _read_stderr(self, data):
+        self._stderr_tail = (self._stderr_tail + data)[-_STDERR_TAIL:]
+        if self.stderr_file is not None:
+            self.stderr_file.write(self._decoder.decode(data))
+            self.stderr_file.flush()
+
+    def _expired(self, now):
+        return (self._deadline is not None and now >= self._deadline)
+
+    def _remaining(self, now):
+        if self._deadline is None:
+            return None
+        return max(self._deadline - now, 0.0)
+
+    def _kill(self):
+        self.timed_out = True
+        try:
+            self.proc.kill()
+        except OSError:
+            # the process already completed
+            pass
+
+    def _close_pipes(self):
+        for pipe in (self.proc.stdout, self.proc.stderr):
+            if pipe is not None and not pipe.closed:
+                pipe.close()
+        if self._result_fd is not None:
+            os.close(self._result_fd)
+            self._result_fd = None
+
+    def _wait(self):
+        if self._deadline is None:
+            self.proc.wait()
+            return
+
+        # the worker closed its pipes but may still be running
+        while self.proc.poll() is None:
+            if self._expired(perf.monotonic_clock()):
+                self._kill()
+                self.proc.wait()
+                break
+            time.sleep(0.010)
+
+    def _communicate(self):
+        # Blocking fallback for platforms where select() doesn't support
+        # pipes. The result pipe is not supported.
+        if perf._PY3:
+            try:
+                stdout, stderr = self.proc.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self._kill()
+                stdout, stderr = self.proc.communicate()
+        else:
+            stdout, stderr = self.proc.communicate()
+        self._read_stdout(stdout)
+        self._read_stderr(stderr)
+
+
+def supervise(workers):
+    """Wait until all worker processes complete.
+
+    Read stdout and stderr of workers, kill workers which exceed their
+    timeout.
+    """
+    if sys.platform == 'win32':
+        for worker in workers:
+            worker._communicate()
+        return
+
+    pipes = {}
+    for worker in workers:
+        for fd, callback in worker._pipes():
+            pipes[fd] = (worker, callback)
+
+    while pipes:
+        now = perf.monotonic_clock()
+        timeout = None
+        for worker in set(worker for worker, callback in pipes.values()):
+            remaining = worker._remaining(now)
+            if remaining is not None:
+                if timeout is None:
+                    timeout = remaining
+                else:
+                    timeout = min(timeout, remaining)
+
+        try:
+            rlist = select.select(list(pipes), [], [], timeout)[0]
+        except (OSError, select.error) as exc:
+            # Python 2 doesn't retry on EINTR
+            if exc.args[0] == errno.EINTR:
+                continue
+            raise
+
+        for fd in rlist:
+            worker, callback = pipes[fd]
+            data = os.read(fd, _READ_SIZE)
+            if data:
+                callback(data)
+            else:
+                # end of file
+                del pipes[fd]
+
+        now = perf.monotonic_clock()
+        for worker in set(worker for worker, callback in pipes.values()):
+            if worker._expired(now):
+                worker._kill()
+                # don't wait until grandchildren close the pipes
+                for fd in list(pipes):
+                    if pipes[fd][0] is worker:
+                        del pipes[fd]
+
+    for worker in workers:
+        worker._close_pipes()
+        worker._wait()
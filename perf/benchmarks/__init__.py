@@ -0,0 +1,154 @@
+"""Benchmarks of perf itself.
+
+Benchmark hot paths of the perf module on result files of realistic sizes.
+Run the suite with::
+
+    python3 -m perf.benchmarks --json-file=perf_benchmarks.json
+
+and compare two result files with ``python3 -m perf compare``.
+"""
+from __future__ import print_function
+import random
+import sys
+
+import perf
+import perf.text_runner
+
+
+# Size of the benchmark result used as input: 50 runs of 1000 samples
+_NRUN = 50
+_NSAMPLE = 1000
+# Number of values of the samples passed to is_significant()
+_NSIGNIFICANT = 1000
+
+# Inputs of benchmarks, created on demand
+_inputs = {}
+
+
+def _create_run_metadata(rng, index):
+    metadata = {
+        'python_version': '3.5.2 (64bit)',
+        'python_executable': '/usr/bin/python3',
+        'hostname': 'bench-host',
+        'platform': 'Linux-4.6.0-x86_64-with-fedora-24',
+        'cpu_count': '8',
+        'cpu_model_name': 'Intel(R) Core(TM) i7-3520M CPU @ 2.90GHz',
+        'aslr': 'enabled',
+    }
+    # metadata which differs between runs
+    metadata['date'] = '2016-07-01T12:%02d:%02d' % divmod(index, 60)
+    metadata['load_avg_1min'] = '%.2f' % rng.uniform(0.0, 1.0)
+    for key in range(20):
+        metadata['key%s' % key] = 'value%s' % (index % (key + 1))
+    return metadata
+
+
+def _create_benchmark():
+    if 'bench' not in _inputs:
+        # use a constant seed to get the same inputs in all worker processes
+        rng = random.Random(5)
+        bench = perf.Benchmark(name='bench')
+        for index in range(_NRUN):
+            run = perf.RunResult(loops=2 ** 10,
+                                 metadata=_create_run_metadata(rng, index))
+            run.warmups.append(rng.gauss(1.2e-3, 1e-4))
+            run.samples.extend(rng.gauss(1e-3, 5e-5)
+                               for sample in range(_NSAMPLE))
+            bench.runs.append(run)
+        _inputs['bench'] = bench
+    return _inputs['bench']
+
+
+def _create_samples():
+    if 'samples' not in _inputs:
+        rng = random.Random(5)
+        sample1 = [rng.gauss(1e-3, 5e-5) for index in range(_NSIGNIFICANT)]
+        sample2 = [rng.gauss(1.01e-3, 5e-5) for index in range(_NSIGNIFICANT)]
+        _inputs['samples'] = (sample1, sample2)
+    return _inputs['samples']
+
+
+def _loop(loops, func, *args):
+    range_it = range(loops)
+    t0 = perf.perf_counter()
+    for _ in range_it:
+        func(*args)
+    return perf.perf_counter() - t0
+
+
+class _NullFile:
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+def bench_json_load(loops):
+    text = _create_benchmark().json()
+    return _loop(loops, perf.Benchmark.json_load, text)
+
+
+def bench_json_dump(loops):
+    bench = _create_benchmark()
+    return _loop(loops, bench.json)
+
+
+def bench_get_samples(loops):
+    bench = _create_benchmark()
+    return _loop(loops, bench.get_samples)
+
+
+def bench_common_metadata(loops):
+    metadatas = [run.metadata for run in _create_benchmark().runs]
+    return _loop(loops, perf._common_metadata, metadatas)
+
+
+def bench_format_timedeltas(loops):
+    # format the mean and the standard deviation of each run
+    values = _create_samples()[0]
+    pairs = list(zip(values[::2], values[1::2]))
+
+    def format_pairs():
+        for pair in pairs:
+            perf._format_timedeltas(pair)
+
+    return _loop(loops, format_pairs)
+
+
+def bench_is_significant(loops):
+    sample1, sample2 = _create_samples()
+    return _loop(loops, perf.is_significant, sample1, sample2)
+
+
+def bench_hist_text(loops):
+    from perf.__main__ import display_histogram_text
+
+    class Args:
+        extend = False
+
+    bench = _create_benchmark()
+    old_stdout = sys.stdout
+    sys.stdout = _NullFile()
+    try:
+        return _loop(loops, display_histogram_text, Args(), bench)
+    finally:
+        sys.stdout = old_stdout
+
+
+BENCHMARKS = (
+    ('json_load', bench_json_load),
+    ('json_dump', bench_json_dump),
+    ('get_samples', bench_get_samples),
+    ('common_metadata', bench_common_metadata),
+    ('format_timedeltas', bench_format_timedeltas),
+    ('is_significant', bench_is_significant),
+    ('hist_text', bench_hist_text),
+)
+
+
+def main():
+    runner = perf.text_runner.TextRunner()
+    runner.program_args = (sys.executable, '-m', 'perf.benchmarks')
+    runner.metadata['perf_version'] = perf.__version__
+    return runner.bench_sample_funcs(BENCHMARKS)
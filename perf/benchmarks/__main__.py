@@ -0,0 +1,3 @@
+from perf.benchmarks import main
+
+main()
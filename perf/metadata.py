@@ -3,15 +3,8 @@ import datetime
 import os
 import platform
 import re
-import socket
 import sys
 
-try:
-    # Optional dependency
-    import psutil
-except ImportError:
-    psutil = None
-
 import perf
 
 
@@ -98,12 +91,7 @@ def _collect_linux_metadata(metadata):
         break
 
 
-def _collect_system_metadata(metadata):
-    metadata['platform'] = platform.platform(True, False)
-    if sys.platform.startswith('linux'):
-        _collect_linux_metadata(metadata)
-
-    # CPU count
+def _get_cpu_count():
     cpu_count = None
     if hasattr(os, 'cpu_count'):
         # Python 3.4
@@ -119,36 +107,60 @@ def _collect_system_metadata(metadata):
             except NotImplementedError:
                 pass
     if cpu_count is not None and cpu_count >= 1:
-        metadata['cpu_count'] = str(cpu_count)
+        return cpu_count
+    return None
 
-    # CPU affinity
+
+def _collect_cpu_affinity(metadata):
+    cpu_count = _get_cpu_count()
+    cpus = None
     if hasattr(os, 'sched_getaffinity'):
         cpus = os.sched_getaffinity(0)
-    elif psutil is not None:
-        proc = psutil.Process()
-        if hasattr(proc, 'cpu_affinity'):
-            cpus = proc.cpu_affinity()
-        else:
-            # cpu_affinity() is only available on Linux, Windows and FreeBSD
-            cpus = None
     else:
-        cpus = None
-    if cpus is not None and cpu_count is not None and cpu_count >= 1:
+        psutil = perf._import_psutil()
+        if psutil is not None:
+            proc = psutil.Process()
+            # cpu_affinity() is only available on Linux, Windows and FreeBSD
+            if hasattr(proc, 'cpu_affinity'):
+                cpus = proc.cpu_affinity()
+    if cpus is not None and cpu_count is not None:
         if cpus == set(range(cpu_count)):
             cpus = None
     if cpus:
         metadata['cpu_affinity'] = perf._format_cpu_list(cpus)
 
-    # Hostname
-    hostname = socket.gethostname()
-    _add(metadata, 'hostname', hostname)
 
+def collect_host_metadata(metadata):
+    """Collect metadata of the host: the same for all runs of a session.
 
-def collect_metadata(metadata):
+    The main process collects them once and adds them to runs of worker
+    processes.
+    """
+    # platform.platform() is slow: it reads the Python binary and may
+    # spawn a subprocess
+    metadata['platform'] = platform.platform(True, False)
+    if sys.platform.startswith('linux'):
+        _collect_linux_metadata(metadata)
+
+    cpu_count = _get_cpu_count()
+    if cpu_count is not None:
+        metadata['cpu_count'] = str(cpu_count)
+
+    import socket
+    _add(metadata, 'hostname', socket.gethostname())
+
+
+def collect_run_metadata(metadata):
+    """Collect metadata of a run: date, Python and CPU affinity."""
     date = datetime.datetime.now().isoformat()
     metadata['date'] = date.split('.', 1)[0]
     _collect_python_metadata(metadata)
-    _collect_system_metadata(metadata)
+    _collect_cpu_affinity(metadata)
+
+
+def collect_metadata(metadata):
+    collect_run_metadata(metadata)
+    collect_host_metadata(metadata)
 
 
 if __name__ == "__main__":
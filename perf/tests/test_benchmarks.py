@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import perf
+from perf import benchmarks
+from perf.tests import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_sample_funcs(self):
+        for name, sample_func in benchmarks.BENCHMARKS:
+            dt = sample_func(1)
+            self.assertIsInstance(dt, float, name)
+            self.assertGreater(dt, 0.0, name)
+
+    def test_cli(self):
+        args = [sys.executable, '-m', 'perf.benchmarks',
+                '--raw', '--json', '--benchmark=get_samples',
+                '-l', '1', '-n', '2', '-w', '0']
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout = proc.communicate()[0]
+        self.assertEqual(proc.returncode, 0)
+
+        run = perf.RunResult.json_load(stdout.splitlines()[-1])
+        self.assertEqual(len(run.samples), 2)
+        self.assertEqual(run.metadata['perf_version'], perf.__version__)
+
+
+if __name__ == "__main__":
+    unittest.main()
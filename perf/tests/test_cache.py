@@ -0,0 +1,112 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import perf
+from perf import _cache
+from perf.tests import unittest
+
+
+def create_bench(samples, name='bench'):
+    runs = []
+    for index, sample in enumerate(samples):
+        run = perf.RunResult([sample, sample * 1.01], warmups=[sample],
+                             loops=1000, metadata={'key': 'value'})
+        runs.append(run)
+    return perf.Benchmark(runs=runs, name=name)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def dump(self, bench, basename='result.json'):
+        filename = os.path.join(self.tmpdir, basename)
+        with open(filename, 'w') as fp:
+            bench.json_dump_into(fp)
+        return filename
+
+    def test_summary(self):
+        bench = create_bench([1.0, 1.5, 2.0])
+        summary = _cache.BenchmarkSummary.from_benchmark(bench)
+
+        self.assertEqual(summary.name, 'bench')
+        self.assertEqual(summary.get_metadata(), bench.get_metadata())
+        for verbose in (0, 1, 2):
+            self.assertEqual(summary.format(verbose), bench.format(verbose))
+        self.assertEqual(summary._format_sample(1.5),
+                         bench._format_sample(1.5))
+        self.assertEqual(summary._get_stats(), bench._get_stats())
+        self.assertEqual(summary._get_percentiles(),
+                         bench._get_percentiles())
+        self.assertEqual(summary._get_stats()['shortest_raw'], 1000.0)
+
+    def test_load_summaries(self):
+        filename = self.dump(create_bench([1.0, 2.0]))
+        loaded = []
+
+        def load(filename):
+            loaded.append(filename)
+            with open(filename) as fp:
+                return perf.BenchmarkSuite.json_load_from(fp)
+
+        summaries = _cache.load_summaries(filename, load)
+        self.assertEqual(len(loaded), 1)
+        self.assertTrue(os.path.exists(_cache.cache_filename(filename)))
+
+        # the cache is used
+        cached = _cache.load_summaries(filename, load)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual([summary.format(2) for summary in cached],
+                         [summary.format(2) for summary in summaries])
+
+        # the cache is outdated if the result file is modified
+        self.dump(create_bench([1.0, 2.0, 3.0]))
+        cached = _cache.load_summaries(filename, load)
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(cached[0]._get_stats()['nsample'], 6)
+
+    def run_command(self, *args):
+        args = [sys.executable, '-m', 'perf'] + list(args)
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout = proc.communicate()[0]
+        self.assertEqual(proc.returncode, 0)
+        return stdout
+
+    def test_cli(self):
+        ref = self.dump(create_bench([1.0, 1.1, 1.2], 'ref'), 'ref.json')
+        changed = self.dump(create_bench([1.5, 1.6, 1.7], 'changed'),
+                            'changed.json')
+
+        for args in (('show', ref),
+                     ('-v', 'show', ref),
+                     ('compare_to', ref, changed),
+                     ('-v', 'compare', ref, changed)):
+            expected = self.run_command(*args)
+            # the first command creates the cache, the second uses it
+            for attempt in range(2):
+                self.assertEqual(self.run_command('--cache', *args),
+                                 expected)
+        self.assertTrue(os.path.exists(_cache.cache_filename(changed)))
+
+    def test_parallel_load(self):
+        filenames = []
+        for index in range(5):
+            bench = create_bench([1.0 + index, 1.1 + index],
+                                 'bench%s' % index)
+            filenames.append(self.dump(bench, 'bench%s.json' % index))
+
+        for command in ('compare', 'compare_to'):
+            expected = self.run_command(command, *filenames)
+            for options in ((), ('--cache',)):
+                args = options + (command, '-j', '3') + tuple(filenames)
+                self.assertEqual(self.run_command(*args), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import perf
+from perf import _db
+from perf.tests import unittest
+
+
+def create_bench(name, date, samples, metadata=None):
+    runs = []
+    for sample in samples:
+        run = perf.RunResult([sample, sample], loops=10)
+        run.metadata.update({'date': date, 'hostname': 'host'})
+        if metadata:
+            run.metadata.update(metadata)
+        runs.append(run)
+    return perf.Benchmark(runs, name=name)
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db = _db.connect(':memory:')
+
+    def test_history(self):
+        _db.add_benchmark(self.db,
+                          create_bench('bench', '2016-07-02T10:00:00',
+                                       [2.0, 2.0]),
+                          'b.json')
+        _db.add_benchmark(self.db,
+                          create_bench('bench', '2016-07-01T10:00:00',
+                                       [1.0, 3.0], {'python': '3.5'}),
+                          'a.json')
+        _db.add_benchmark(self.db,
+                          create_bench('other', '2016-07-01T10:00:00',
+                                       [5.0]),
+                          'a.json')
+
+        self.assertEqual(_db.history(self.db, 'bench'),
+                         [('2016-07-01T10:00:00', 2.0, 1.1547005383792515,
+                           2, 'a.json'),
+                          ('2016-07-02T10:00:00', 2.0, 0.0, 2, 'b.json')])
+
+        rows = _db.history(self.db, 'bench', metadata=[('python', '3.5')])
+        self.assertEqual([row[-1] for row in rows], ['a.json'])
+
+        # the date is in the past
+        self.assertEqual(_db.history(self.db, 'bench', days=1), [])
+
+        self.assertEqual(_db.summary(self.db),
+                         [('bench', 2, '2016-07-01T10:00:00',
+                           '2016-07-02T10:00:00', 2.0, 2.0, 2.0),
+                          ('other', 1, '2016-07-01T10:00:00',
+                           '2016-07-01T10:00:00', 5.0, 5.0, 5.0)])
+
+    def test_summary_last(self):
+        for filename, date, sample, python in (
+            ('a.json', '2016-07-03T10:00:00', 3.0, '2.7'),
+            ('b.json', '2016-07-02T10:00:00', 2.0, '3.5'),
+            ('c.json', '2016-07-01T10:00:00', 1.0, '3.5'),
+            # same date: the last added result is the last one
+            ('d.json', '2016-07-02T10:00:00', 4.0, '3.5'),
+        ):
+            _db.add_benchmark(self.db,
+                              create_bench('bench', date, [sample],
+                                           {'python': python}),
+                              filename)
+
+        queries = []
+        if hasattr(self.db, 'set_trace_callback'):
+            # Python 3.3
+            self.db.set_trace_callback(queries.append)
+        self.assertEqual(_db.summary(self.db),
+                         [('bench', 4, '2016-07-01T10:00:00',
+                           '2016-07-03T10:00:00', 1.0, 4.0, 3.0)])
+        self.assertLessEqual(len(queries), 1)
+
+        rows = _db.summary(self.db, metadata=[('python', '3.5')])
+        self.assertEqual(rows[0][-1],
+                         _db.history(self.db, 'bench',
+                                     metadata=[('python', '3.5')])[-1][1])
+        self.assertEqual(rows[0][-1], 4.0)
+
+    def test_replace(self):
+        for sample in (1.0, 2.0):
+            _db.add_benchmark(self.db,
+                              create_bench('bench', '2016-07-01T10:00:00',
+                                           [sample]),
+                              'a.json', store_samples=True)
+
+        rows = _db.history(self.db, 'bench')
+        self.assertEqual([row[1] for row in rows], [2.0])
+        self.assertEqual(_db.run_samples(self.db, 'bench'),
+                         [('2016-07-01T10:00:00', [2.0, 2.0])])
+        nrow = self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        self.assertEqual(nrow, 1)
+
+    def test_cli(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'result.json')
+            bench = create_bench('bench', '2016-07-01T10:00:00', [1.0, 2.0])
+            with open(filename, 'w') as fp:
+                bench.json_dump_into(fp)
+            db = os.path.join(tmpdir, 'history.db')
+
+            def run(*args):
+                args = [sys.executable, '-m', 'perf', 'db'] + list(args)
+                proc = subprocess.Popen(args,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+                stdout = proc.communicate()[0]
+                self.assertEqual(proc.returncode, 0)
+                return stdout
+
+            self.assertEqual(run('add', db, filename),
+                             'Add %s: 1 benchmark\n' % filename)
+            self.assertEqual(run('history', db, 'bench'),
+                             '2016-07-01T10:00:00: 1.50 sec +- 0.58 sec '
+                             '(2 runs) [%s]\n' % filename)
+            self.assertEqual(run('summary', db),
+                             'bench: 1 result, 2016-07-01T10:00:00 .. '
+                             '2016-07-01T10:00:00\n'
+                             '    last: 1.50 sec; min: 1.50 sec; '
+                             'max: 1.50 sec\n')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_cli_unnamed(self):
+        # unnamed benchmarks of different files are the same benchmark
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filenames = []
+            for day, sample in ((1, 1.0), (2, 2.0)):
+                filename = os.path.join(tmpdir, 'day%s.json' % day)
+                bench = create_bench(None, '2016-07-0%sT10:00:00' % day,
+                                     [sample])
+                with open(filename, 'w') as fp:
+                    bench.json_dump_into(fp)
+                filenames.append(filename)
+            db = os.path.join(tmpdir, 'history.db')
+
+            args = [sys.executable, '-m', 'perf', 'db', 'add', db]
+            proc = subprocess.Popen(args + filenames,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            proc.communicate()
+            self.assertEqual(proc.returncode, 0)
+
+            db = _db.connect(db)
+            rows = _db.history(db, 'default')
+            db.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual([(row[0], row[1]) for row in rows],
+                         [('2016-07-01T10:00:00', 1.0),
+                          ('2016-07-02T10:00:00', 2.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import perf
+from perf import _indexed
+from perf.tests import unittest
+
+
+def create_bench():
+    runs = []
+    for index in range(5):
+        samples = [1.0 + index * 0.1, 1.05 + index * 0.1, 1.1 + index * 0.1]
+        run = perf.RunResult(samples, warmups=[2.0], loops=100,
+                             metadata={'key': 'value',
+                                       'index': str(index)})
+        runs.append(run)
+    bench = perf.Benchmark(runs=runs, name='bench')
+    bench.failed_runs.append({'error': 'timeout'})
+    return bench
+
+
+class TestIndexed(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def dump(self, bench):
+        filename = os.path.join(self.tmpdir, 'bench.perf')
+        with open(filename, 'wb') as fp:
+            bench.dump_indexed(fp)
+        return filename
+
+    def load(self, filename):
+        with open(filename, 'rb') as fp:
+            self.assertTrue(_indexed.is_indexed(fp))
+            return perf.Benchmark.load_indexed(fp)
+
+    def test_runs(self):
+        bench = create_bench()
+        indexed = self.load(self.dump(bench))
+
+        self.assertEqual(indexed.name, 'bench')
+        self.assertEqual(indexed.failed_runs, bench.failed_runs)
+        self.assertEqual(len(indexed.runs), 5)
+        self.assertEqual(indexed.get_metadata(), bench.get_metadata())
+
+        run = indexed.runs[3]
+        self.assertEqual(run.samples, bench.runs[3].samples)
+        self.assertEqual(run.warmups, [2.0])
+        self.assertEqual(run.loops, 100)
+        self.assertEqual(run.metadata['index'], '3')
+        self.assertEqual(indexed.runs[-1].metadata['index'], '4')
+        self.assertEqual([run.metadata['index'] for run in indexed.runs[1:3]],
+                         ['1', '2'])
+        self.assertRaises(IndexError, indexed.runs.__getitem__, 5)
+        self.assertEqual(indexed.get_samples(), bench.get_samples())
+
+        summary = indexed.runs.get_summary(0)
+        self.assertEqual(summary['nsample'], 3)
+        self.assertEqual(summary['nwarmup'], 1)
+        self.assertEqual(summary['loops'], 100)
+        self.assertIsNone(summary['inner_loops'])
+        self.assertAlmostEqual(summary['mean'], 1.05)
+        self.assertEqual(summary['min'], 1.0)
+        self.assertEqual(summary['max'], 1.1)
+
+    def test_stats(self):
+        bench = create_bench()
+        indexed = self.load(self.dump(bench))
+
+        stats = indexed._get_stats()
+        expected = bench._get_stats()
+        self.assertEqual(sorted(stats), sorted(expected))
+        for key in stats:
+            self.assertAlmostEqual(stats[key], expected[key])
+        for verbose in (0, 1, 2):
+            self.assertEqual(indexed.format(verbose), bench.format(verbose))
+        self.assertEqual(indexed._get_percentiles(), bench._get_percentiles())
+
+    def test_invalid(self):
+        filename = self.dump(create_bench())
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        with open(filename, 'wb') as fp:
+            fp.write(data[:-10])
+        with open(filename, 'rb') as fp:
+            self.assertRaises(ValueError, perf.Benchmark.load_indexed, fp)
+
+        self.assertFalse(_indexed.is_indexed(io.BytesIO(b'{"version": 1}')))
+
+    def run_command(self, *args):
+        args = [sys.executable, '-m', 'perf'] + list(args)
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout = proc.communicate()[0]
+        self.assertEqual(proc.returncode, 0)
+        return stdout
+
+    def test_cli(self):
+        json_filename = os.path.join(self.tmpdir, 'bench.json')
+        with open(json_filename, 'w') as fp:
+            create_bench().json_dump_into(fp)
+        indexed_filename = os.path.join(self.tmpdir, 'bench.perf')
+        self.run_command('convert', '--indexed',
+                         json_filename, indexed_filename)
+
+        for options in ((), ('-v',), ('-vv',)):
+            args = options + ('show',)
+            self.assertEqual(self.run_command(*(args + (indexed_filename,))),
+                             self.run_command(*(args + (json_filename,))))
+
+        # convert back to JSON
+        json_filename2 = os.path.join(self.tmpdir, 'bench2.json')
+        self.run_command('convert', indexed_filename, json_filename2)
+        with open(json_filename2) as fp:
+            suite = perf.BenchmarkSuite.json_load_from(fp)
+        self.assertEqual(suite.benchmarks[0].get_samples(),
+                         create_bench().get_samples())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import io
+import os
+import subprocess
+import sys
+import time
+
+from perf import _load
+from perf.tests import mock
+from perf.tests import unittest
+
+
+PROC_STAT = u"""\
+cpu  400 0 100 1400 100 0 0 0 0 0
+cpu0 300 0 50 600 50 0 0 0 0 0
+cpu1 100 0 50 800 50 0 0 0 0 0
+intr 12345
+"""
+
+
+def fake_open(content):
+    def open_func(path):
+        return io.StringIO(content)
+    return open_func
+
+
+class TestLoad(unittest.TestCase):
+    def test_read_cpu_times(self):
+        with mock.patch('perf._load.open', fake_open(PROC_STAT),
+                        create=True):
+            with mock.patch('perf._load._clock_ticks', return_value=100):
+                self.assertEqual(_load.read_cpu_times(), (5.0, 20.0))
+                self.assertEqual(_load.read_cpu_times([1]), (1.5, 10.0))
+                self.assertEqual(_load.read_cpu_times([0, 1]), (5.0, 20.0))
+                # unknown CPU
+                self.assertIsNone(_load.read_cpu_times([7]))
+
+    def test_read_load_avg(self):
+        with mock.patch('perf._load.open',
+                        fake_open(u"0.52 0.58 0.59 1/467 12345\n"),
+                        create=True):
+            self.assertEqual(_load.read_load_avg(), 0.52)
+
+    def test_cpu_usage(self):
+        self.assertEqual(_load.cpu_usage((1.0, 10.0), (3.0, 14.0)), 50.0)
+        # CPU time of the current process is excluded
+        self.assertEqual(_load.cpu_usage((1.0, 10.0), (3.0, 14.0), 1.0),
+                         25.0)
+        self.assertEqual(_load.cpu_usage((1.0, 10.0), (3.0, 14.0), 5.0),
+                         0.0)
+        self.assertIsNone(_load.cpu_usage(None, (3.0, 14.0)))
+        self.assertIsNone(_load.cpu_usage((1.0, 10.0), (1.0, 10.0)))
+
+    @unittest.skipUnless(os.path.exists('/proc/stat'), 'need /proc/stat')
+    def test_sampler(self):
+        sampler = _load.LoadSampler()
+        sampler.start()
+        # CPU times are counted in clock ticks
+        time.sleep(0.1)
+        metadata = {}
+        sampler.stop(metadata)
+        self.assertIn('load_avg_1min', metadata)
+        usage = _load.get_cpu_usage_others(metadata)
+        self.assertIsNotNone(usage)
+        self.assertGreaterEqual(usage, 0.0)
+
+    @unittest.skipUnless(os.name == 'posix',
+                         'need CPU times of child processes')
+    def test_sampler_child_process(self):
+        # the CPU time of a child process is not counted as other processes
+        code = ('import time\n'
+                't = time.time()\n'
+                'while time.time() - t < 0.5: pass')
+
+        def fake_read_cpu_times(cpus=None):
+            # the system is only busy with the process and its children
+            times = os.times()
+            busy = times[0] + times[1] + times[2] + times[3]
+            return (busy, next(total))
+
+        total = iter((0.0, 10.0))
+        sampler = _load.LoadSampler()
+        metadata = {}
+        with mock.patch('perf._load.read_cpu_times', fake_read_cpu_times):
+            sampler.start()
+            subprocess.check_call([sys.executable, '-c', code])
+            sampler.stop(metadata)
+        usage = _load.get_cpu_usage_others(metadata)
+        self.assertLess(usage, 1.0)
+
+    def test_wait_quiet(self):
+        # busy, busy, then quiet: each check reads CPU times twice
+        cpu_times = [(0.0, 10.0), (9.0, 20.0),
+                     (9.0, 20.0), (18.0, 30.0),
+                     (18.0, 30.0), (19.0, 40.0)]
+        with mock.patch('perf._load.read_cpu_times', side_effect=cpu_times):
+            usage, elapsed = _load.wait_quiet(20.0, interval=0.0)
+        self.assertEqual(usage, 10.0)
+
+        # give up after the timeout
+        with mock.patch('perf._load.read_cpu_times',
+                        side_effect=[(0.0, 10.0), (9.0, 20.0)]):
+            usage, elapsed = _load.wait_quiet(20.0, timeout=0.0,
+                                              interval=0.0)
+        self.assertEqual(usage, 90.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
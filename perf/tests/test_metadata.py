@@ -35,6 +35,17 @@ class TestMetadata(unittest.TestCase):
         perf.metadata.collect_metadata(metadata)
         self.check_all_metadata(metadata)
 
+    def test_run_metadata(self):
+        metadata = {}
+        perf.metadata.collect_run_metadata(metadata)
+        for key in ('date', 'python_implementation', 'python_version'):
+            self.assertIn(key, metadata)
+        for key in ('platform', 'hostname', 'cpu_count'):
+            self.assertNotIn(key, metadata)
+
+        perf.metadata.collect_host_metadata(metadata)
+        self.check_all_metadata(metadata)
+
     def test_cpu_affinity(self):
         # affinity=2/4 CPUs
         with mock.patch('os.sched_getaffinity',
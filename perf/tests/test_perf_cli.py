@@ -1,3 +1,5 @@
+import os
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -84,7 +86,9 @@ class TestPerfCLI(unittest.TestCase):
                     'Shortest sample: 1.00 sec\n'
                     '\n'
                     'Average: 1.50 sec +- 0.50 sec '
-                        '(min: 1.00 sec, max: 2.00 sec) (3 runs x 1 sample)\n')
+                        '(min: 1.00 sec, max: 2.00 sec) (3 runs x 1 sample)\n'
+                    'Percentiles: p50: 1.51 sec, p90: 2.00 sec, '
+                        'p99: 2.00 sec, p99.9: 2.00 sec\n')
         self.assertEqual(stdout, expected)
 
     def compare(self, action, ref_result, changed_result):
@@ -153,6 +157,251 @@ class TestPerfCLI(unittest.TestCase):
         self.assertEqual(stdout.rstrip(),
                          expected)
 
+    def test_compare_throughput(self):
+        # the second benchmark processes twice more bytes per call
+        runs = self.create_runs((1.0, 1.5, 2.0),
+                                {'work': '1000', 'work_unit': 'bytes'})
+        ref_result = perf.Benchmark(runs=runs, name='small')
+
+        runs = self.create_runs((1.5, 2.0, 2.5),
+                                {'work': '2000', 'work_unit': 'bytes'})
+        changed_result = perf.Benchmark(runs=runs, name='large')
+
+        stdout = self.compare('compare_to', ref_result, changed_result)
+        expected = ('Reference: small\n'
+                    'Changed: large\n'
+                    '\n'
+                    'Common metadata:\n'
+                    '- work_unit: bytes\n'
+                    '\n'
+                    'small metadata:\n'
+                    '- work: 1000\n'
+                    '\n'
+                    'large metadata:\n'
+                    '- work: 2000\n'
+                    '\n'
+                    'Average: [small] 667 B/s +- 222 B/s '
+                        '-> [large] 1.00 kB/s +- 0.25 kB/s: 1.5x faster\n'
+                    'Not significant!')
+        self.assertEqual(stdout.rstrip(), expected)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(mode="w+") as tmp:
+            args = [sys.executable, '-m', 'perf', 'command',
+                    '-p', '2', '-n', '2', '-w', '1', '-l', '1',
+                    '--json-file', tmp.name,
+                    '--', sys.executable, '-c', 'pass']
+            proc = subprocess.Popen(args,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            stdout = proc.communicate()[0]
+            self.assertEqual(proc.returncode, 0, stdout)
+
+            with open(tmp.name) as fp:
+                result = perf.Benchmark.json_load_from(fp)
+
+        self.assertEqual(len(result.runs), 2)
+        for run in result.runs:
+            self.assertEqual(len(run.warmups), 1)
+            self.assertEqual(len(run.samples), 2)
+            self.assertEqual(run.loops, 1)
+        metadata = result.get_metadata()
+        self.assertEqual(metadata['command'],
+                         '%s -c pass' % sys.executable)
+
+    def test_command_output(self):
+        # the output of the command must not corrupt the JSON written by
+        # the worker into stdout (no result pipe on Windows)
+        args = [sys.executable, '-m', 'perf', 'command',
+                '--raw', '--worker', '--json', '-n', '2', '-w', '1', '-l', '1',
+                '--', sys.executable, '-c', 'print("abc" * 3)']
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout, stderr = proc.communicate()
+        self.assertEqual(proc.returncode, 0, stderr)
+        self.assertNotIn('abcabcabc', stdout)
+
+        run = perf.RunResult.json_load(stdout)
+        self.assertEqual(len(run.samples), 2)
+
+    def test_scaling(self):
+        suite = perf.BenchmarkSuite()
+        for size in (10, 100, 1000, 10000):
+            # linear: 1 us + 2 ns per item
+            sample = 1e-6 + 2e-9 * size
+            runs = self.create_runs((sample, sample))
+            suite.add_benchmark(perf.Benchmark(runs=runs,
+                                               name='sort(n=%s)' % size))
+
+        with tempfile.NamedTemporaryFile(mode="w+") as tmp:
+            suite.json_dump_into(tmp)
+            tmp.flush()
+
+            args = [sys.executable, '-m', 'perf', 'scaling', tmp.name]
+            proc = subprocess.Popen(args,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            stdout = proc.communicate()[0]
+        self.assertEqual(proc.returncode, 0)
+
+        self.assertIn('Parameter: n\n', stdout)
+        self.assertIn('- sort(n=10): 1.02 us\n', stdout)
+        self.assertIn('- n: 0.0%\n', stdout)
+        self.assertIn('Best fit: n (time = 1.00 us + 2.00 ns * n)', stdout)
+
+    def test_detect_changepoints(self):
+        from perf.__main__ import _detect_changepoints
+
+        # noisy runs, the mean increases by 10% at the 6th file
+        points = []
+        for index in range(10):
+            mean = 1.0 if index < 5 else 1.1
+            points.append([mean - 0.01, mean, mean + 0.01])
+        changes, stats = _detect_changepoints(points)
+        self.assertEqual(changes, [5])
+
+        # only noise
+        points = [[1.0 - 0.01, 1.0, 1.0 + 0.01]] * 10
+        self.assertEqual(_detect_changepoints(points)[0], [])
+
+    def test_trend(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filenames = []
+            for index, sample in enumerate((1.0, 1.0, 1.0, 1.5, 1.5, 1.5)):
+                runs = self.create_runs((sample - 0.01, sample + 0.01),
+                                        {'commit': 'rev%s' % index})
+                bench = perf.Benchmark(runs=runs, name='bench')
+                filename = os.path.join(tmpdir, 'rev%s.json' % index)
+                with open(filename, 'w') as fp:
+                    bench.json_dump_into(fp)
+                filenames.append(filename)
+
+            args = [sys.executable, '-m', 'perf', 'trend',
+                    '--label', 'commit'] + filenames
+            proc = subprocess.Popen(args,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            stdout = proc.communicate()[0]
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(proc.returncode, 0)
+
+        self.assertIn('Files: 6 (12 runs)\n', stdout)
+        self.assertIn('Step changes:\n', stdout)
+        self.assertIn('rev3.json (rev3): 1.00 sec -> 1.50 sec: +50.0%',
+                      stdout)
+
+    def run_merge(self, tmpdir, metadatas, *options, **kw):
+        name = kw.pop('name', 'bench')
+        filenames = []
+        for index, metadata in enumerate(metadatas):
+            runs = self.create_runs((1.0 + index, 1.5 + index), metadata)
+            bench = perf.Benchmark(runs=runs, name=name)
+            filename = os.path.join(tmpdir, 'input%s.json' % index)
+            with open(filename, 'w') as fp:
+                bench.json_dump_into(fp)
+            filenames.append(filename)
+
+        output = os.path.join(tmpdir, 'output.json')
+        args = [sys.executable, '-m', 'perf', 'merge']
+        args.extend(options)
+        args.append(output)
+        args.extend(filenames)
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout, stderr = proc.communicate()
+        return (proc.returncode, stdout, stderr, output)
+
+    def test_merge(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            metadata = {'python_version': '3.5.2 (64bit)'}
+            exitcode, stdout, stderr, output = self.run_merge(
+                tmpdir, [metadata] * 3)
+            self.assertEqual(exitcode, 0)
+            self.assertEqual(stdout.rstrip(),
+                             'Merged 6 runs of 3 files into %s' % output)
+
+            with open(output) as fp:
+                bench = perf.Benchmark.json_load_from(fp)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(bench.name, 'bench')
+        self.assertEqual(bench.get_samples(),
+                         [1.0, 1.5, 2.0, 2.5, 3.0, 3.5])
+        self.assertEqual(bench.get_metadata()['python_version'],
+                         '3.5.2 (64bit)')
+
+    def test_merge_unnamed(self):
+        # unnamed benchmarks are not named after the first input file
+        tmpdir = tempfile.mkdtemp()
+        try:
+            exitcode, stdout, stderr, output = self.run_merge(
+                tmpdir, [{}] * 2, name=None)
+            self.assertEqual(exitcode, 0, stderr)
+            with open(output) as fp:
+                bench = perf.Benchmark.json_load_from(fp)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertIsNone(bench.name)
+        self.assertEqual(len(bench.runs), 4)
+
+    def test_merge_incompatible(self):
+        metadatas = [{'cpu_model_name': 'cpu1'}, {'cpu_model_name': 'cpu2'}]
+        tmpdir = tempfile.mkdtemp()
+        try:
+            exitcode, stdout, stderr, output = self.run_merge(tmpdir,
+                                                              metadatas)
+            self.assertEqual(exitcode, 1)
+            self.assertIn("cpu_model_name=cpu2 differs from cpu1",
+                          stderr)
+            self.assertFalse(os.path.exists(output))
+
+            exitcode, stdout, stderr, output = self.run_merge(
+                tmpdir, metadatas, '--force')
+            self.assertEqual(exitcode, 0)
+            self.assertIn("WARNING", stderr)
+            with open(output) as fp:
+                bench = perf.Benchmark.json_load_from(fp)
+            self.assertEqual(bench.name, 'bench')
+            self.assertEqual(len(bench.runs), 4)
+
+            # warn once per key, compare to the first file
+            metadatas.append({'cpu_model_name': 'cpu3'})
+            exitcode, stdout, stderr, output = self.run_merge(
+                tmpdir, metadatas, '--force')
+            self.assertEqual(exitcode, 0)
+            self.assertEqual(stderr.count("WARNING"), 1, stderr)
+
+            # on error, the existing output file is left unchanged
+            exitcode, stdout, stderr, output = self.run_merge(tmpdir,
+                                                              metadatas)
+            self.assertEqual(exitcode, 1)
+            with open(output) as fp:
+                bench = perf.Benchmark.json_load_from(fp)
+            self.assertEqual(len(bench.runs), 6)
+            self.assertFalse(os.path.exists(output + '.tmp'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_command_error(self):
+        args = [sys.executable, '-m', 'perf', 'command',
+                '-p', '2', '-l', '1',
+                '--', sys.executable, '-c', 'import sys; sys.exit(3)']
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout, stderr = proc.communicate()
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn('exit code 3', stderr)
 
 
 if __name__ == "__main__":
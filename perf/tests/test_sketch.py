@@ -0,0 +1,84 @@
+import math
+import random
+
+import perf
+from perf import _sketch
+from perf.tests import unittest
+
+
+def exact_quantile(values, quantile):
+    values = sorted(values)
+    rank = max(int(math.ceil(quantile * len(values) - 1e-9)), 1)
+    return values[rank - 1]
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def check_accuracy(self, sketch, values):
+        for quantile in (0.0, 0.1, 0.5, 0.9, 0.99, 0.999, 1.0):
+            expected = exact_quantile(values, quantile)
+            value = sketch.quantile(quantile)
+            self.assertLessEqual(abs(value - expected),
+                                 expected * sketch.accuracy + 1e-15)
+
+    def test_accuracy(self):
+        rng = random.Random(5)
+        values = [rng.lognormvariate(-7.0, 1.0) for index in range(10000)]
+        sketch = _sketch.QuantileSketch()
+        sketch.update(values)
+        self.assertEqual(sketch.count, 10000)
+        self.assertEqual(sketch.min, min(values))
+        self.assertEqual(sketch.max, max(values))
+        self.check_accuracy(sketch, values)
+        # memory is bounded by the range of values
+        self.assertLess(len(sketch._buckets), 1000)
+
+    def test_merge(self):
+        rng = random.Random(5)
+        values1 = [rng.uniform(1e-3, 2e-3) for index in range(1000)]
+        values2 = [rng.uniform(1.5e-3, 5e-3) for index in range(500)]
+        sketch = _sketch.QuantileSketch()
+        sketch.update(values1)
+        sketch2 = _sketch.QuantileSketch()
+        sketch2.update(values2)
+        sketch.merge(sketch2)
+
+        self.assertEqual(sketch.count, 1500)
+        self.check_accuracy(sketch, values1 + values2)
+
+        self.assertRaises(ValueError, sketch.merge,
+                          _sketch.QuantileSketch(0.05))
+
+    def test_zero(self):
+        sketch = _sketch.QuantileSketch()
+        sketch.update([0.0, 0.0, 1.0])
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertEqual(sketch.quantile(1.0), 1.0)
+
+        self.assertRaises(ValueError, _sketch.QuantileSketch().quantile, 0.5)
+
+    def test_json(self):
+        sketch = _sketch.QuantileSketch()
+        sketch.update([0.0, 1e-3, 2e-3, 2e-3, 5e-3])
+        sketch2 = _sketch.QuantileSketch._json_load(sketch._as_json())
+        self.assertEqual(sketch2.count, 5)
+        self.assertEqual(sketch2.percentiles(), sketch.percentiles())
+
+    def test_run_result(self):
+        run = perf.RunResult([1.0, 1.5, 2.0])
+        self.assertEqual(run._get_sketch().quantile(1.0), 2.0)
+
+        # the sketch is stored in JSON and in the binary format
+        run2 = perf.RunResult.json_load(run.json())
+        self.assertIsNotNone(run2._sketch)
+        run3 = perf.RunResult._binary_load(run._binary(sketch=True))
+        self.assertIsNotNone(run3._sketch)
+        self.assertIsNone(perf.RunResult._binary_load(run._binary())._sketch)
+
+        bench = perf.Benchmark(runs=[run, perf.RunResult([3.0, 4.0])])
+        self.assertEqual(
+            _sketch.format_percentiles(bench._get_percentiles()),
+            'p50: 1.99 sec, p90: 4.00 sec, p99: 4.00 sec, p99.9: 4.00 sec')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import perf
+from perf.tests import unittest
+
+
+def loaded_modules(code, modules):
+    """Run code in a new Python process and return the subset of modules
+    which were imported."""
+    code = textwrap.dedent(code)
+    code += ("\nimport sys\n"
+             "print(' '.join(name for name in %r if name in sys.modules))\n"
+             % (modules,))
+    proc = subprocess.Popen([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    stdout = proc.communicate()[0]
+    if proc.returncode:
+        raise Exception("Python failed with exit code %s" % proc.returncode)
+    return stdout.split()
+
+
+def startup_time(code, repeat=5):
+    """Minimum time in seconds to run code in a new Python process."""
+    code = textwrap.dedent(code)
+    args = [sys.executable, '-c', code]
+    # measure the startup with bytecode files, not the compilation of .py
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    with open(os.devnull, 'w') as devnull:
+        # first run to write bytecode files
+        subprocess.check_call(args, env=env, stdout=devnull)
+        timings = []
+        for i in range(repeat):
+            start = perf.perf_counter()
+            subprocess.check_call(args, env=env, stdout=devnull)
+            timings.append(perf.perf_counter() - start)
+    return min(timings)
+
+
+# A worker process spawned by the parent process
+WORKER_CODE = '''
+    import os
+    import perf.text_runner
+
+    rfd, wfd = os.pipe()
+    runner = perf.text_runner.TextRunner(name='bench')
+    runner.parse_args(['--raw', '--worker', '--pipe=%s' % wfd,
+                       '-l', '1', '-n', '2', '-w', '0'])
+    runner.bench_sample_func(lambda loops: 1.0)
+    os.close(rfd)
+'''
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_perf(self):
+        modules = ('argparse', 'json', 'psutil', 'statistics', 'subprocess')
+        self.assertEqual(loaded_modules('import perf', modules), [])
+
+    def test_startup_time(self):
+        # budgets are multiples of the startup time of Python: importing
+        # the heavy modules (argparse, statistics, subprocess, etc.) at
+        # startup takes more than 4 times the startup time of Python
+        python = startup_time('pass')
+        self.assertLess(startup_time('import perf.text_runner'), python * 3)
+        # the worker also parses the command line and collects metadata
+        self.assertLess(startup_time(WORKER_CODE), python * 6)
+
+    def test_import_text_runner(self):
+        modules = ('argparse', 'psutil', 'random', 'statistics', 'subprocess')
+        self.assertEqual(loaded_modules('import perf.text_runner', modules),
+                         [])
+
+    def test_worker(self):
+        # a worker process spawned by the parent process doesn't import
+        # modules only used to compute statistics or to schedule runs.
+        # Host metadata are collected by the parent process: platform.platform()
+        # may spawn a subprocess
+        modules = ('random', 'socket', 'statistics', 'subprocess')
+        self.assertEqual(loaded_modules(WORKER_CODE, modules), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
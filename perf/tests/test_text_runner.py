@@ -2,6 +2,7 @@ import itertools
 import os
 import tempfile
 
+import perf.metadata
 import perf.text_runner
 from perf import tests
 from perf.tests import mock
@@ -62,6 +63,72 @@ class TestTextRunner(unittest.TestCase):
 
         self.check_bench_result(runner, stderr, result)
 
+    def test_bench_func_unroll(self):
+        calls = []
+
+        def func(*args):
+            calls.append(args)
+
+        runner = self.create_text_runner(['--raw', '-l', '3', '-n', '2',
+                                          '-w', '1'])
+        runner.unroll = 4
+        with tests.capture_stderr():
+            result = runner.bench_func(func, 'a', 'b')
+
+        # 3 samples (1 warmup) x 3 loops x 4 calls
+        self.assertEqual(calls, [('a', 'b')] * 36)
+        self.assertEqual(result.runs[0].inner_loops, 4)
+        self.assertIsNone(runner.inner_loops)
+
+    def test_bench_func_latency(self):
+        calls = []
+
+        def func(*args):
+            calls.append(args)
+
+        runner = self.create_text_runner(['--raw', '--latency', '-l', '5',
+                                          '-n', '2', '-w', '1'])
+        runner.unroll = 4
+        with tests.capture_stderr():
+            result = runner.bench_func(func, 'a')
+
+        # unroll is ignored: 3 samples (1 warmup) x 5 loops
+        self.assertEqual(calls, [('a',)] * 15)
+        run = result.runs[0]
+        self.assertIsNone(run.inner_loops)
+        self.assertEqual(run.metadata['latency'], 'per call')
+        # each call of samples is recorded, warmups are ignored
+        self.assertEqual(run._get_sketch().count, 10)
+        self.assertEqual(len(run.samples), 2)
+
+        # the histogram is sent to the parent process
+        run2 = perf.RunResult._binary_load(run._binary())
+        self.assertEqual(run2._get_sketch().count, 10)
+
+    def test_bench_func_work(self):
+        runner = self.create_text_runner(['--raw', '-l', '3', '-n', '2',
+                                          '-w', '1', '-v'])
+        with tests.capture_stdout() as stdout:
+            result = runner.bench_func(len, 'abc', work=3)
+
+        run = result.runs[0]
+        self.assertEqual(run.metadata['work'], '3')
+        self.assertEqual(run.metadata['work_unit'], 'bytes')
+        self.assertEqual(result._get_throughput(), (3.0, 'bytes'))
+        self.assertRegex(stdout.getvalue(), r'Average: .* [kMG]?B/s')
+        self.assertIsNone(runner.work)
+
+        self.assertRaises(TypeError, runner.bench_func, len, 'abc',
+                          unknown=1)
+        self.assertRaises(ValueError, runner.bench_func, len, 'abc',
+                          work=1, work_unit='lines')
+
+    def test_latency_bench_sample_func(self):
+        runner = self.create_text_runner(['--raw', '--latency'])
+        with tests.capture_stderr():
+            self.assertRaises(SystemExit,
+                              runner.bench_sample_func, check_args, 1, 2)
+
     def test_bench_sample_func_raw(self):
         runner = self.create_text_runner(['--raw', '--json', '--verbose'])
 
@@ -115,6 +182,31 @@ class TestTextRunner(unittest.TestCase):
         self.assertEqual(result.runs[0].loops, 10 ** 3)
         self.assertEqual(result.runs[0].metadata['loops'], '1000')
 
+    def test_bench_command_cpu_time(self):
+        # each spawned command takes 10 ms
+        clock = [0.0]
+
+        def fake_popen(args, **kwargs):
+            clock[0] += 0.01
+            proc = mock.Mock()
+            proc.wait.return_value = 0
+            return proc
+
+        subprocess = mock.Mock(Popen=fake_popen)
+        usage = mock.Mock(ru_utime=3.1, ru_stime=1.0, ru_maxrss=0)
+        runner = self.create_text_runner(['--raw', '-l', '0',
+                                          '-w', '1', '-n', '2'])
+        with mock.patch('perf._import_subprocess', return_value=subprocess):
+            with mock.patch('perf.perf_counter', lambda: clock[0]):
+                with mock.patch('resource.getrusage', return_value=usage):
+                    with tests.capture_stdout():
+                        result = runner.bench_command(['cmd'])
+
+        # calibration spawns 1 + 10 commands, and then 3 samples of 10 loops
+        self.assertEqual(result.runs[0].loops, 10)
+        self.assertEqual(result.get_metadata()['command_cpu_time'],
+                         '100.0 ms')
+
     def test_json_file_raw(self):
         with tempfile.NamedTemporaryFile('wb+') as tmp:
             runner = self.create_text_runner(['--raw', '-v',
@@ -172,6 +264,534 @@ class TestTextRunner(unittest.TestCase):
                 runner._cpu_affinity()
         self.assertEqual(mock_setaffinity.call_count, 0)
 
+    def test_python_interleaved(self):
+        runner = self.create_text_runner(['-p', '3', '-l', '1',
+                                          '--python', 'python_a',
+                                          '--python', 'python_b'])
+        pythons = []
+
+        def from_subprocess(args, **kw):
+            pythons.append(args[0])
+            sample = 1.0 if args[0] == 'python_a' else 2.0
+            return perf.RunResult([sample], loops=1)
+
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with tests.capture_stdout():
+                result = runner._spawn_workers()
+
+        # each round spawns one worker per Python executable
+        self.assertEqual(len(pythons), 6)
+        for index in range(0, 6, 2):
+            self.assertEqual(sorted(pythons[index:index + 2]),
+                             ['python_a', 'python_b'])
+
+        self.assertIsInstance(result, perf.BenchmarkSuite)
+        self.assertEqual(result.get_benchmark_names(),
+                         ['test_runner (python_a)',
+                          'test_runner (python_b)'])
+        self.assertEqual(result.benchmarks[0].get_samples(), [1.0] * 3)
+        self.assertEqual(result.benchmarks[1].get_samples(), [2.0] * 3)
+
+    def test_stop_early(self):
+        runner = self.create_text_runner(['-p', '25', '-l', '1',
+                                          '--stop-early',
+                                          '--python', 'python_a',
+                                          '--python', 'python_b'])
+        samples = itertools.cycle((0.99, 1.0, 1.01))
+
+        def from_subprocess(args, **kw):
+            sample = next(samples)
+            if args[0] == 'python_b':
+                sample *= 2
+            return perf.RunResult([sample], loops=1)
+
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with tests.capture_stdout() as stdout:
+                result = runner._spawn_workers()
+
+        for bench in result.benchmarks:
+            self.assertEqual(len(bench.runs), 3)
+        self.assertIn('Stop early after 3 runs: significant difference',
+                      stdout.getvalue())
+
+    def test_stop_early_suite(self):
+        runner = self.create_text_runner(['-p', '25', '-l', '1',
+                                          '--stop-early',
+                                          '--python', 'python_a',
+                                          '--python', 'python_b'])
+        samples = itertools.cycle((0.99, 1.0, 1.01))
+
+        def from_subprocess(args, **kw):
+            sample = next(samples)
+            # python_b is 2x slower on the benchmark "slow" and 10% slower
+            # on the benchmark "noisy"
+            if args[0] == 'python_b':
+                if '--benchmark=slow' in args:
+                    sample *= 2
+                else:
+                    sample *= 1.1
+            return perf.RunResult([sample], loops=1)
+
+        tasks = runner._create_tasks([('noisy', 1), ('slow', 1)])
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with tests.capture_stdout() as stdout:
+                result = runner._spawn_workers(tasks)
+
+        self.assertEqual(len(result.benchmarks), 4)
+        for bench in result.benchmarks:
+            self.assertLess(len(bench.runs), 25)
+        stdout = stdout.getvalue()
+        self.assertIn('Stop early:\n', stdout)
+        self.assertIn('- slow: after 3 runs: significant difference', stdout)
+        self.assertRegex(stdout, r'- noisy: after [0-9]+ runs: ')
+
+    def test_stop_early_requires_two_pythons(self):
+        runner = perf.text_runner.TextRunner()
+        with tests.capture_stderr():
+            self.assertRaises(SystemExit,
+                              runner.parse_args, ['--stop-early'])
+
+    def test_time_budget(self):
+        runner = self.create_text_runner(['-l', '1', '--time-budget', '20'])
+        clock = itertools.count()
+        noise = itertools.cycle((0.5, 1.0, 1.5))
+
+        def from_subprocess(args, **kw):
+            if '--benchmark=stable' in args:
+                sample = 1.0
+            else:
+                sample = next(noise)
+            return perf.RunResult([sample], loops=1)
+
+        def sample_func(loops):
+            return 1.0
+
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            # each worker process takes 1 second
+            with mock.patch('perf.monotonic_clock', lambda: next(clock)):
+                with tests.capture_stdout() as stdout:
+                    result = runner.bench_sample_funcs(
+                        [('stable', sample_func), ('noisy', sample_func)])
+
+        self.assertIsInstance(result, perf.BenchmarkSuite)
+        stable = result.get_benchmark('stable')
+        noisy = result.get_benchmark('noisy')
+        # runs after the first 3 rounds go to the noisy benchmark
+        self.assertEqual(len(stable.runs), 3)
+        self.assertGreater(len(noisy.runs), 3)
+        self.assertIn('Precision (95% confidence interval of the mean):\n'
+                      '- stable: +- 0.0% (3 runs)\n',
+                      stdout.getvalue())
+
+        # the precision is stored in the result
+        self.assertEqual(stable.get_metadata()['precision'], '+- 0.0%')
+        self.assertRegex(noisy.get_metadata()['precision'],
+                         r'^\+- [0-9.]+%$')
+        suite = perf.BenchmarkSuite.json_load(result.json())
+        self.assertEqual(suite.get_benchmark('stable').get_metadata()
+                         ['precision'], '+- 0.0%')
+
+    def test_bench_sample_funcs_worker(self):
+        runner = self.create_text_runner(['--raw', '-l', '1', '-n', '1',
+                                          '-w', '0', '--benchmark', 'b'])
+
+        def sample_func_a(loops):
+            return 1.0
+
+        def sample_func_b(loops):
+            return 2.0
+
+        with tests.capture_stdout():
+            result = runner.bench_sample_funcs([('a', sample_func_a),
+                                                ('b', sample_func_b)])
+        self.assertEqual(result.get_benchmark_names(), ['b'])
+        self.assertEqual(result.benchmarks[0].get_samples(), [2.0])
+
+    def test_bench_sample_func_grid_worker(self):
+        runner = self.create_text_runner(['--raw', '-l', '1', '-n', '1',
+                                          '-w', '0',
+                                          '--benchmark', 'sort(n=100, k=2)'])
+        runner.name = 'sort'
+        calls = []
+
+        def sample_func(loops, n, k):
+            calls.append((n, k))
+            return float(n * k)
+
+        with tests.capture_stdout():
+            result = runner.bench_sample_func_grid(sample_func,
+                                                   [('n', [10, 100]),
+                                                    ('k', [1, 2])])
+        self.assertEqual(result.get_benchmark_names(), ['sort(n=100, k=2)'])
+        self.assertEqual(result.benchmarks[0].get_samples(), [200.0])
+        self.assertEqual(calls, [(100, 2)])
+
+    def test_bench_func_threads_worker(self):
+        runner = self.create_text_runner(['--raw', '-l', '10', '-n', '2',
+                                          '-w', '1', '--benchmark',
+                                          'test_runner(threads=4)'])
+        calls = []
+
+        with tests.capture_stdout():
+            result = runner.bench_func_threads(lambda: calls.append(None),
+                                               threads=[1, 4])
+        self.assertEqual(result.get_benchmark_names(),
+                         ['test_runner(threads=4)'])
+        self.assertEqual(len(result.benchmarks[0].get_samples()), 2)
+        # every loop is run by one thread
+        self.assertEqual(len(calls), 3 * 10)
+
+        self.assertEqual(perf.text_runner._split_loops(10, 4), [3, 3, 2, 2])
+        self.assertRaises(ValueError, runner.bench_func_threads,
+                          lambda: None, threads=[0])
+
+    def test_bench_func_processes_worker(self):
+        runner = self.create_text_runner(['--raw', '-l', '10', '-n', '1',
+                                          '-w', '0', '--benchmark',
+                                          'test_runner(processes=2)'])
+
+        import multiprocessing
+        create_pool = multiprocessing.Pool
+        pools = []
+
+        def fake_pool(*args):
+            pool = mock.Mock(wraps=create_pool(*args))
+            pools.append(pool)
+            return pool
+
+        with mock.patch('multiprocessing.Pool', fake_pool):
+            with tests.capture_stdout():
+                result = runner.bench_func_threads(int, threads=[1, 2],
+                                                   processes=True)
+        self.assertEqual(result.get_benchmark_names(),
+                         ['test_runner(processes=2)'])
+        self.assertEqual(len(result.benchmarks[0].get_samples()), 1)
+
+        # the pool is closed after the samples
+        self.assertEqual(len(pools), 1)
+        pools[0].close.assert_called_once_with()
+        pools[0].join.assert_called_once_with()
+
+    def test_display_scaling(self):
+        runner = self.create_text_runner([])
+        benchmarks = []
+        for nthread, sample in ((1, 1e-6), (2, 0.5e-6), (4, 0.5e-6)):
+            run = perf.RunResult(samples=[sample])
+            benchmarks.append(perf.Benchmark(runs=[run],
+                                             name='threads=%s' % nthread))
+        suite = perf.BenchmarkSuite(benchmarks)
+
+        with tests.capture_stdout() as stdout:
+            runner._display_scaling(suite, 'threads')
+        self.assertEqual(stdout.getvalue(),
+                         'Scaling:\n'
+                         'threads=1: 1.00 M calls/s, efficiency 100%\n'
+                         'threads=2: 2.00 M calls/s, efficiency 100%\n'
+                         'threads=4: 2.00 M calls/s, efficiency 50%\n')
+
+    def test_bench_sample_funcs_interleaved_worker(self):
+        rfd, wfd = os.pipe()
+        runner = self.create_text_runner(['--raw', '-l', '1', '-n', '2',
+                                          '-w', '1', '--pipe=%s' % wfd])
+        calls = []
+
+        def create_sample_func(name, dt):
+            def sample_func(loops):
+                calls.append(name)
+                return dt
+            return sample_func
+
+        sample_funcs = [(name, create_sample_func(name, dt))
+                        for name, dt in (('a', 1.0), ('b', 2.0), ('c', 3.0))]
+        try:
+            with tests.capture_stdout():
+                result = runner.bench_sample_funcs(sample_funcs,
+                                                   interleave=True)
+            with os.fdopen(rfd, 'rb') as fp:
+                runs = perf.RunResult._binary_load_list(fp.read())
+        except:
+            os.close(rfd)
+            raise
+
+        # the first function is rotated at each sample
+        self.assertEqual(calls, list('abc' 'bca' 'cab'))
+        self.assertEqual(result.get_benchmark_names(), ['a', 'b', 'c'])
+        self.assertEqual([run.samples for run in runs],
+                         [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+        self.assertEqual([run.warmups for run in runs],
+                         [[1.0], [2.0], [3.0]])
+
+    def test_bench_sample_funcs_interleaved(self):
+        spawned = []
+
+        def list_from_subprocess(args, nrun, **kw):
+            spawned.append(args)
+            return [perf.RunResult([float(index)], loops=2)
+                    for index in range(nrun)]
+
+        runner = self.create_text_runner(['-p', '3', '-l', '2', '-n', '1'])
+        with mock.patch('perf.RunResult._list_from_subprocess',
+                        list_from_subprocess):
+            with tests.capture_stdout():
+                result = runner.bench_sample_funcs([('a', None),
+                                                    ('b', None)],
+                                                   interleave=True)
+
+        # one worker process per run runs all benchmarks
+        self.assertEqual(len(spawned), 3)
+        for args in spawned:
+            self.assertFalse(any(arg.startswith('--benchmark')
+                                 for arg in args))
+        self.assertEqual([bench.get_samples() for bench in result.benchmarks],
+                         [[0.0] * 3, [1.0] * 3])
+
+    def resume(self, metadata):
+        runs = [perf.RunResult([1.0, 1.0], warmups=[1.0], loops=8,
+                               metadata={'hostname': 'toto'})
+                for index in range(2)]
+        bench = perf.Benchmark(runs, name='test_runner')
+        spawned = []
+
+        def from_subprocess(args, **kw):
+            spawned.append(args)
+            return perf.RunResult([2.0, 2.0], warmups=[2.0], loops=8,
+                                  metadata=dict(metadata))
+
+        with tempfile.NamedTemporaryFile('w+') as tmp:
+            bench.json_dump_into(tmp)
+            tmp.flush()
+
+            runner = self.create_text_runner(['-p', '4', '-l', '1', '-n', '2',
+                                              '--json-file', tmp.name,
+                                              '--resume'])
+            with mock.patch('perf.RunResult.from_subprocess',
+                            from_subprocess):
+                with tests.capture_stdout():
+                    with tests.capture_stderr() as stderr:
+                        try:
+                            runner._spawn_workers()
+                        except SystemExit:
+                            pass
+
+            with open(tmp.name) as fp:
+                result = perf.Benchmark.json_load_from(fp)
+        return (spawned, result, stderr.getvalue())
+
+    def test_resume(self):
+        spawned, result, stderr = self.resume({'hostname': 'toto'})
+
+        # only spawn missing runs using the loops of the previous session
+        self.assertEqual(len(spawned), 2)
+        for args in spawned:
+            self.assertIn('8', args)
+        self.assertEqual(result.get_samples(), [1.0] * 4 + [2.0] * 4)
+
+    def test_resume_time_budget(self):
+        runs = [perf.RunResult([1.0], loops=1, metadata={'hostname': 'toto'})
+                for index in range(3)]
+        bench = perf.Benchmark(runs, name='test_runner')
+        spawned = []
+
+        def from_subprocess(args, **kw):
+            spawned.append(args)
+            return perf.RunResult([2.0], loops=1,
+                                  metadata={'hostname': 'toto'})
+
+        with tempfile.NamedTemporaryFile('w+') as tmp:
+            bench.json_dump_into(tmp)
+            tmp.flush()
+
+            runner = self.create_text_runner(['-l', '1', '-n', '1', '-w', '0',
+                                              '--time-budget', '5',
+                                              '--json-file', tmp.name,
+                                              '--resume'])
+            clock = itertools.count()
+            with mock.patch('perf.RunResult.from_subprocess',
+                            from_subprocess):
+                # each worker process takes 1 second
+                with mock.patch('perf.monotonic_clock', lambda: next(clock)):
+                    with tests.capture_stdout():
+                        result = runner._spawn_workers()
+
+        # the 3 runs loaded by --resume are kept, new runs are spawned to
+        # measure the cost and then until the budget is spent
+        self.assertGreater(len(spawned), 1)
+        self.assertEqual(len(result.runs), 3 + len(spawned))
+        self.assertEqual(result.get_samples()[:3], [1.0] * 3)
+
+    def test_resume_incompatible_metadata(self):
+        spawned, result, stderr = self.resume({'hostname': 'other'})
+
+        self.assertEqual(len(spawned), 1)
+        self.assertIn("ERROR: unable to resume: test_runner: "
+                      "incompatible metadata hostname", stderr)
+        # the file is unchanged
+        self.assertEqual(result.get_samples(), [1.0] * 4)
+
+    def spawn_failing_workers(self, args, nfailure):
+        class FakeWorker:
+            returncode = 3
+            timed_out = False
+            stderr_tail = 'Traceback...\nMemoryError\n'
+
+        calls = []
+
+        def from_subprocess(args, **kw):
+            calls.append(args)
+            if len(calls) <= nfailure:
+                raise perf._WorkerError("worker failed with exit code 3",
+                                        FakeWorker())
+            return perf.RunResult([1.0], loops=1)
+
+        runner = self.create_text_runner(['-p', '2', '-l', '1',
+                                          '--retry-delay', '0'] + args)
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with tests.capture_stdout() as stdout:
+                try:
+                    result = runner._spawn_workers()
+                except RuntimeError as exc:
+                    result = exc
+        return (result, calls, stdout.getvalue())
+
+    def test_retry(self):
+        result, calls, stdout = self.spawn_failing_workers(['--retries', '2'],
+                                                           2)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(len(result.runs), 2)
+        self.assertEqual(len(result.failed_runs), 2)
+        self.assertEqual(result.failed_runs[0],
+                         {'error': 'worker failed with exit code 3',
+                          'exitcode': 3,
+                          'stderr': 'Traceback...\nMemoryError'})
+        self.assertEqual(result.get_metadata()['failed_runs'], '2')
+        self.assertIn('WARNING: worker failed with exit code 3; '
+                      'retry 1/2 in ', stdout)
+
+        # failed runs are stored in JSON
+        bench = perf.Benchmark.json_load(result.json())
+        self.assertEqual(bench.failed_runs, result.failed_runs)
+
+    def test_host_metadata(self):
+        # worker processes only collect metadata of the run
+        runner = self.create_text_runner(['--raw', '--worker', '-l', '1',
+                                          '-n', '1', '-w', '0'])
+        with tests.capture_stdout():
+            result = runner.bench_sample_func(lambda loops: 1.0)
+        metadata = result.runs[0].metadata
+        self.assertIn('date', metadata)
+        self.assertIn('python_version', metadata)
+        self.assertNotIn('hostname', metadata)
+        self.assertNotIn('platform', metadata)
+
+        # the main process collects host metadata once and adds them to runs
+        calls = []
+
+        def from_subprocess(args, **kw):
+            calls.append(args)
+            return perf.RunResult([1.0], loops=1,
+                                  metadata={'date': 'now',
+                                            'cpu_count': 'worker'})
+
+        runner = self.create_text_runner(['-p', '3', '-l', '1'])
+        collect_host_metadata = perf.metadata.collect_host_metadata
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with mock.patch('perf.metadata.collect_host_metadata',
+                            wraps=collect_host_metadata) as collect:
+                with tests.capture_stdout():
+                    result = runner._spawn_workers()
+        self.assertEqual(collect.call_count, 1)
+        self.assertIn('--worker', calls[0])
+        for run in result.runs:
+            self.assertIn('hostname', run.metadata)
+            self.assertIn('platform', run.metadata)
+            # metadata of the worker are kept
+            self.assertEqual(run.metadata['cpu_count'], 'worker')
+
+    def test_wait_quiet(self):
+        usages = iter(['50.0%', '2.0%', '0.5%'])
+
+        def from_subprocess(args, **kw):
+            return perf.RunResult([1.0], loops=1,
+                                  metadata={'cpu_usage_others': next(usages)})
+
+        runner = self.create_text_runner(['-p', '3', '-l', '1',
+                                          '--wait-quiet', '10'])
+        with mock.patch('perf.RunResult.from_subprocess', from_subprocess):
+            with mock.patch('perf._load.wait_quiet',
+                            return_value=(1.0, 0.5)) as wait_quiet:
+                with tests.capture_stdout() as stdout:
+                    result = runner._spawn_workers()
+
+        # wait before each worker process
+        self.assertEqual(wait_quiet.call_count, 3)
+        self.assertEqual(wait_quiet.call_args[0][0], 10.0)
+        self.assertEqual([run.metadata.get('under_load')
+                          for run in result.runs],
+                         ['yes', None, None])
+        self.assertIn('WARNING: 1 run executed under load (CPU usage of '
+                      'other processes >= 10.0%)', stdout.getvalue())
+
+    def test_retry_give_up(self):
+        # all retries failed: the failed run is recorded and the next run
+        # is spawned
+        result, calls, stdout = self.spawn_failing_workers(['--retries', '2'],
+                                                           3)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(len(result.runs), 1)
+        self.assertEqual(len(result.failed_runs), 3)
+        self.assertIn('WARNING: worker failed with exit code 3; '
+                      'skip the run', stdout)
+
+        # without retry, a failure doesn't abort the session
+        result, calls, stdout = self.spawn_failing_workers([], 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(result.runs), 1)
+        self.assertEqual(len(result.failed_runs), 1)
+
+        # every run failed
+        result, calls, stdout = self.spawn_failing_workers([], 2)
+        self.assertEqual(str(result),
+                         'all runs failed: worker failed with exit code 3')
+
+        # too many failures
+        result, calls, stdout = self.spawn_failing_workers(['--retries', '5',
+                                                            '--max-failures',
+                                                            '1'],
+                                                           3)
+        self.assertEqual(str(result),
+                         'give up after 2 failed runs: '
+                         'worker failed with exit code 3')
+        self.assertEqual(len(calls), 2)
+
+    def test_max_failures_partial_result(self):
+        # the runs completed before giving up are written
+        with tempfile.NamedTemporaryFile(mode="w+") as tmp:
+            calls = []
+
+            def from_subprocess(args, **kw):
+                calls.append(args)
+                if len(calls) > 1:
+                    worker = mock.Mock(returncode=3, timed_out=False,
+                                       stderr_tail='')
+                    raise perf._WorkerError("worker failed", worker)
+                return perf.RunResult([1.0], loops=1)
+
+            runner = self.create_text_runner(['-p', '3', '-l', '1',
+                                              '--max-failures', '0',
+                                              '--json-file', tmp.name])
+            with mock.patch('perf.RunResult.from_subprocess',
+                            from_subprocess):
+                with tests.capture_stdout() as stdout:
+                    with self.assertRaises(RuntimeError):
+                        runner._spawn_workers()
+
+            # the file was replaced: open it again
+            with open(tmp.name) as fp:
+                bench = perf.Benchmark.json_load_from(fp)
+        self.assertEqual(len(bench.runs), 1)
+        self.assertEqual(len(bench.failed_runs), 1)
+        self.assertIn('ERROR: give up after 1 failed run', stdout.getvalue())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -107,7 +107,9 @@ class TestTimeit(unittest.TestCase):
             stdout = proc.communicate()[0]
             self.assertEqual(proc.returncode, 0)
 
-            result = perf.Benchmark.json_load_from(tmp)
+            # the file is replaced atomically: open it again
+            with open(tmp.name) as fp:
+                result = perf.Benchmark.json_load_from(fp)
 
         self.assertEqual(len(result.runs), 2)
         for run in result.runs:
@@ -121,6 +123,84 @@ class TestTimeit(unittest.TestCase):
             for sample in run.samples:
                 self.assertTrue(MIN_SAMPLE <= sample * 1e3 <= MAX_SAMPLE, sample)
 
+    def test_named_stmts(self):
+        if perf._PY3:
+            tmp = tempfile.NamedTemporaryFile('w+', encoding='utf-8')
+        else:
+            tmp = tempfile.NamedTemporaryFile()
+        with tmp:
+            args = [sys.executable,
+                    '-m', 'perf.timeit',
+                    '-p', '2',
+                    '-n', '3',
+                    '-l', '4',
+                    '--json-file', tmp.name,
+                    '-s', 'import time',
+                    '--stmt', 'sleep=' + SLEEP,
+                    '--stmt', 'pass=pass']
+            proc = subprocess.Popen(args,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            stdout = proc.communicate()[0]
+            self.assertEqual(proc.returncode, 0)
+            self.assertRegex(stdout, r'^\.\.\n')
+
+            with open(tmp.name) as fp:
+                suite = perf.BenchmarkSuite.json_load_from(fp)
+
+        self.assertEqual(suite.get_benchmark_names(), ['sleep', 'pass'])
+        for bench in suite.benchmarks:
+            self.assertEqual(len(bench.runs), 2)
+            for run in bench.runs:
+                self.assertEqual(len(run.samples), 3)
+                self.assertEqual(run.metadata['loops'], '4')
+
+        for sample in suite.get_benchmark('sleep').get_samples():
+            self.assertTrue(MIN_SAMPLE <= sample * 1e3 <= MAX_SAMPLE, sample)
+
+    def test_param(self):
+        if perf._PY3:
+            tmp = tempfile.NamedTemporaryFile('w+', encoding='utf-8')
+        else:
+            tmp = tempfile.NamedTemporaryFile()
+        with tmp:
+            args = [sys.executable,
+                    '-m', 'perf.timeit',
+                    '-p', '1',
+                    '-n', '1',
+                    '-w', '0',
+                    '-l', '1',
+                    '--json-file', tmp.name,
+                    '--param', 'n=10,100',
+                    '-s', 'x = list(range(n))',
+                    'sorted(x)']
+            proc = subprocess.Popen(args,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            proc.communicate()
+            self.assertEqual(proc.returncode, 0)
+
+            with open(tmp.name) as fp:
+                suite = perf.BenchmarkSuite.json_load_from(fp)
+
+        self.assertEqual(suite.get_benchmark_names(), ['n=10', 'n=100'])
+
+    def test_stmt_writing_stdout(self):
+        # stdout of worker processes doesn't corrupt results
+        args = [sys.executable,
+                '-m', 'perf.timeit',
+                '-p', '2',
+                '-n', '2',
+                '-l', '3',
+                'print("hello")']
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout = proc.communicate()[0]
+        self.assertEqual(proc.returncode, 0)
+        self.assertRegex(stdout, r'^\.\.\n')
+        self.assertNotIn('hello', stdout)
+
     def test_cli_help(self):
         args = [sys.executable,
                 '-m', 'perf.timeit', '--help']
@@ -135,8 +215,18 @@ class TestTimeit(unittest.TestCase):
         self.assertIn('[-h] [-p PROCESSES] [-n NSAMPLE] [-w NWARMUP] [-l LOOPS] '
                       '[-v] [--json] [--json-file FILENAME] [--min-time MIN_TIME] '
                       '[--max-time MAX_TIME] [--raw] [--metadata] '
-                      '[--affinity CPU_LIST] [-s SETUP] stmt [stmt ...]',
+                      '[--affinity CPU_LIST] [--python PATH] '
+                      '[--stop-early] [--min-effect PERCENT] '
+                      '[--time-budget SECONDS] [--benchmark NAME] '
+                      '[--resume] [--timeout SECONDS] [--retries N] '
+                      '[--retry-delay SECONDS] [--max-failures N] '
+                      '[--wait-quiet THRESHOLD] [--latency] '
+                      '[-s SETUP] [--stmt NAME=STMT] [--param NAME=VALUES] '
+                      '[stmt ...]',
                       stdout)
+        # internal options are hidden
+        self.assertNotIn('--pipe', stdout)
+        self.assertNotIn('--worker', stdout)
 
     def test_cli_snippet_error(self):
         args = [sys.executable,
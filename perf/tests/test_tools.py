@@ -1,6 +1,8 @@
+import sys
 import unittest
 
 import perf
+from perf.tests import mock
 
 
 class TestClocks(unittest.TestCase):
@@ -43,8 +45,47 @@ class TestStatistics(unittest.TestCase):
         # self.assertEqual(perf.is_significant(samples, samples),
         #                  (True, -141.4213562373095))
 
+    def test_sequential_test(self):
+        # not enough data: continue
+        self.assertEqual(perf._sequential_test([1.0, 1.1, 0.9],
+                                               [1.1, 0.9, 1.3], 25, 0.01)[0],
+                         None)
+
+        # significant
+        verdict, t_score = perf._sequential_test([1.0, 1.01, 0.99],
+                                                 [2.0, 2.01, 1.99], 25, 0.01)
+        self.assertEqual(verdict, 'significant')
+        self.assertLess(t_score, 0)
+
+        # equivalent: the difference is smaller than 1%
+        samples1 = [1.0, 1.0001, 0.9999] * 3
+        samples2 = [1.0001, 1.0, 0.9999] * 3
+        self.assertEqual(perf._sequential_test(samples1, samples2, 25, 0.01)[0],
+                         'equivalent')
+
+        # all values are equal
+        self.assertEqual(perf._sequential_test([1.0] * 3, [2.0] * 3, 25, 0.01),
+                         ('significant', None))
+
+    def test_pocock_conf_level(self):
+        self.assertEqual(perf._pocock95_conf_level(1), 1.960)
+        self.assertEqual(perf._pocock95_conf_level(5), 2.413)
+        self.assertEqual(perf._pocock95_conf_level(25), 2.708)
+        self.assertEqual(perf._pocock95_conf_level(26), 2.733)
+        self.assertEqual(perf._pocock95_conf_level(1000), 3.0)
+
 
 class TestTools(unittest.TestCase):
+    def test_import_psutil_missing(self):
+        with mock.patch('perf.psutil', perf._NOT_IMPORTED):
+            # None in sys.modules makes the import fail
+            with mock.patch.dict(sys.modules, {'psutil': None}):
+                self.assertIsNone(perf._import_psutil())
+
+            # the failed import is not tried again
+            with mock.patch.dict(sys.modules, {'psutil': mock.Mock()}):
+                self.assertIsNone(perf._import_psutil())
+
     def test_timedelta(self):
         def fmt_delta(seconds):
             return perf._format_timedelta(seconds)
@@ -87,6 +128,28 @@ class TestTools(unittest.TestCase):
         self.assertEqual(perf._format_run_result([1.0, 1.5, 2.0], 2),
                          "1.50 sec +- 0.50 sec (min: 1.00 sec, max: 2.00 sec)")
 
+    def test_format_throughput(self):
+        self.assertEqual(perf._format_rates((1.5e6, 2e5), 'bytes'),
+                         ('1.50 MB/s', '0.20 MB/s'))
+        self.assertEqual(perf._format_rate(123.0, 'items'), '123 items/s')
+        self.assertEqual(perf._format_rate(12.5e3, 'items'), '12.5 k items/s')
+
+        # the minimum time is the maximum throughput
+        run = perf.RunResult([1e-3, 2e-3], work=10 ** 6)
+        self.assertEqual(run.metadata['work'], '1000000')
+        self.assertEqual(run.metadata['work_unit'], 'bytes')
+        self.assertEqual(run.format(2),
+                         '667 MB/s +- 314 MB/s '
+                         '(min: 500 MB/s, max: 1000 MB/s)')
+        bench = perf.Benchmark(runs=[run])
+        self.assertEqual(bench.format(), '667 MB/s +- 314 MB/s')
+        self.assertEqual(perf.RunResult([2e-3], work=5,
+                                        work_unit='items').format(),
+                         '2.50 k items/s')
+
+        self.assertRaises(ValueError, perf.RunResult, work=0)
+        self.assertRaises(ValueError, perf.RunResult, work=1, work_unit='sec')
+
     def test_format_number(self):
         # plural
         self.assertEqual(perf._format_number(0, 'unit'), '0 unit')
@@ -128,6 +191,45 @@ class TestResult(unittest.TestCase):
         self.assertEqual(run.loops, 10)
         self.assertEqual(run.inner_loops, 3)
 
+    def test_run_result_binary(self):
+        run = perf.RunResult(samples=[1.0, 1.5, 2.0], warmups=[5.0],
+                             loops=10, inner_loops=3)
+        run.metadata = {'key': 'value'}
+
+        data = run._binary()
+        self.assertTrue(data.startswith(perf._BINARY_MAGIC))
+        run = perf.RunResult._binary_load(data)
+        self.assertEqual(run.samples, [1.0, 1.5, 2.0])
+        self.assertEqual(run.warmups, [5.0])
+        self.assertEqual(run.metadata, {'key': 'value'})
+        self.assertEqual(run.loops, 10)
+        self.assertEqual(run.inner_loops, 3)
+
+        self.assertRaises(ValueError, perf.RunResult._binary_load, data[:-1])
+        self.assertRaises(ValueError, perf.RunResult._binary_load, b'json')
+
+    def test_params(self):
+        params = [('n', 10), ('k', 'x')]
+        self.assertEqual(perf._format_params(params), 'n=10, k=x')
+        self.assertEqual(perf._parse_params('n=10, k=x'),
+                         [('n', '10'), ('k', 'x')])
+        self.assertEqual(perf._parse_params('sort(n=10)'), [('n', '10')])
+        self.assertIsNone(perf._parse_params('sort'))
+        self.assertIsNone(perf._parse_params('sort(n)'))
+
+    def test_run_result_binary_list(self):
+        run1 = perf.RunResult(samples=[1.0], loops=10)
+        run2 = perf.RunResult(samples=[2.0, 3.0], loops=20)
+        data = run1._binary() + run2._binary()
+
+        runs = perf.RunResult._binary_load_list(data)
+        self.assertEqual([run.samples for run in runs], [[1.0], [2.0, 3.0]])
+        self.assertEqual([run.loops for run in runs], [10, 20])
+
+        self.assertEqual(perf.RunResult._binary_load_list(b''), [])
+        self.assertRaises(ValueError,
+                          perf.RunResult._binary_load_list, data[:-1])
+
     def test_results(self):
         runs = []
         for sample in (1.0, 1.5, 2.0):
@@ -147,6 +249,43 @@ class TestResult(unittest.TestCase):
                          '1.50 sec +- 0.50 sec '
                          '(3 runs x 1 sample)')
 
+    def test_benchmark_json_common_metadata(self):
+        runs = []
+        for index, date in enumerate(('day1', 'day2', 'day3')):
+            run = perf.RunResult([1.0])
+            run.metadata = {'hostname': 'host', 'date': date}
+            if index:
+                run.metadata['cpu_freq'] = '3 GHz'
+            runs.append(run)
+        bench = perf.Benchmark(runs, 'bench')
+
+        # metadata common to all runs are only stored once
+        data = bench._as_json()['results']
+        self.assertEqual(data['metadata'], {'hostname': 'host'})
+        for run_data in data['runs']:
+            self.assertNotIn('hostname', run_data['run_result']['metadata'])
+
+        bench2 = perf.Benchmark.json_load(bench.json())
+        self.assertEqual([run.metadata for run in bench2.runs],
+                         [run.metadata for run in runs])
+
+    def test_suite_json(self):
+        bench1 = perf.Benchmark([perf.RunResult([1.0, 1.5])], "bench1")
+        bench2 = perf.Benchmark([perf.RunResult([2.0])], "bench2")
+        suite = perf.BenchmarkSuite([bench1, bench2])
+
+        suite = perf.BenchmarkSuite.json_load(suite.json())
+        self.assertEqual(suite.get_benchmark_names(), ['bench1', 'bench2'])
+        self.assertEqual(suite.get_benchmark('bench2').get_samples(), [2.0])
+        self.assertRaises(KeyError, suite.get_benchmark, 'bench3')
+        self.assertRaises(ValueError, suite.add_benchmark,
+                          perf.Benchmark(name='bench1'))
+
+        # a file of a single benchmark is loaded as a suite
+        suite = perf.BenchmarkSuite.json_load(bench1.json())
+        self.assertEqual(suite.get_benchmark_names(), ['bench1'])
+        self.assertEqual(suite.benchmarks[0].get_samples(), [1.0, 1.5])
+
 
 class MiscTests(unittest.TestCase):
     def test_version(self):
@@ -0,0 +1,60 @@
+import io
+import sys
+import time
+
+import perf
+from perf import _worker
+from perf import tests
+from perf.tests import unittest
+
+
+def python_args(code):
+    return [sys.executable, '-c', code]
+
+
+class TestWorker(unittest.TestCase):
+    def test_concurrent_workers(self):
+        stderr = io.StringIO()
+        code = ('import sys; '
+                'sys.stderr.write("progress %s\\n"); '
+                'print("result %s")')
+        workers = [_worker.WorkerProcess(python_args(code % (index, index)),
+                                         stderr_file=stderr)
+                   for index in range(3)]
+        _worker.supervise(workers)
+
+        for index, worker in enumerate(workers):
+            self.assertEqual(worker.returncode, 0)
+            self.assertEqual(worker.stdout.rstrip(), 'result %s' % index)
+            self.assertEqual(worker.stderr_tail, 'progress %s\n' % index)
+            self.assertIn('progress %s\n' % index, stderr.getvalue())
+
+    def test_stderr_tail(self):
+        code = 'import sys; sys.stderr.write("x" * 100000 + "end")'
+        worker = _worker.WorkerProcess(python_args(code))
+        _worker.supervise([worker])
+
+        self.assertEqual(len(worker.stderr_tail), _worker._STDERR_TAIL)
+        self.assertTrue(worker.stderr_tail.endswith('xend'))
+
+    def test_timeout(self):
+        code = 'import time; time.sleep(60)'
+        start = time.time()
+        worker = _worker.WorkerProcess(python_args(code), timeout=0.5)
+        _worker.supervise([worker])
+        dt = time.time() - start
+
+        self.assertTrue(worker.timed_out)
+        self.assertNotEqual(worker.returncode, 0)
+        self.assertLess(dt, 30.0)
+
+    def test_from_subprocess_timeout(self):
+        args = python_args('import time; time.sleep(60)')
+        with tests.capture_stderr():
+            with self.assertRaises(RuntimeError) as cm:
+                perf.RunResult.from_subprocess(args, timeout=0.5)
+        self.assertIn('killed after a timeout of 500 ms', str(cm.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,27 +1,38 @@
 from __future__ import print_function
-import argparse
-import functools
 import io
+import math
 import os
-import subprocess
 import sys
-
-try:
-    # Optional dependency
-    import psutil
-except ImportError:
-    psutil = None
+import time
 
 import perf
 
 
-def _json_dump(bench, args):
+def _open_json_file(filename):
+    if perf._PY3:
+        return open(filename, "w", encoding="utf-8")
+    else:
+        return open(filename, "wb")
+
+
+def _json_dump_atomic(result, filename):
+    # Write into a temporary file and then rename it, to never leave a
+    # truncated file if the process is killed
+    tmp_filename = filename + '.tmp'
+    with _open_json_file(tmp_filename) as fp:
+        result.json_dump_into(fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    perf._replace_file(tmp_filename, filename)
+
+
+def _json_dump(bench, args, atomic=False):
     if args.json_file:
         # --json-file=FILENAME
-        if perf._PY3:
-            fp = open(args.json_file, "w", encoding="utf-8")
-        else:
-            fp = open(args.json_file, "wb")
+        if atomic:
+            _json_dump_atomic(bench, args.json_file)
+            return
+        fp = _open_json_file(args.json_file)
         with fp:
             bench.json_dump_into(fp)
             fp.flush()
@@ -62,10 +73,208 @@ def _get_isolated_cpus():
     return _parse_cpu_list(isolated)
 
 
+# Worker processes send their result through a dedicated pipe, rather than
+# JSON written into stdout, to leave stdout to the benchmark. On Windows,
+# file descriptors cannot be passed to child processes.
+_RESULT_PIPE = (sys.platform != 'win32')
+
+# Minimum number of runs per task when --time-budget is used
+_TIME_BUDGET_MIN_RUNS = 3
+
+# Maximum time in seconds waiting for a quiet system before spawning a worker
+# process with --wait-quiet
+_WAIT_QUIET_TIMEOUT = 60.0
+
+# Metadata which must be the same in runs loaded by --resume and new runs
+_RESUME_METADATA = ('cpu_model_name', 'hostname', 'platform',
+                    'python_executable', 'python_implementation',
+                    'python_version', 'timeit_setup', 'timeit_stmt',
+                    'command')
+
+
+# Template of the sample function of TextRunner.bench_func(), similar to
+# the template of the timeit module: the code is specialized to the number of
+# arguments to avoid the expensive func(*args) argument unpacking, and the
+# call is repeated unroll times to reduce the overhead of the loop.
+_BENCH_FUNC_TEMPLATE = """
+def sample_func(loops, timer=timer, func=func%(params)s):
+    range_it = range(loops)
+    t0 = timer()
+    for _ in range_it:
+%(calls)s
+    return timer() - t0
+"""
+
+
+# latency mode: each call is timed and its duration is passed to add(), the
+# total duration of calls is returned
+_BENCH_FUNC_LATENCY_TEMPLATE = """
+def sample_func(loops, add=discard, timer=timer, func=func%(params)s):
+    range_it = range(loops)
+    total = 0.0
+    for _ in range_it:
+        t0 = timer()
+%(calls)s
+        dt = timer() - t0
+        add(dt)
+        total += dt
+    return total
+"""
+
+
+def _discard(dt):
+    pass
+
+
+def _compile_bench_func(func, args, unroll, latency=False):
+    if unroll < 1:
+        raise ValueError("unroll must be >= 1")
+
+    names = ['arg%s' % index for index in range(len(args))]
+    params = ''.join(', %s=%s' % (name, name) for name in names)
+    call = '        func(%s)' % ', '.join(names)
+    if latency:
+        template = _BENCH_FUNC_LATENCY_TEMPLATE
+    else:
+        template = _BENCH_FUNC_TEMPLATE
+    code = template % {'params': params,
+                       'calls': '\n'.join([call] * unroll)}
+
+    namespace = dict(zip(names, args))
+    namespace['timer'] = perf.perf_counter
+    namespace['func'] = func
+    namespace['discard'] = _discard
+    code = compile(code, '<perf bench_func>', 'exec')
+    exec(code, namespace)
+    return namespace['sample_func']
+
+
+def _split_loops(loops, nworker):
+    # spread loops on nworker workers: the first workers get one more loop
+    return [loops // nworker + (1 if index < loops % nworker else 0)
+            for index in range(nworker)]
+
+
+def _call_loops(func, loops):
+    for _ in range(loops):
+        func()
+
+
+def _call_loops_task(task):
+    # function of the process pool of bench_func_threads()
+    func, loops = task
+    _call_loops(func, loops)
+
+
+def _threads_sample_func(func, nthread):
+    import threading
+
+    def sample_func(loops):
+        ready = threading.Semaphore(0)
+        start = threading.Event()
+
+        def run(loops):
+            ready.release()
+            start.wait()
+            _call_loops(func, loops)
+
+        threads = [threading.Thread(target=run, args=(thread_loops,))
+                   for thread_loops in _split_loops(loops, nthread)]
+        for thread in threads:
+            thread.start()
+        # don't measure the creation of threads
+        for thread in threads:
+            ready.acquire()
+
+        t0 = perf.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return perf.perf_counter() - t0
+
+    return sample_func
+
+
+def _processes_sample_func(func, nprocess):
+    # the pool is created at the first call, and reused for next samples.
+    # sample_func.close() terminates the processes of the pool.
+    pools = []
+
+    def sample_func(loops):
+        if not pools:
+            import multiprocessing
+            pools.append(multiprocessing.Pool(nprocess))
+        pool = pools[0]
+        tasks = [(func, process_loops)
+                 for process_loops in _split_loops(loops, nprocess)]
+
+        t0 = perf.perf_counter()
+        pool.map(_call_loops_task, tasks, chunksize=1)
+        return perf.perf_counter() - t0
+
+    def close():
+        for pool in pools:
+            pool.close()
+            pool.join()
+        del pools[:]
+
+    sample_func.close = close
+    return sample_func
+
+
+def _resume_error(msg):
+    print("ERROR: unable to resume: %s" % msg, file=sys.stderr)
+    sys.exit(1)
+
+
+class _GiveUp(RuntimeError):
+    """Too many worker processes failed (--max-failures)."""
+
+
+class _WorkerTask:
+    """Worker processes of a benchmark run by a Python executable."""
+
+    def __init__(self, name, loops, python=None, bench_name=None):
+        self.bench = perf.Benchmark(name=name)
+        self.loops = loops
+        self.python = python
+        # name of the benchmark in the suite, passed as --benchmark to
+        # worker processes
+        self.bench_name = bench_name
+        # elapsed time in seconds of each worker process
+        self.durations = []
+        # True if runs were loaded by --resume and the metadata of the
+        # first new run was not checked yet
+        self.resumed = False
+        # Tasks sharing worker processes, each worker process running all
+        # benchmarks of the group (interleaved suite), or None
+        self.group = None
+        # Verdict of --stop-early for the benchmark, or None
+        self.stop_reason = None
+
+    def run_means(self):
+        statistics = perf._import_statistics()
+        return [statistics.mean(run.samples) for run in self.bench.runs]
+
+    def precision(self):
+        """Relative standard error of the mean of runs.
+
+        Return None if there are less than 2 runs.
+        """
+        means = self.run_means()
+        if len(means) < 2:
+            return None
+        statistics = perf._import_statistics()
+        mean = statistics.mean(means)
+        if not mean:
+            return None
+        return statistics.stdev(means) / mean / math.sqrt(len(means))
+
+
 class TextRunner:
     def __init__(self, name=None, nsample=3, nwarmup=1, nprocess=25,
                  nloop=0, min_time=0.1, max_time=1.0, metadata=None,
-                 inner_loops=None):
+                 inner_loops=None, unroll=1, work=None, work_unit='bytes'):
         self.name = name
         if metadata is not None:
             self.metadata = metadata
@@ -89,6 +298,35 @@ class TextRunner:
         # Number of inner-loops of the sample_func for bench_sample_func()
         self.inner_loops = inner_loops
 
+        # Number of calls to func per loop iteration for bench_func(),
+        # the inner_loops of the result are multiplied by unroll
+        self.unroll = unroll
+
+        # Work per call of the benchmarked function (number of bytes or
+        # items, see work_unit): if set, the throughput is displayed
+        # instead of the time
+        self.work = work
+        self.work_unit = work_unit
+
+        # the argument parser is only created on demand
+        self._argparser = None
+        # metadata of the host, collected once by the main process and added
+        # to runs of worker processes
+        self._host_metadata = None
+        # number of failed worker processes, see --max-failures
+        self._nfailure = 0
+        self._argparser_defaults = (nsample, nwarmup, nprocess, nloop)
+
+    @property
+    def argparser(self):
+        if self._argparser is None:
+            self._argparser = self._create_argparser()
+        return self._argparser
+
+    def _create_argparser(self):
+        import argparse
+
+        nsample, nwarmup, nprocess, nloop = self._argparser_defaults
         parser = argparse.ArgumentParser(description='Benchmark')
         parser.add_argument('-p', '--processes', type=int, default=nprocess,
                             help='number of processes used to run benchmarks (default: %s)'
@@ -130,7 +368,69 @@ class TextRunner:
                                  "run variation. By default, worker processes "
                                  "are pinned to isolate CPUs if isolated CPUs "
                                  "are found.")
-        self.argparser = parser
+        parser.add_argument("--python", metavar="PATH", action='append',
+                            help="Python executable used to spawn worker "
+                                 "processes. Pass the option multiple times "
+                                 "to compare Python executables: worker "
+                                 "processes of the different executables "
+                                 "are interleaved in a random order and "
+                                 "one result per executable is produced "
+                                 "(default: %s)" % sys.executable)
+        parser.add_argument("--stop-early", action="store_true",
+                            help="Compare two --python executables using a "
+                                 "sequential test and stop spawning worker "
+                                 "processes as soon as the difference is "
+                                 "significant or smaller than --min-effect")
+        parser.add_argument("--min-effect", metavar="PERCENT", type=float,
+                            default=1.0,
+                            help="With --stop-early, difference in percent "
+                                 "below which executables are considered "
+                                 "equivalent (default: 1.0%%)")
+        parser.add_argument("--time-budget", metavar="SECONDS", type=float,
+                            help="Total time budget to run benchmarks. "
+                                 "After 3 runs per benchmark, runs are "
+                                 "allocated to benchmarks with the worst "
+                                 "precision compared to the cost of a run, "
+                                 "until the budget is spent. The number of "
+                                 "processes is ignored.")
+        parser.add_argument("--benchmark", metavar="NAME",
+                            help="Only run the benchmark NAME of a "
+                                 "benchmark suite")
+        parser.add_argument("--resume", action="store_true",
+                            help="Load runs of an interrupted session from "
+                                 "--json-file and only spawn missing runs")
+        parser.add_argument("--timeout", metavar="SECONDS", type=float,
+                            help="Kill a worker process if it takes longer "
+                                 "than SECONDS (default: no timeout)")
+        parser.add_argument("--retries", metavar="N", type=int, default=0,
+                            help="Number of times a failed worker process "
+                                 "is spawned again (default: 0)")
+        parser.add_argument("--retry-delay", metavar="SECONDS", type=float,
+                            default=1.0,
+                            help="Delay before spawning again a failed "
+                                 "worker process, doubled at each retry "
+                                 "(default: 1 sec)")
+        parser.add_argument("--max-failures", metavar="N", type=int,
+                            help="Give up if more than N worker processes "
+                                 "failed in total (default: no limit)")
+        parser.add_argument("--wait-quiet", metavar="THRESHOLD", type=float,
+                            help="Before spawning a worker process, wait "
+                                 "until the CPU usage of the system (or of "
+                                 "the CPUs of --affinity) is lower than "
+                                 "THRESHOLD percent, and flag runs where "
+                                 "other processes used more CPU than "
+                                 "THRESHOLD (Linux only)")
+        parser.add_argument("--latency", action="store_true",
+                            help="Time each call of bench_func() "
+                                 "individually and store the distribution "
+                                 "of call durations in a histogram, used "
+                                 "to compute percentiles")
+        # internal options of worker processes, hidden in --help
+        parser.add_argument("--pipe", metavar="FD", type=int,
+                            help=argparse.SUPPRESS)
+        parser.add_argument("--worker", action="store_true",
+                            help=argparse.SUPPRESS)
+        return parser
 
     def _calibrate_sample_func(self, sample_func):
         stream = self._stream()
@@ -169,6 +469,13 @@ class TextRunner:
         self.args = self.argparser.parse_args(args)
         if self.args.verbose:
             self.args.metadata = True
+        if self.args.stop_early and len(self.args.python or ()) != 2:
+            self.argparser.error("--stop-early requires two --python options")
+        if self.args.resume and not self.args.json_file:
+            self.argparser.error("--resume requires --json-file")
+        if self.args.stop_early and self.args.time_budget:
+            self.argparser.error("--stop-early and --time-budget options "
+                                 "are mutually exclusive")
 
     def _stream(self):
         return sys.stderr if self.args.json else sys.stdout
@@ -180,7 +487,7 @@ class TextRunner:
         for run in range(self.args.nsample):
             yield (False, run)
 
-    def _add(self, run_result, is_warmup, run, sample):
+    def _add(self, run_result, is_warmup, run, sample, name=None):
         if is_warmup:
             run_result.warmups.append(sample)
         else:
@@ -192,6 +499,8 @@ class TextRunner:
                 text = "Warmup %s: %s" % (1 + run, text)
             else:
                 text = "Sample %s: %s" % (1 + run, text)
+            if name is not None:
+                text = "[%s] %s" % (name, text)
             print(text, file=self._stream())
 
     def _display_run_result_avg(self, run_result):
@@ -200,18 +509,30 @@ class TextRunner:
         if self.args.metadata:
             perf._display_metadata(run_result.metadata, file=stream)
 
-        text = run_result.format(self.args.verbose)
-        nsample = perf._format_number(len(run_result.samples), 'sample')
-        text = "Average: %s (%s)" % (text, nsample)
-        print(text, file=self._stream())
+        # the output of a worker process is ignored by the parent process
+        # in non-verbose mode: don't import statistics to format it
+        if self.args.pipe is None or self.args.verbose:
+            text = run_result.format(self.args.verbose)
+            nsample = perf._format_number(len(run_result.samples), 'sample')
+            text = "Average: %s (%s)" % (text, nsample)
+            print(text, file=self._stream())
 
         stream.flush()
-        _json_dump(run_result, self.args)
+
+    def _dump_run_results(self, run_results, result):
+        # result is written as JSON if the result pipe is not used
+        if self.args.pipe is not None:
+            for run_result in run_results:
+                run_result._binary_dump_into_fd(self.args.pipe)
+            os.close(self.args.pipe)
+        else:
+            _json_dump(result, self.args)
 
     def _cpu_affinity(self):
         # sched_setaffinity() was added to Python 3.3
         has_sched_setaffinity = hasattr(os, 'sched_setaffinity')
         if not has_sched_setaffinity:
+            psutil = perf._import_psutil()
             if psutil is not None:
                 proc = psutil.Process()
                 psutil_has_cpu_affinity = hasattr(proc, 'cpu_affinity')
@@ -260,7 +581,34 @@ class TextRunner:
             sys.exit(1)
 
 
-    def _worker(self, sample_func):
+    def _collect_metadata(self, metadata):
+        # only import metadata submodule in worker processes
+        from perf import metadata as perf_metadata
+        if self.args.worker:
+            # host metadata are added by the main process
+            perf_metadata.collect_run_metadata(metadata)
+        else:
+            perf_metadata.collect_metadata(metadata)
+
+    def _get_host_metadata(self):
+        if self._host_metadata is None:
+            from perf import metadata as perf_metadata
+            self._host_metadata = {}
+            perf_metadata.collect_host_metadata(self._host_metadata)
+        return self._host_metadata
+
+    def _affinity_cpus(self):
+        # CPUs used by worker processes, None means all CPUs
+        if self.args.affinity:
+            return _parse_cpu_list(self.args.affinity)
+        return None
+
+    def _load_sampler(self):
+        from perf import _load
+        return _load.LoadSampler(self._affinity_cpus())
+
+    def _worker(self, sample_func, run_metadata_func=None, name=None,
+                latency=False):
         loops = self.args.loops
         if loops < 1:
             # FIXME: move this check in argument parsing
@@ -268,27 +616,91 @@ class TextRunner:
 
         run_result = perf.RunResult(loops=loops,
                                     inner_loops=self.inner_loops,
-                                    metadata=self.metadata)
+                                    metadata=self.metadata,
+                                    work=self.work,
+                                    work_unit=self.work_unit)
 
-        # only import metadata submodule in worker processes
-        from perf import metadata as perf_metadata
-        perf_metadata.collect_metadata(run_result.metadata)
+        self._collect_metadata(run_result.metadata)
 
+        if latency:
+            # durations of calls are recorded in a histogram: the memory
+            # doesn't depend on the number of calls
+            from perf import _sketch
+            run_result._sketch = _sketch.QuantileSketch()
+            run_result.metadata['latency'] = 'per call'
+
+        sampler = self._load_sampler()
+        sampler.start()
         for is_warmup, run in self._range():
-            dt = sample_func(loops)
+            if latency and not is_warmup:
+                dt = sample_func(loops, run_result._sketch.add)
+            else:
+                dt = sample_func(loops)
             dt = float(dt) / loops
             if self.inner_loops is not None:
                 dt /= self.inner_loops
             self._add(run_result, is_warmup, run, dt)
+        sampler.stop(run_result.metadata)
+
+        if run_metadata_func is not None:
+            run_metadata_func(run_result.metadata)
 
         self._display_run_result_avg(run_result)
+        self._dump_run_results([run_result], run_result)
 
-        result = perf.Benchmark(name=self.name)
+        if name is None:
+            name = self.name
+        result = perf.Benchmark(name=name)
         result.runs.append(run_result)
         return result
 
-    def _main(self, sample_func):
+    def _worker_interleaved(self, sample_funcs):
+        # Run all sample functions in the same process: samples of the
+        # different functions are interleaved, and the first function is
+        # rotated at each sample to not favor a function
+        loops = self.args.loops
+        if loops < 1:
+            raise ValueError("--loops must be >= 1")
+
+        metadata = dict(self.metadata)
+        self._collect_metadata(metadata)
+        run_results = [perf.RunResult(loops=loops,
+                                      inner_loops=self.inner_loops,
+                                      metadata=dict(metadata),
+                                      work=self.work,
+                                      work_unit=self.work_unit)
+                       for sample_func in sample_funcs]
+
+        nfunc = len(sample_funcs)
+        sampler = self._load_sampler()
+        sampler.start()
+        for offset, (is_warmup, run) in enumerate(self._range()):
+            for index in range(nfunc):
+                index = (offset + index) % nfunc
+                name, sample_func = sample_funcs[index]
+                dt = sample_func(loops)
+                dt = float(dt) / loops
+                if self.inner_loops is not None:
+                    dt /= self.inner_loops
+                self._add(run_results[index], is_warmup, run, dt, name)
+        for run_result in run_results:
+            sampler.stop(run_result.metadata)
+
+        suite = perf.BenchmarkSuite()
+        for (name, sample_func), run_result in zip(sample_funcs, run_results):
+            if self.args.pipe is None or self.args.verbose:
+                print("%s:" % name, file=self._stream())
+            self._display_run_result_avg(run_result)
+            bench = perf.Benchmark(name=name)
+            bench.runs.append(run_result)
+            suite.add_benchmark(bench)
+        self._dump_run_results(run_results, suite)
+        return suite
+
+    def _main(self, sample_func, run_metadata_func=None, latency=False):
         self.parse_args()
+        if self.args.latency and not latency:
+            self.argparser.error("--latency is only supported by bench_func()")
 
         self._cpu_affinity()
 
@@ -298,7 +710,8 @@ class TextRunner:
         if not self.args.raw:
             return self._spawn_workers()
         else:
-            return self._worker(sample_func)
+            return self._worker(sample_func, run_metadata_func,
+                                latency=latency)
 
     def bench_sample_func(self, sample_func, *args):
         """"Benchmark sample_func(loops, *args)
@@ -318,88 +731,730 @@ class TextRunner:
 
         return self._main(wrap_sample_func)
 
-    def bench_func(self, func, *args):
-        """"Benchmark func(*args)."""
+    def bench_sample_funcs(self, sample_funcs, interleave=False):
+        """"Benchmark a suite of sample functions.
 
-        def sample_func(loops):
-            # use fast local variables
-            local_timer = perf.perf_counter
-            local_func = func
-            local_args = args
+        sample_funcs is a list of (name, sample_func) tuples: see
+        bench_sample_func(). Return a perf.BenchmarkSuite.
 
-            if local_args:
-                if loops != 1:
-                    range_it = range(loops)
+        If interleave is true, each worker process runs all sample functions
+        with the same number of loops, and their samples are interleaved.
+        """
+        sample_funcs = list(sample_funcs)
+        names = [name for name, sample_func in sample_funcs]
+        if len(set(names)) != len(names):
+            raise ValueError("benchmark names must be unique")
 
-                    t0 = local_timer()
-                    for _ in range_it:
-                        local_func(*local_args)
-                    dt = local_timer() - t0
-                else:
-                    t0 = local_timer()
-                    local_func(*local_args)
-                    dt = local_timer() - t0
-            else:
-                # fast-path when func has no argument: avoid the expensive
-                # func(*args) argument unpacking
+        self.parse_args()
+        if self.args.latency:
+            self.argparser.error("--latency is only supported by bench_func()")
 
-                if loops != 1:
-                    range_it = range(loops)
+        self._cpu_affinity()
 
-                    t0 = local_timer()
-                    for _ in range_it:
-                        local_func()
-                    dt = local_timer() - t0
-                else:
-                    t0 = local_timer()
-                    local_func()
-                    dt = local_timer() - t0
+        if self.args.benchmark:
+            if self.args.benchmark not in names:
+                self.argparser.error("unknown benchmark: %s"
+                                     % self.args.benchmark)
+            sample_funcs = [(name, sample_func)
+                            for name, sample_func in sample_funcs
+                            if name == self.args.benchmark]
+
+        # interleaving a single function is pointless
+        interleave = (interleave and len(sample_funcs) > 1)
+
+        if self.args.raw:
+            if interleave:
+                return self._worker_interleaved(sample_funcs)
+            if len(sample_funcs) != 1:
+                self.argparser.error("--raw requires --benchmark")
+            name, sample_func = sample_funcs[0]
+            if self.args.loops == 0:
+                self.args.loops = self._calibrate_sample_func(sample_func)
+            bench = self._worker(sample_func, name=name)
+            return perf.BenchmarkSuite([bench])
+
+        benchmarks = []
+        for name, sample_func in sample_funcs:
+            loops = self.args.loops
+            if loops == 0:
+                loops = self._calibrate_sample_func(sample_func)
+            benchmarks.append((name, loops))
+
+        if interleave:
+            # use the number of loops of the slowest function, so no
+            # sample is longer than --max-time
+            loops = min(loops for name, loops in benchmarks)
+            benchmarks = [(name, loops) for name, _ in benchmarks]
+        tasks = self._create_tasks(benchmarks)
+        if interleave:
+            # one group of tasks per Python executable
+            npython = len(self.args.python or [None])
+            for index in range(npython):
+                group = tasks[index::npython]
+                for task in group:
+                    task.group = group
+        return self._spawn_workers(tasks)
+
+    def bench_sample_func_grid(self, sample_func, grid):
+        """"Benchmark sample_func(loops, **params) on a grid of parameters.
+
+        grid is a list of (name, values) tuples, or a dict. Each point of the
+        grid is a benchmark of the suite called "name(n=10)", or "n=10" if
+        the runner has no name. Return a perf.BenchmarkSuite.
+        """
+        import functools
+        import itertools
+
+        if isinstance(grid, dict):
+            grid = sorted(grid.items())
+        names = [name for name, values in grid]
+
+        sample_funcs = []
+        for values in itertools.product(*[values for name, values in grid]):
+            params = list(zip(names, values))
+            bench_name = perf._format_params(params)
+            if self.name:
+                bench_name = '%s(%s)' % (self.name, bench_name)
+            func = functools.partial(sample_func, **dict(params))
+            sample_funcs.append((bench_name, func))
+        return self.bench_sample_funcs(sample_funcs)
+
+    def bench_func_threads(self, func, threads=(1, 2, 4, 8),
+                           processes=False):
+        """"Benchmark func() called concurrently by N threads.
+
+        For each number of threads N of threads, the loops of a sample are
+        spread on N threads and the sample is the elapsed time divided by the
+        total number of calls. If processes is true, a pool of N processes
+        is used instead of threads: func must be picklable, and samples
+        include the time to pickle the tasks and dispatch them to the
+        processes of the pool.
+
+        Each number of threads is a benchmark of the suite called
+        "name(threads=4)" or "threads=4" ("processes=4" with processes).
+        The throughput and the scaling efficiency of each number of threads
+        are displayed. Return a perf.BenchmarkSuite.
+        """
+        if processes:
+            param = 'processes'
+            create_sample_func = _processes_sample_func
+        else:
+            param = 'threads'
+            create_sample_func = _threads_sample_func
+
+        sample_funcs = []
+        for nworker in threads:
+            if nworker < 1:
+                raise ValueError("number of %s must be >= 1" % param)
+            bench_name = perf._format_params([(param, nworker)])
+            if self.name:
+                bench_name = '%s(%s)' % (self.name, bench_name)
+            sample_funcs.append((bench_name,
+                                 create_sample_func(func, nworker)))
+
+        try:
+            suite = self.bench_sample_funcs(sample_funcs)
+        finally:
+            for bench_name, sample_func in sample_funcs:
+                close = getattr(sample_func, 'close', None)
+                if close is not None:
+                    close()
+        if not self.args.raw and len(self.args.python or [None]) == 1:
+            self._display_scaling(suite, param)
+        return suite
+
+    def _display_scaling(self, suite, param):
+        stream = self._stream()
+        points = []
+        for bench in suite.benchmarks:
+            if not bench.runs:
+                continue
+            nworker = int(dict(perf._parse_params(bench.name))[param])
+            points.append((nworker, bench._get_stats()['mean']))
+        if not points:
+            return
+        points.sort()
+
+        # efficiency relative to the smallest number of threads
+        base_nworker, base_mean = points[0]
+        print("Scaling:", file=stream)
+        for nworker, mean in points:
+            efficiency = (base_mean * base_nworker) / (mean * nworker)
+            print("%s=%s: %s, efficiency %.0f%%"
+                  % (param, nworker,
+                     perf._format_rate(perf._rate(1.0, mean), 'calls'),
+                     efficiency * 100),
+                  file=stream)
+        stream.flush()
 
+    def bench_func(self, func, *args, **kwargs):
+        """"Benchmark func(*args).
+
+        Keyword arguments: work is the work per call (number of bytes or
+        items) and work_unit its unit ('bytes' or 'items'), to display the
+        throughput instead of the time. They override the work and
+        work_unit attributes.
+        """
+        work = kwargs.pop('work', self.work)
+        work_unit = kwargs.pop('work_unit', self.work_unit)
+        if kwargs:
+            raise TypeError("unexpected keyword arguments: %s"
+                            % ', '.join(sorted(kwargs)))
+        if work is not None:
+            perf._check_work(work, work_unit)
+
+        old_work = (self.work, self.work_unit)
+        self.work = work
+        self.work_unit = work_unit
+        try:
+            return self._bench_func(func, args)
+        finally:
+            self.work, self.work_unit = old_work
+
+    def _bench_func(self, func, args):
+        self.parse_args()
+        if self.args.latency:
+            # each call is timed: unrolling is pointless
+            sample_func = _compile_bench_func(func, args, 1, latency=True)
+            return self._main(sample_func, latency=True)
+
+        sample_func = _compile_bench_func(func, args, self.unroll)
+        if self.unroll == 1:
+            return self._main(sample_func)
+
+        # each loop iteration calls func() unroll times
+        inner_loops = self.inner_loops
+        self.inner_loops = (inner_loops or 1) * self.unroll
+        try:
+            return self._main(sample_func)
+        finally:
+            self.inner_loops = inner_loops
+
+    def bench_command(self, args):
+        """"Benchmark the command args: time from process spawn to exit."""
+
+        args = list(args)
+        if not args:
+            raise ValueError("empty command")
+        self.metadata['command'] = ' '.join(args)
+
+        try:
+            import resource
+        except ImportError:
+            # resource is not available on Windows
+            resource = None
+
+        # number of spawned commands, including calibration
+        nspawn = [0]
+
+        def sample_func(loops):
+            subprocess = perf._import_subprocess()
+            # the output of the command must not be mixed with the output of
+            # the worker: the JSON result may be written into stdout
+            if hasattr(subprocess, 'DEVNULL'):
+                devnull = subprocess.DEVNULL
+                devnull_file = None
+            else:
+                # Python 2
+                devnull = devnull_file = open(os.devnull, 'wb')
+
+            # use fast local variables
+            local_timer = perf.perf_counter
+            local_popen = subprocess.Popen
+
+            try:
+                t0 = local_timer()
+                for _ in range(loops):
+                    proc = local_popen(args, stdout=devnull)
+                    exitcode = proc.wait()
+                    if exitcode:
+                        raise RuntimeError("%s failed with exit code %s"
+                                           % (args[0], exitcode))
+                dt = local_timer() - t0
+            finally:
+                if devnull_file is not None:
+                    devnull_file.close()
+            nspawn[0] += loops
             return dt
 
-        return self._main(sample_func)
+        def run_metadata_func(metadata):
+            if resource is None:
+                return
+            # Only children of the worker process are accounted
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            max_rss = usage.ru_maxrss
+            if sys.platform != 'darwin':
+                # ru_maxrss is in kilobytes on Linux and BSD
+                max_rss *= 1024
+            if max_rss:
+                metadata['command_max_rss'] = str(max_rss)
+            # average CPU time (user + system) of a single command
+            if not nspawn[0]:
+                return
+            cpu_time = (usage.ru_utime + usage.ru_stime) / nspawn[0]
+            metadata['command_cpu_time'] = perf._format_timedelta(cpu_time)
 
-    def _spawn_worker(self):
+        return self._main(sample_func, run_metadata_func)
+
+    def _spawn_worker(self, task):
+        # Return the list of run results of the tasks of the group
         args = []
         args.extend(self.program_args)
-        args.extend(('--raw', '--json',
-                     '--samples', str(self.args.nsample),
+        if task.python:
+            args[0] = task.python
+        args.extend(('--raw', '--worker'))
+        if _RESULT_PIPE:
+            result_pipe = os.pipe()
+            args.append('--pipe=%s' % result_pipe[1])
+        else:
+            result_pipe = None
+            args.append('--json')
+        args.extend(('--samples', str(self.args.nsample),
                      '--warmups', str(self.args.nwarmup),
-                     '--loops', str(self.args.loops)))
+                     '--loops', str(task.loops)))
+        if task.bench_name is not None and task.group is None:
+            args.append('--benchmark=%s' % task.bench_name)
         if self.args.verbose:
             args.append('-' + 'v' * self.args.verbose)
         if self.args.affinity:
             args.append('--affinity=%s' % self.args.affinity)
+        if self.args.latency:
+            args.append('--latency')
 
         if self.prepare_subprocess_args:
             self.prepare_subprocess_args(self, args)
 
-        return perf.RunResult.from_subprocess(args, stderr=subprocess.PIPE)
+        if self.args.wait_quiet is not None:
+            self._wait_quiet()
+
+        # in verbose mode, forward stderr of the worker
+        if self.args.verbose:
+            stderr_file = self._stream()
+        else:
+            stderr_file = None
+
+        kwargs = dict(timeout=self.args.timeout,
+                      stderr_file=stderr_file,
+                      result_pipe=result_pipe,
+                      stderr=perf._import_subprocess().PIPE)
+        start = perf.monotonic_clock()
+        if task.group is None:
+            runs = [perf.RunResult.from_subprocess(args, **kwargs)]
+        else:
+            runs = perf.RunResult._list_from_subprocess(args, len(task.group),
+                                                        **kwargs)
+        duration = perf.monotonic_clock() - start
+        for member in (task.group or [task]):
+            member.durations.append(duration)
+
+        host_metadata = self._get_host_metadata()
+        for run in runs:
+            for key, value in host_metadata.items():
+                run.metadata.setdefault(key, value)
+            if self.args.wait_quiet is not None:
+                self._flag_run_under_load(run)
+        return runs
+
+    def _wait_quiet(self):
+        from perf import _load
+        usage, elapsed = _load.wait_quiet(self.args.wait_quiet,
+                                          self._affinity_cpus(),
+                                          timeout=_WAIT_QUIET_TIMEOUT)
+        if usage is not None and usage >= self.args.wait_quiet:
+            stream = self._stream()
+            if self.args.verbose <= 1:
+                print(file=stream)
+            print("WARNING: the system is still busy after %s "
+                  "(CPU usage: %.1f%%)"
+                  % (perf._format_timedelta(elapsed), usage),
+                  file=stream)
+            stream.flush()
+        elif self.args.verbose and elapsed >= 1.0:
+            print("Waited %s for a quiet system"
+                  % perf._format_timedelta(elapsed),
+                  file=self._stream())
+
+    def _flag_run_under_load(self, run):
+        from perf import _load
+        usage = _load.get_cpu_usage_others(run.metadata)
+        if usage is not None and usage >= self.args.wait_quiet:
+            run.metadata['under_load'] = 'yes'
+
+    def _python_benchmark_name(self, name, python, index):
+        if name:
+            name = '%s (%s)' % (name, python)
+        else:
+            name = python
+        if self.args.python.index(python) != index:
+            # the same executable was passed twice
+            name = '%s #%s' % (name, 1 + index)
+        return name
+
+    def _create_tasks(self, benchmarks):
+        # benchmarks: list of (bench_name, loops) tuples, bench_name is None
+        # if the program only runs one benchmark
+        pythons = self.args.python or [None]
+        tasks = []
+        for bench_name, loops in benchmarks:
+            for index, python in enumerate(pythons):
+                if bench_name is not None:
+                    name = bench_name
+                else:
+                    name = self.name
+                if python:
+                    name = self._python_benchmark_name(name, python, index)
+                tasks.append(_WorkerTask(name, loops, python, bench_name))
+        return tasks
+
+    def _stop_early(self, tasks):
+        # tasks are ordered by benchmark, then by Python executable: pair
+        # the tasks of the two executables of each benchmark
+        pairs = list(zip(tasks[0::2], tasks[1::2]))
+        for ref_task, changed_task in pairs:
+            if ref_task.stop_reason is not None:
+                continue
+            stop_reason = self._sequential_test(ref_task, changed_task)
+            ref_task.stop_reason = stop_reason
+            changed_task.stop_reason = stop_reason
+
+        if any(ref_task.stop_reason is None for ref_task, _ in pairs):
+            return None
+        if len(pairs) == 1:
+            return "Stop early after %s" % pairs[0][0].stop_reason
+        lines = ["Stop early:"]
+        for ref_task, _ in pairs:
+            lines.append("- %s: after %s"
+                         % (ref_task.bench_name, ref_task.stop_reason))
+        return '\n'.join(lines)
+
+    def _sequential_test(self, ref_task, changed_task):
+        # Compare the mean of each run, runs are independent
+        ref_means = ref_task.run_means()
+        changed_means = changed_task.run_means()
+        nrun = min(len(ref_means), len(changed_means))
+        # need at least 3 runs per executable to estimate the variance
+        if nrun < 3:
+            return None
+        ref_means = ref_means[:nrun]
+        changed_means = changed_means[:nrun]
+
+        verdict, t_score = perf._sequential_test(ref_means, changed_means,
+                                                 self.args.processes,
+                                                 self.args.min_effect / 100.0)
+        if verdict is None:
+            return None
+
+        if verdict == 'significant':
+            text = "significant difference"
+        else:
+            text = ("difference smaller than %s%%"
+                    % self.args.min_effect)
+        if t_score is not None:
+            text = "%s (t=%.2f)" % (text, t_score)
+        return "%s: %s" % (perf._format_number(nrun, 'run'), text)
+
+    def _is_suite(self, tasks):
+        return (tasks[0].bench_name is not None or bool(self.args.python))
+
+    def _create_result(self, tasks):
+        benchmarks = [task.bench for task in tasks]
+        if self._is_suite(tasks):
+            return perf.BenchmarkSuite(benchmarks)
+        else:
+            return benchmarks[0]
+
+    def _load_checkpoint(self, tasks):
+        # --resume: load runs of the previous session from --json-file
+        filename = self.args.json_file
+        if not os.path.exists(filename):
+            return
+        with open(filename) as fp:
+            suite = perf.BenchmarkSuite.json_load_from(fp)
+
+        is_suite = self._is_suite(tasks)
+        for task in tasks:
+            if is_suite:
+                try:
+                    bench = suite.get_benchmark(task.bench.name)
+                except KeyError:
+                    continue
+            else:
+                if len(suite.benchmarks) != 1:
+                    _resume_error("%s is a benchmark suite" % filename)
+                bench = suite.benchmarks[0]
+            if not bench.runs:
+                continue
+
+            run = bench.runs[0]
+            if (len(run.samples) != self.args.nsample
+               or len(run.warmups) != self.args.nwarmup):
+                _resume_error("%s: the number of samples or warmups "
+                              "is different" % task.bench.name)
+
+            # keep the number of loops of the previous session
+            if run.loops is not None:
+                task.loops = run.loops
+            task.bench.runs.extend(bench.runs)
+            task.bench.failed_runs.extend(bench.failed_runs)
+            task.resumed = True
+
+        if self.args.verbose:
+            for task in tasks:
+                nrun = len(task.bench.runs)
+                if nrun:
+                    print("Resume %s: %s"
+                          % (task.bench.name or filename,
+                             perf._format_number(nrun, 'run')),
+                          file=self._stream())
+
+    def _check_resumed_run(self, task, run):
+        metadata = task.bench.get_metadata()
+        for key in _RESUME_METADATA:
+            if key not in metadata:
+                continue
+            old_value = metadata[key]
+            new_value = run.metadata.get(key)
+            if new_value != old_value:
+                _resume_error("%s: incompatible metadata %s: %r != %r"
+                              % (task.bench.name or self.args.json_file,
+                                 key, old_value, new_value))
+        task.resumed = False
+
+    def _spawn_worker_retry(self, task, tasks):
+        # Return the run results of the worker process, or None if the run
+        # still failed after --retries retries: the failure is recorded and
+        # the next run is spawned
+        stream = self._stream()
+        attempt = 0
+        while True:
+            try:
+                return self._spawn_worker(task)
+            except perf._WorkerError as exc:
+                task.bench.failed_runs.append(exc._failed_run())
+                self._nfailure += 1
+                if self.args.json_file:
+                    _json_dump(self._create_result(tasks), self.args,
+                               atomic=True)
+
+                max_failures = self.args.max_failures
+                if max_failures is not None and self._nfailure > max_failures:
+                    raise _GiveUp("give up after %s: %s"
+                                  % (perf._format_number(self._nfailure,
+                                                         'failed run'),
+                                     exc))
+                if attempt >= self.args.retries:
+                    if self.args.verbose <= 1:
+                        print(file=stream)
+                    print("WARNING: %s; skip the run" % exc, file=stream)
+                    stream.flush()
+                    return None
+
+                # exponential backoff
+                delay = self.args.retry_delay * 2 ** attempt
+                attempt += 1
+                if self.args.verbose <= 1:
+                    print(file=stream)
+                print("WARNING: %s; retry %s/%s in %s"
+                      % (exc, attempt, self.args.retries,
+                         perf._format_timedelta(delay)),
+                      file=stream)
+                stream.flush()
+                time.sleep(delay)
+
+    def _spawn_task(self, task, tasks, nprocess=None):
+        stream = self._stream()
+        # a worker process runs all tasks of the group
+        members = task.group or [task]
+        runs = self._spawn_worker_retry(members[0], tasks)
+        if runs is None:
+            # the run failed
+            return
+        for member, run in zip(members, runs):
+            if member.resumed:
+                self._check_resumed_run(member, run)
+            member.bench.runs.append(run)
+        if self.args.json_file:
+            # checkpoint: write completed runs
+            _json_dump(self._create_result(tasks), self.args, atomic=True)
+
+        if self.args.verbose > 1:
+            for member, run in zip(members, runs):
+                text = perf._very_verbose_run(run)
+                if len(tasks) > 1:
+                    text = '[%s] %s' % (member.bench.name, text)
+                nrun = len(member.bench.runs)
+                if nprocess:
+                    print("Run %s/%s: %s" % (nrun, nprocess, text),
+                          file=stream)
+                else:
+                    print("Run %s: %s" % (nrun, text), file=stream)
+        else:
+            print(".", end='', file=stream)
+            stream.flush()
+
+    def _spawn_round(self, tasks, nprocess):
+        # Interleave worker processes of the different tasks in a random
+        # order, so slow changes of the system state (CPU temperature, other
+        # processes, etc.) are spread on all tasks.
+        # Skip tasks which already have enough runs (--resume).
+        # Only spawn the first task of a group: it runs all tasks of the group.
+        # Skip groups where --stop-early reached a verdict for all tasks.
+        order = [task for task in tasks
+                 if len(task.bench.runs) < nprocess
+                 and (task.group is None or task is task.group[0])
+                 and any(member.stop_reason is None
+                         for member in (task.group or [task]))]
+        if len(order) > 1:
+            import random
+            random.shuffle(order)
+
+        for task in order:
+            self._spawn_task(task, tasks, nprocess)
+
+    def _select_task(self, tasks, remaining):
+        # Select the task where one more run reduces the most the squared
+        # relative standard error per second of run
+        best_task = None
+        best_score = 0.0
+        statistics = perf._import_statistics()
+        for task in tasks:
+            if not task.durations:
+                # cost unknown: no worker process completed
+                continue
+            cost = statistics.mean(task.durations)
+            if cost > remaining:
+                # not enough time left for this task
+                continue
+            precision = task.precision()
+            if precision is None:
+                continue
+            nrun = len(task.bench.runs)
+            score = precision ** 2 / (nrun + 1) / max(cost, 1e-9)
+            if score > best_score:
+                best_task = task
+                best_score = score
+        return best_task
+
+    def _spawn_workers_time_budget(self, tasks):
+        budget = self.args.time_budget
+        start = perf.monotonic_clock()
+
+        # always spawn 3 rounds to estimate the cost and variance of tasks
+        for process in range(_TIME_BUDGET_MIN_RUNS):
+            self._spawn_round(tasks, _TIME_BUDGET_MIN_RUNS)
+        # runs loaded by --resume have no duration: spawn one worker
+        # process to measure the cost of the task
+        for task in tasks:
+            if not task.durations:
+                self._spawn_task(task, tasks)
+
+        while True:
+            remaining = budget - (perf.monotonic_clock() - start)
+            task = self._select_task(tasks, remaining)
+            if task is None:
+                break
+            self._spawn_task(task, tasks)
 
-    def _spawn_workers(self):
+        return perf.monotonic_clock() - start
+
+    def _display_precision(self, tasks, elapsed):
+        stream = self._stream()
+        print("Time budget: %s, elapsed: %s"
+              % (perf._format_timedelta(self.args.time_budget),
+                 perf._format_timedelta(elapsed)),
+              file=stream)
+        print("Precision (95% confidence interval of the mean):",
+              file=stream)
+        for task in tasks:
+            nrun = len(task.bench.runs)
+            precision = task.precision()
+            if precision is not None:
+                precision *= perf._tdist95conf_level(nrun - 1)
+                text = '+- %.1f%%' % (precision * 100)
+                # store the achieved precision in the result
+                for run in task.bench.runs:
+                    run.metadata['precision'] = text
+            else:
+                text = 'unknown'
+            print("- %s: %s (%s)"
+                  % (task.bench.name or '<benchmark>', text,
+                     perf._format_number(nrun, 'run')),
+                  file=stream)
+        print(file=stream)
+
+    def _spawn_workers(self, tasks=None):
         verbose = self.args.verbose
         stream = self._stream()
         nprocess = self.args.processes
-        bench = perf.Benchmark(name=self.name)
 
-        for process in range(nprocess):
-            run = self._spawn_worker()
-            bench.runs.append(run)
-            if verbose > 1:
-                text = perf._very_verbose_run(run)
-                print("Run %s/%s: %s" % (1 + process, nprocess, text), file=stream)
+        if tasks is None:
+            tasks = self._create_tasks([(None, self.args.loops)])
+        ntask = len(tasks)
+        stop_reason = None
+        elapsed = None
+        self._nfailure = 0
+
+        if self.args.resume:
+            self._load_checkpoint(tasks)
+
+        give_up = None
+        try:
+            if self.args.time_budget:
+                elapsed = self._spawn_workers_time_budget(tasks)
             else:
-                print(".", end='', file=stream)
-                stream.flush()
+                for process in range(nprocess):
+                    self._spawn_round(tasks, nprocess)
+
+                    if self.args.stop_early:
+                        stop_reason = self._stop_early(tasks)
+                        if stop_reason:
+                            break
+        except _GiveUp as exc:
+            # --max-failures: still emit the runs completed so far
+            give_up = exc
+            stop_reason = "ERROR: %s" % exc
 
         if verbose <= 1:
             print(file=stream)
+        if stop_reason:
+            print(stop_reason, file=stream)
+            print(file=stream)
+        if elapsed is not None:
+            self._display_precision(tasks, elapsed)
+        if self.args.wait_quiet is not None:
+            nloaded = sum(1 for task in tasks for run in task.bench.runs
+                          if run.metadata.get('under_load') == 'yes')
+            if nloaded:
+                print("WARNING: %s executed under load (CPU usage of other "
+                      "processes >= %s%%)"
+                      % (perf._format_number(nloaded, 'run'),
+                         self.args.wait_quiet),
+                      file=stream)
+                print(file=stream)
+
+        benchmarks = [task.bench for task in tasks]
+        for bench in benchmarks:
+            if ntask > 1:
+                print("%s:" % bench.name, file=stream)
+
+            if not bench.runs:
+                print("ERROR: all runs failed", file=stream)
+                if give_up is None and bench.failed_runs:
+                    give_up = RuntimeError("all runs failed: %s"
+                                           % bench.failed_runs[-1]['error'])
+            else:
+                if self.args.metadata:
+                    perf._display_metadata(bench.get_metadata(), file=stream)
 
-        if self.args.metadata:
-            perf._display_metadata(bench.get_metadata(), file=stream)
+                perf._display_benchmark_avg(bench, verbose=verbose,
+                                            file=stream)
 
-        perf._display_benchmark_avg(bench, verbose=verbose, file=stream)
+            if ntask > 1:
+                print(file=stream)
 
         stream.flush()
-        _json_dump(bench, self.args)
-        return bench
+        result = self._create_result(tasks)
+        _json_dump(result, self.args, atomic=True)
+        if give_up is not None:
+            raise give_up
+        return result
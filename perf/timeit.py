@@ -1,6 +1,5 @@
 from __future__ import absolute_import, print_function
 import itertools
-import subprocess
 import sys
 import timeit
 
@@ -30,16 +29,55 @@ def _main_common():
     parser = runner.argparser
     parser.add_argument('-s', '--setup', action='append', default=[],
                         help='setup statements')
-    parser.add_argument('stmt', nargs='+',
+    parser.add_argument('--stmt', metavar='NAME=STMT', action='append',
+                        dest='named_stmt', default=[],
+                        help='benchmark the statement STMT called NAME. '
+                             'Pass the option multiple times to run '
+                             'statements interleaved in each worker process')
+    parser.add_argument('--param', metavar='NAME=VALUES', action='append',
+                        default=[],
+                        help='run the benchmark for each value of the '
+                             'comma separated list of VALUES, the variable '
+                             'NAME is set before the setup statements. '
+                             'Pass the option multiple times to run all '
+                             'combinations of values')
+    parser.add_argument('stmt', nargs='*',
                         help='executed statements')
 
     runner.parse_args()
 
+    if bool(runner.args.stmt) == bool(runner.args.named_stmt):
+        parser.error("either pass stmt or --stmt options")
+
+    named_stmts = []
+    for arg in runner.args.named_stmt:
+        name, sep, stmt = arg.partition('=')
+        if not sep or not name:
+            parser.error("invalid --stmt %r: expected NAME=STMT" % arg)
+        if name in [name2 for name2, stmt2 in named_stmts]:
+            parser.error("duplicated --stmt name: %s" % name)
+        named_stmts.append((name, _format_stmt([stmt])[0]))
+    runner.args.named_stmt = named_stmts
+
+    grid = []
+    for arg in runner.args.param:
+        name, sep, values = arg.partition('=')
+        if not sep or not name or not values:
+            parser.error("invalid --param %r: expected NAME=VALUES" % arg)
+        grid.append((name, values.split(',')))
+
     runner.args.setup = _format_stmt(runner.args.setup)
-    runner.args.stmt = _format_stmt(runner.args.stmt)
+    if named_stmts:
+        stmts = ['%s=%s' % item for item in named_stmts]
+    else:
+        runner.args.stmt = _format_stmt(runner.args.stmt)
+        stmts = runner.args.stmt
 
     runner.metadata['timeit_setup'] = ' '.join(repr(stmt) for stmt in runner.args.setup)
-    runner.metadata['timeit_stmt'] = ' '.join(repr(stmt) for stmt in runner.args.stmt)
+    runner.metadata['timeit_stmt'] = ' '.join(repr(stmt) for stmt in stmts)
+    if grid:
+        runner.metadata['timeit_params'] = ' '.join(repr(param)
+                                                    for param in runner.args.param)
 
     # Include the current directory, so that local imports work (sys.path
     # contains the directory of this script, rather than the current
@@ -47,9 +85,16 @@ def _main_common():
     import os
     sys.path.insert(0, os.curdir)
 
-    stmt = "\n".join(runner.args.stmt)
     setup = "\n".join(runner.args.setup)
+    if grid:
+        # loops are calibrated by bench_sample_funcs()
+        return (runner, _grid_timers(runner, grid, named_stmts))
+    if named_stmts:
+        timers = [(name, timeit.Timer(stmt, setup, perf.perf_counter))
+                  for name, stmt in named_stmts]
+        return (runner, timers)
 
+    stmt = "\n".join(runner.args.stmt)
     timer = timeit.Timer(stmt, setup, perf.perf_counter)
     if runner.args.loops == 0:
         try:
@@ -61,23 +106,82 @@ def _main_common():
     return (runner, timer)
 
 
+def _grid_timers(runner, grid, named_stmts):
+    # Create a timer per statement per point of the parameter grid
+    if named_stmts:
+        stmts = named_stmts
+    else:
+        stmts = [(None, "\n".join(runner.args.stmt))]
+
+    names = [name for name, values in grid]
+    timers = []
+    for values in itertools.product(*[values for name, values in grid]):
+        params = list(zip(names, values))
+        setup = ['%s = %s' % param for param in params]
+        setup = "\n".join(setup + runner.args.setup)
+        for stmt_name, stmt in stmts:
+            name = perf._format_params(params)
+            if stmt_name:
+                name = '%s(%s)' % (stmt_name, name)
+            timers.append((name, timeit.Timer(stmt, setup, perf.perf_counter)))
+    return timers
+
+
 def _prepare_args(runner, args):
     for setup in runner.args.setup:
         args.extend(("--setup", setup))
+    for param in runner.args.param:
+        args.append("--param=%s" % param)
+    for name, stmt in runner.args.named_stmt:
+        args.append("--stmt=%s=%s" % (name, stmt))
     args.extend(runner.args.stmt)
 
 
+def _sample_func(timer):
+    def func(loops):
+        it = itertools.repeat(None, loops)
+        return timer.inner(it, timer.timer)
+    return func
+
+
+def _bench_suite(runner, timers, interleave):
+    # timer of the running statement, used to display the traceback
+    running = [None]
+
+    def create_sample_func(timer):
+        func = _sample_func(timer)
+
+        def sample_func(loops):
+            running[0] = timer
+            return func(loops)
+        return sample_func
+
+    sample_funcs = [(name, create_sample_func(timer))
+                    for name, timer in timers]
+    try:
+        runner.bench_sample_funcs(sample_funcs, interleave=interleave)
+    except SystemExit:
+        raise
+    except:
+        if running[0] is None:
+            raise
+        running[0].print_exc()
+        sys.exit(1)
+
+
 def _main():
     runner, timer  = _main_common()
     runner.program_args = (sys.executable, '-m', 'perf.timeit')
     runner.prepare_subprocess_args = _prepare_args
 
-    def func(loops, timer):
-        it = itertools.repeat(None, loops)
-        return timer.inner(it, timer.timer)
+    if runner.args.named_stmt or runner.args.param:
+        # timer is a list of (name, timer) tuples. Points of a parameter
+        # grid need their own number of loops: don't interleave them.
+        _bench_suite(runner, timer, not runner.args.param)
+        return
 
     try:
-        runner.bench_sample_func(func, timer)
+        runner.bench_sample_func(_sample_func(timer))
     except SystemExit:
         raise
     except:
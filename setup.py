@@ -56,7 +56,7 @@ def main():
         'author': 'Victor Stinner',
         'author_email': 'victor.stinner@gmail.com',
         'classifiers': CLASSIFIERS,
-        'packages': ['perf', 'perf.tests'],
+        'packages': ['perf', 'perf.benchmarks', 'perf.tests'],
         'install_requires': ["statistics; python_version < '3.4'"],
         # optional dependencies:
         # 'psutil'